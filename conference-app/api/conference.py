@@ -20,38 +20,60 @@ from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
 import settings
 from models import ConflictException
 from models import StringMessage
-from models import BooleanMessage
+from models import WebsafeKeysForm
 from models.profile import Profile
 from models.profile import ProfileMiniForm
 from models.profile import ProfileForm
 from models.profile import TeeShirtSize
+from models.profile import TeeShirtSizeCountForms
 from models.conference import Conference
+from models.conference import ConferenceSeats
 from models.conference import ConferenceForm
 from models.conference import ConferenceForms
+from models.conference import ConferenceResultForm
+from models.conference import ConferenceResultForms
+from models.conference import ConferenceFacetForms
+from models.capacity import CapacitySummaryForm
 from models.conference import ConferenceQueryForm
 from models.conference import ConferenceQueryForms
-
+from models.registration import GroupRegistrationForm
+from models.registration import GroupRegistrationResultForm
+from models.waitlist import RegistrationForm
+from services import announcement
+from services import capacity
+from services import facets
+from services import decode_websafe_key
+from services import decode_websafe_keys
+from services import idempotent
+from services import rate_limited
+from services import swag
+from services import waitlist
+from services.etag import bump_generation
+from services.etag import check_etag
+from services.etag import conference_generation
+from services.etag import profile_generation
+from services.etag import request_etag
+
+from tools.index_advisor import record_query_shape
 from utils import getUserId
 
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
-                    'are nearly sold out: %s')
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS = {
     "city": "Default City",
     "maxAttendees": 0,
-    "seatsAvailable": 0,
     "topics": [ "Default", "Topic" ],
 }
 
+# Fields organizers can update (seats available follow maxAttendees)
+UPDATABLE_FIELDS = ('name', 'description', 'topics', 'city',
+                    'startDate', 'endDate', 'maxAttendees')
+
 OPERATORS = {
             'EQ':   '=',
             'GT':   '>',
@@ -71,6 +93,29 @@ FIELDS =    {
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
+    idempotencyKey=messages.StringField(2),
+)
+
+CONF_CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    etag=messages.StringField(2),
+)
+
+PROFILE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    etag=messages.StringField(1),
+)
+
+CONF_GROUP_POST_REQUEST = endpoints.ResourceContainer(
+    GroupRegistrationForm,
+    websafeConferenceKey=messages.StringField(1),
+    idempotencyKey=messages.StringField(2),
+)
+
+CONF_CREATE_REQUEST = endpoints.ResourceContainer(
+    ConferenceForm,
+    idempotencyKey=messages.StringField(1),
 )
 
 CONF_POST_REQUEST = endpoints.ResourceContainer(
@@ -89,26 +134,16 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+    def _copyConferenceToForm(self, conf, displayName, seats=None):
+        """Copy relevant fields from Conference (and ConferenceSeats) to
+        ConferenceForm."""
+        return conf.to_form(displayName, seats)
 
 
     def _createConferenceObject(self, request):
         """Create or update Conference object, returning ConferenceForm/request."""
+        from services import notifications
+        from services import search
         # preload necessary data items
         user = endpoints.get_current_user()
         if not user:
@@ -119,9 +154,14 @@ class ConferenceApi(remote.Service):
             raise endpoints.BadRequestException("Conference 'name' field required")
 
         # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
+        data = {field.name: getattr(request, field.name) for field in ConferenceForm.all_fields()}
         del data['websafeKey']
         del data['organizerDisplayName']
+        del data['etag']
+        del data['version']
+        del data['seatsAvailable']
+        del data['waitlistCount']
+        del data['notModified']
 
         # add default values for those missing (both data model & outbound Message)
         for df in DEFAULTS:
@@ -138,9 +178,6 @@ class ConferenceApi(remote.Service):
         if data['endDate']:
             data['endDate'] = datetime.strptime(data['endDate'][:10], "%Y-%m-%d").date()
 
-        # set seatsAvailable to be same as maxAttendees on creation
-        if data["maxAttendees"] > 0:
-            data["seatsAvailable"] = data["maxAttendees"]
         # generate Profile Key based on user ID and Conference
         # ID based on Profile key get Conference key from ID
         p_key = ndb.Key(Profile, user_id)
@@ -151,25 +188,27 @@ class ConferenceApi(remote.Service):
 
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-            'conferenceInfo': repr(request)},
-            url='/tasks/send_confirmation_email'
-        )
-        return request
+        conf = Conference(**data)
+        # all seats available on creation
+        seats = ConferenceSeats.for_conference(conf)
+        ndb.put_multi([conf, seats])
+        if announcement.is_nearly_sold_out(seats):
+            announcement.update_nearly_sold_out(conf, seats)
+        notifications.enqueue_confirmation_email(c_key)
+        search.schedule_indexing(c_key)
+        facets.update_facets(set(), facets.conference_facets(conf))
+        capacity.update_capacity({}, conf, seats)
+        return self._copyConferenceToForm(conf, None, seats)
 
 
-    @ndb.transactional()
     def _updateConferenceObject(self, request):
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
-
-        # update existing conference
+        # check and prepare the update outside of a transaction, so the
+        # transaction only has to re-read the conference and write it
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
         # check that conference exists
         if not conf:
@@ -182,25 +221,97 @@ class ConferenceApi(remote.Service):
                 'Only the owner can update the conference.')
 
         # Not getting all the fields, so don't create a new object; just
-        # copy relevant fields from ConferenceForm to Conference object
-        for field in request.all_fields():
-            data = getattr(request, field.name)
+        # collect relevant fields from ConferenceForm
+        changes = {}
+        for field in UPDATABLE_FIELDS:
+            data = getattr(request, field)
             # only copy fields where we get data
             if data not in (None, []):
                 # special handling for dates (convert string to Date)
-                if field.name in ('startDate', 'endDate'):
+                if field in ('startDate', 'endDate'):
                     data = datetime.strptime(data, "%Y-%m-%d").date()
-                    if field.name == 'startDate':
-                        conf.month = data.month
-                # write to Conference object
-                setattr(conf, field.name, data)
-        conf.put()
+                    if field == 'startDate':
+                        changes['month'] = data.month
+                changes[field] = data
+
+        seats = ConferenceSeats.get_for_conference(conf)
+        conf, seats, nearly_sold_out, old_facets, old_capacity = \
+            self._applyConferenceChanges(conf.key, changes, request.version, seats)
+        facets.update_facets(old_facets, facets.conference_facets(conf))
+        capacity.update_capacity(old_capacity, conf, seats)
+        if nearly_sold_out or announcement.is_nearly_sold_out(seats):
+            announcement.update_nearly_sold_out(conf, seats)
         prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'), seats)
+
+
+    @ndb.transactional(xg=True)
+    def _applyConferenceChanges(self, c_key, changes, version=None, seats=None):
+        """Apply changes to the details of a conference.
+
+        Only the conference is read and written in the transaction, so it
+        does not conflict with registrations, which write its
+        ConferenceSeats instead. A capacity change reads and updates the
+        seats too, in the same (cross-group) transaction. Only a client
+        sending the version it read can get a conflict, if the details
+        changed since.
+
+        Args:
+            seats (ConferenceSeats): Seats of the conference, as read
+                before the transaction (used unless the capacity changes)
+
+        Returns:
+            Tuple (updated Conference, its ConferenceSeats, whether it was
+            nearly sold out, facets and capacity counts it had)
+
+        Raises:
+            ConflictException
+        """
+        from services import search
+        conf = c_key.get()
+        if version is not None and version != conf.version:
+            raise ConflictException(
+                'The conference was updated since version %d, '
+                'reload it and try again.' % version)
+
+        # skip the write if nothing changes
+        changes = {field: data for field, data in changes.items()
+                   if getattr(conf, field) != data}
+
+        # seats follow capacity changes
+        if 'maxAttendees' in changes or seats is None:
+            seats = ConferenceSeats.get_for_conference(conf)
+        nearly_sold_out = announcement.is_nearly_sold_out(seats)
+        old_facets = facets.conference_facets(conf)
+        old_capacity = capacity.capacity_counts(conf, seats)
+        if not changes:
+            return conf, seats, nearly_sold_out, old_facets, old_capacity
+
+        if 'maxAttendees' in changes:
+            attendees = (seats.maxAttendees or 0) - (seats.seatsAvailable or 0)
+            if changes['maxAttendees'] < attendees:
+                raise ConflictException(
+                    'There are already %d attendees.' % attendees)
+            seats.seatsAvailable = changes['maxAttendees'] - attendees
+            if changes['maxAttendees'] > (seats.maxAttendees or 0) and waitlist.has_waitlist(seats):
+                waitlist.schedule_promotion(conf.key)
+            seats.maxAttendees = changes['maxAttendees']
+            seats.put()
+
+        # reindex for search if searchable details change
+        if set(changes) & set(['name', 'description', 'topics']):
+            search.schedule_indexing(conf.key)
+
+        conf.populate(**changes)
+        conf.version += 1
+        conf.put()
+        return conf, seats, nearly_sold_out, old_facets, old_capacity
 
 
-    @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
+    @endpoints.method(CONF_CREATE_REQUEST, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
+    @idempotent(ConferenceForm)
+    @rate_limited(10)
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
@@ -209,24 +320,75 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_POST_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='PUT', name='updateConference')
+    @rate_limited(30)
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
-        return self._updateConferenceObject(request)
+        from services.agenda import AgendaService
+        cf = self._updateConferenceObject(request)
+        bump_generation(conference_generation(cf.websafeKey))
+        AgendaService.schedule_rebuild(ndb.Key(urlsafe=cf.websafeKey))
+        return cf
 
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @endpoints.method(CONF_CONDITIONAL_GET_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
+        wsck = request.websafeConferenceKey
+        c_key = decode_websafe_key(wsck, "Conference")
+        if not c_key:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        # bail if the client has the current version (conference and
+        # organizer name) before reading anything from the datastore
+        etag, not_modified = check_etag(request_etag(self, request),
+            conference_generation(wsck), profile_generation(c_key.parent().id()))
+        if not_modified:
+            return ConferenceForm(etag=etag, notModified=True)
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, prof, seats = ndb.get_multi(
+            [c_key, c_key.parent(), ConferenceSeats.key_for(c_key)])
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
+                'No conference found with key: %s' % wsck)
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        cf = self._copyConferenceToForm(conf, getattr(prof, 'displayName'),
+            seats or ConferenceSeats.for_conference(conf))
+        cf.etag = etag
+        return cf
+
+
+    @endpoints.method(WebsafeKeysForm, ConferenceResultForms,
+            path='conferences/byKeys',
+            http_method='POST', name='getConferencesByKeys')
+    def getConferencesByKeys(self, request):
+        """Return conferences given their keys, in the same order; keys
+        of conferences that do not exist are marked as not found."""
+        c_keys = decode_websafe_keys(request.websafeKeys, "Conference")
+
+        # get conferences, their seats and organizers (parents) in a
+        # single batch
+        unique_keys = list(set(key for key in c_keys if key))
+        s_keys = [ConferenceSeats.key_for(key) for key in unique_keys]
+        p_keys = list(set(key.parent() for key in unique_keys))
+        entities = ndb.get_multi(unique_keys + s_keys + p_keys)
+        confs = dict(zip(unique_keys, entities[:len(unique_keys)]))
+        seats = dict(zip(unique_keys, entities[len(unique_keys):len(unique_keys) * 2]))
+        names = {prof.key: prof.displayName
+            for prof in entities[len(unique_keys) * 2:] if prof}
+
+        # return one result per requested key
+        items = []
+        for wsck, c_key in zip(request.websafeKeys, c_keys):
+            conf = confs.get(c_key)
+            result = ConferenceResultForm(websafeKey=wsck, found=bool(conf))
+            if conf:
+                result.conference = self._copyConferenceToForm(
+                    conf, names.get(c_key.parent()),
+                    seats[c_key] or ConferenceSeats.for_conference(conf))
+            items.append(result)
+        return ConferenceResultForms(items=items)
 
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -241,11 +403,13 @@ class ConferenceApi(remote.Service):
         user_id = getUserId(user)
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
+        confs = Conference.query(ancestor=ndb.Key(Profile, user_id)).fetch()
         prof = ndb.Key(Profile, user_id).get()
+        seats = ConferenceSeats.get_for_conferences(confs)
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName')) for conf in confs]
+            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName'), s)
+                   for conf, s in zip(confs, seats)]
         )
 
 
@@ -261,6 +425,11 @@ class ConferenceApi(remote.Service):
             q = q.order(ndb.GenericProperty(inequality_filter))
             q = q.order(Conference.name)
 
+        record_query_shape('Conference',
+            equality=[f["field"] for f in filters if f["operator"] == "="],
+            inequality=inequality_filter,
+            orders=[inequality_filter, 'name'] if inequality_filter else ['name'])
+
         for filtr in filters:
             if filtr["field"] in ["month", "maxAttendees"]:
                 filtr["value"] = int(filtr["value"])
@@ -301,9 +470,11 @@ class ConferenceApi(remote.Service):
             path='queryConferences',
             http_method='POST',
             name='queryConferences')
+    @rate_limited(60, total_requests=3000)
     def queryConferences(self, request):
         """Query for conferences."""
-        conferences = self._getQuery(request)
+        conferences = self._getQuery(request).fetch()
+        seats = ConferenceSeats.get_for_conferences(conferences)
 
         # need to fetch organiser displayName from profiles
         # get all keys and use get_multi for speed
@@ -317,8 +488,8 @@ class ConferenceApi(remote.Service):
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId]) for conf in \
-                conferences]
+                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId], s)
+                for conf, s in zip(conferences, seats)]
         )
 
 
@@ -326,17 +497,7 @@ class ConferenceApi(remote.Service):
 
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        return prof.to_form()
 
 
     def _getProfileFromUser(self):
@@ -370,6 +531,7 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            old_size = prof.teeShirtSize
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -380,50 +542,58 @@ class ConferenceApi(remote.Service):
                         #else:
                         #    setattr(prof, field, val)
                         prof.put()
+            # move the user's t-shirt in the conferences' tallies
+            swag.change_size(prof, old_size)
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
 
 
-    @endpoints.method(message_types.VoidMessage, ProfileForm,
+    @endpoints.method(PROFILE_GET_REQUEST, ProfileForm,
             path='profile', http_method='GET', name='getProfile')
     def getProfile(self, request):
         """Return user profile."""
-        return self._doProfile()
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        etag, not_modified = check_etag(request_etag(self, request),
+            profile_generation(getUserId(user)))
+        if not_modified:
+            return ProfileForm(etag=etag, notModified=True)
+        pf = self._doProfile()
+        pf.etag = etag
+        return pf
 
 
     @endpoints.method(ProfileMiniForm, ProfileForm,
             path='profile', http_method='POST', name='saveProfile')
     def saveProfile(self, request):
         """Update & return user profile."""
-        return self._doProfile(request)
+        pf = self._doProfile(request)
+        bump_generation(profile_generation(getUserId(endpoints.get_current_user())))
+        return pf
 
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
+    @endpoints.method(message_types.VoidMessage, ConferenceFacetForms,
+            path='conferences/facets',
+            http_method='GET', name='getConferenceFacets')
+    def getConferenceFacets(self, request):
+        """Return the number of conferences per city, topic and month, and
+        per pair of them."""
+        return facets.get_facets()
+
+
+    @endpoints.method(message_types.VoidMessage, CapacitySummaryForm,
+            path='conferences/capacity',
+            http_method='GET', name='getCapacitySummary')
+    def getCapacitySummary(self, request):
+        """Return seats and registrations per city and month, and the
+        conferences with the highest fill rate."""
+        if not endpoints.get_current_user():
+            raise endpoints.UnauthorizedException('Authorization required')
+        return capacity.get_summary()
 
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
@@ -431,17 +601,14 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        return StringMessage(data=announcement.get_announcement())
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
-        """Register or unregister user for selected conference."""
-        retval = None
-        prof = self._getProfileFromUser() # get user Profile
-
+        """Register or unregister user for selected conference, and update
+        the capacity analytics and t-shirt tally once committed."""
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
         wsck = request.websafeConferenceKey
@@ -450,6 +617,36 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
 
+        form, seats, prof, registered = self._applyRegistration(conf, reg)
+        if registered:
+            capacity.add_registrations(conf, seats, registered)
+            swag.add_registrations(conf.key.urlsafe(), [prof.teeShirtSize], registered)
+        return form
+
+
+    @ndb.transactional(xg=True)
+    def _applyRegistration(self, conf, reg=True):
+        """Register or unregister user for selected conference.
+
+        If the conference is sold out, or users are already waiting for
+        seats, the user joins the waitlist instead. Unregistering from a
+        conference frees a seat for the waitlist; unregistering when on
+        the waitlist leaves it. Only the seats of the conference (see
+        ConferenceSeats) are read and written, not the conference.
+
+        Returns:
+            Tuple (RegistrationForm, updated ConferenceSeats, user Profile,
+            users registered: 1, -1 if unregistered, or 0)
+        """
+        retval = None
+        position = None
+        registered = 0
+        prof = self._getProfileFromUser() # get user Profile
+        wsck = conf.key.urlsafe()
+        seats = ConferenceSeats.get_for_conference(conf)
+
+        nearly_sold_out = announcement.is_nearly_sold_out(seats)
+
         # register
         if reg:
             # check if user already registered otherwise add
@@ -457,32 +654,48 @@ class ConferenceApi(remote.Service):
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
+            # no seats avail, or seats kept for users waiting: join waitlist
+            if seats.seatsAvailable <= 0 or waitlist.has_waitlist(seats):
+                position = waitlist.join_waitlist(seats, prof.key.id())
+                if seats.seatsAvailable > 0:
+                    waitlist.schedule_promotion(conf.key)
+                retval = False
 
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+            else:
+                prof.conferenceKeysToAttend.append(wsck)
+                seats.seatsAvailable -= 1
+                registered = 1
+                retval = True
 
         # unregister
         else:
             # check if user already registered
             if wsck in prof.conferenceKeysToAttend:
 
-                # unregister user, add back one seat
+                # unregister user, add back one seat (for the waitlist)
                 prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
+                seats.seatsAvailable += 1
+                registered = -1
+                if waitlist.has_waitlist(seats):
+                    waitlist.schedule_promotion(conf.key)
                 retval = True
             else:
-                retval = False
+                # leave the waitlist, if on it
+                retval = waitlist.leave_waitlist(seats, prof.key.id())
 
         # write things back to the datastore & return
         prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+        seats.put()
+        ndb.get_context().call_on_commit(lambda: bump_generation(
+            conference_generation(wsck), profile_generation(prof.key.id())))
+
+        # update announcement once committed, if seats crossed the threshold
+        if nearly_sold_out != announcement.is_nearly_sold_out(seats):
+            ndb.get_context().call_on_commit(
+                lambda: announcement.update_nearly_sold_out(conf, seats))
+        return (RegistrationForm(data=retval, waitlistPosition=position),
+                seats, prof, registered)
 
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -493,6 +706,7 @@ class ConferenceApi(remote.Service):
         prof = self._getProfileFromUser() # get user Profile
         conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
         conferences = ndb.get_multi(conf_keys)
+        seats = ConferenceSeats.get_for_conferences(conferences)
 
         # get organizers
         organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
@@ -504,27 +718,83 @@ class ConferenceApi(remote.Service):
             names[profile.key.id()] = profile.displayName
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])\
-         for conf in conferences]
+        return ConferenceForms(items=[self._copyConferenceToForm(conf, names[conf.organizerUserId], s)\
+         for conf, s in zip(conferences, seats)]
         )
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @endpoints.method(CONF_GET_REQUEST, RegistrationForm,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
+    @idempotent(RegistrationForm)
+    @rate_limited(20)
     def registerForConference(self, request):
         """Register user for selected conference."""
         return self._conferenceRegistration(request)
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @endpoints.method(CONF_GET_REQUEST, RegistrationForm,
             path='conference/{websafeConferenceKey}',
             http_method='DELETE', name='unregisterFromConference')
+    @rate_limited(20)
     def unregisterFromConference(self, request):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
 
 
+    @endpoints.method(CONF_GET_REQUEST, TeeShirtSizeCountForms,
+            path='conference/{websafeConferenceKey}/teeShirts',
+            http_method='GET', name='getTeeShirtSizes')
+    def getTeeShirtSizes(self, request):
+        """Return the t-shirt sizes of the attendees of selected conference;
+        open only to the organizer."""
+        self._getOwnConference(request.websafeConferenceKey)
+        return swag.get_tee_shirt_sizes(request.websafeConferenceKey)
+
+
+    @endpoints.method(CONF_GET_REQUEST, StringMessage,
+            path='conference/{websafeConferenceKey}/teeShirts',
+            http_method='POST', name='tallyTeeShirtSizes')
+    @rate_limited(5)
+    def tallyTeeShirtSizes(self, request):
+        """Count the t-shirt sizes of the attendees of selected conference
+        from scratch, in a background job; open only to the organizer."""
+        from services import mapper
+        self._getOwnConference(request.websafeConferenceKey)
+        job = mapper.start_mapper("tally_tee_shirts",
+            params={'websafeConferenceKey': request.websafeConferenceKey})
+        return StringMessage(data=job.summary())
+
+
+    def _getOwnConference(self, websafeConferenceKey):
+        """Return a conference organized by the current user."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        c_key = decode_websafe_key(websafeConferenceKey, "Conference")
+        conf = c_key.get() if c_key else None
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % websafeConferenceKey)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the t-shirt sizes.')
+        return conf
+
+
+    @endpoints.method(CONF_GROUP_POST_REQUEST, GroupRegistrationResultForm,
+            path='conference/{websafeConferenceKey}/group',
+            http_method='POST', name='registerGroupForConference')
+    @idempotent(GroupRegistrationResultForm)
+    @rate_limited(5)
+    def registerGroupForConference(self, request):
+        """Register a group of people (by email) for selected conference;
+        open only to the organizer."""
+        from services.registration import RegistrationService
+        return RegistrationService().register_group(
+            request.websafeConferenceKey, request.emails)
+
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='filterPlayground',
             http_method='GET', name='filterPlayground')
@@ -539,7 +809,9 @@ class ConferenceApi(remote.Service):
         q = q.filter(Conference.city=="London")
         q = q.filter(Conference.topics=="Medical Innovations")
         q = q.filter(Conference.month==6)
+        confs = q.fetch()
 
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") for conf in q]
+            items=[self._copyConferenceToForm(conf, "", s)
+                   for conf, s in zip(confs, ConferenceSeats.get_for_conferences(confs))]
         )
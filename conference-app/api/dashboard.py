@@ -0,0 +1,30 @@
+import endpoints
+from protorpc import message_types
+from protorpc import remote
+
+import settings
+from models.dashboard import DashboardForm
+
+
+#------ API methods ------------------------------------------------------------
+
+@endpoints.api(name = "dashboard", version = "v1",
+    allowed_client_ids = settings.ALLOWED_CLIENT_IDS, 
+    audiences = settings.AUDIENCES,
+    scopes = settings.SCOPES)
+class DashboardApi(remote.Service):
+    """Dashboard API v0.1"""
+
+    def __init__(self):
+        from services.dashboard import DashboardService
+        self.dashboard_service = DashboardService()
+
+    @endpoints.method(message_types.VoidMessage, DashboardForm,
+            path = "dashboard",
+            http_method = "GET",
+            name = "getDashboard")
+    def get_dashboard(self, request):
+        """Get the current user's profile, conferences to attend and
+        created, sessions in wishlist and announcement in a single call.
+        """
+        return self.dashboard_service.get_dashboard()
@@ -0,0 +1,55 @@
+import endpoints
+from protorpc import messages
+from protorpc import message_types
+from protorpc import remote
+
+import settings
+from models.search import SearchKind
+from models.search import SearchOperator
+from models.search import SearchResultForms
+from services import rate_limited
+
+
+#------ Request objects -------------------------------------------------------
+
+# Request for searching conferences and sessions by keywords.
+# Attributes:
+#     query: Keywords
+#     kind: CONFERENCE or SESSION (optional, default: both)
+#     operator: AND (default) or OR
+#     pageToken: Token returned with the previous page (optional)
+#     pageSize: Results per page (optional)
+SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query = messages.StringField(1, required = True),
+    kind = messages.EnumField(SearchKind, 2),
+    operator = messages.EnumField(SearchOperator, 3),
+    pageToken = messages.StringField(4),
+    pageSize = messages.IntegerField(5, variant = messages.Variant.INT32),
+)
+
+
+#------ API methods ------------------------------------------------------------
+
+@endpoints.api(name = "search", version = "v1",
+    allowed_client_ids = settings.ALLOWED_CLIENT_IDS, 
+    audiences = settings.AUDIENCES,
+    scopes = settings.SCOPES)
+class SearchApi(remote.Service):
+    """Search API v0.1"""
+
+    def __init__(self):
+        from services.search import SearchService
+        self.search_service = SearchService()
+
+    @endpoints.method(SEARCH_REQUEST, SearchResultForms,
+        path = "search",
+        http_method = "GET",
+        name = "search")
+    @rate_limited(60)
+    def search(self, request):
+        """Search conferences and sessions by keywords."""
+        return self.search_service.search(request.query, request.kind,
+            request.operator, request.pageToken, request.pageSize)
+
+#-------------------------------------------------------------------------------
@@ -7,8 +7,15 @@ from protorpc import remote
 
 import settings
 from models import QueryForms
+from models import WebsafeKeysForm
+from models.agenda import AgendaForm
 from models.session import SessionForm
 from models.session import SessionForms
+from models.session import SessionResultForms
+from services import idempotent
+from services import rate_limited
+from services.agenda import AgendaService
+from services.etag import request_etag
 from services.session import SessionService
 
 
@@ -18,12 +25,14 @@ from services.session import SessionService
 # Attributes:
 #     SessionForm: Session inbound form
 #     websafeConferenceKey: Conference key (URL-safe)
+#     idempotencyKey: Key to detect retries of the request (optional)
 SESSION_POST_REQUEST = endpoints.ResourceContainer(
     SessionForm,
     websafeConferenceKey = messages.StringField(1),
+    idempotencyKey = messages.StringField(2),
 )
 
-# Request for getting all sessions in a conference.
+# Request for getting the agenda of a conference.
 # Attributes:
 #     websafeConferenceKey: Conference key (URL-safe)
 SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
@@ -31,6 +40,16 @@ SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey = messages.StringField(1, required = True),
 )
 
+# Request for getting all sessions in a conference.
+# Attributes:
+#     websafeConferenceKey: Conference key (URL-safe)
+#     etag: etag of the sessions the client has (optional)
+SESSIONS_CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey = messages.StringField(1, required = True),
+    etag = messages.StringField(2),
+)
+
 # Request for getting all sessions of a given type in a conference.
 # Attributes:
 #     websafeConferenceKey: Conference key (URL-safe)
@@ -61,24 +80,50 @@ class SessionApi(remote.Service):
 
     def __init__(self):
         self.session_service = SessionService()
+        self.agenda_service = AgendaService()
 
     @endpoints.method(SESSION_POST_REQUEST, SessionForm,
             path='conference/{websafeConferenceKey}/session',
             http_method='POST',
             name='createSession')
+    @idempotent(SessionForm)
+    @rate_limited(30)
     def create_session(self, request):
         """Create new session. Open only to the organizer of the conference."""
         return self.session_service.create_session(
             request.websafeConferenceKey,
             request)
 
-    @endpoints.method(SESSIONS_GET_REQUEST, SessionForms,
+    @endpoints.method(SESSIONS_CONDITIONAL_GET_REQUEST, SessionForms,
             path='conference/{websafeConferenceKey}/sessions',
             http_method='GET',
             name='getConferenceSessions')
     def get_conference_sessions(self, request):
         """Given a conference, return all sessions."""
         return self.session_service.get_conference_sessions(
+            request.websafeConferenceKey,
+            request_etag(self, request))
+
+    @endpoints.method(WebsafeKeysForm, SessionResultForms,
+            path='conference/sessions/byKeys',
+            http_method='POST',
+            name='getSessionsByKeys')
+    def get_sessions_by_keys(self, request):
+        """Given a list of session keys, return the sessions (with speaker
+        names); sessions that do not exist are marked as not found.
+        """
+        return self.session_service.get_sessions_by_keys(
+            request.websafeKeys)
+
+    @endpoints.method(SESSIONS_GET_REQUEST, AgendaForm,
+            path='conference/{websafeConferenceKey}/agenda',
+            http_method='GET',
+            name='getConferenceAgenda')
+    def get_conference_agenda(self, request):
+        """Given a conference, return its agenda: sessions grouped by date
+        and start time, with speaker names.
+        """
+        return self.agenda_service.get_agenda(
             request.websafeConferenceKey)
 
     @endpoints.method(SESSIONS_BY_TYPE_GET_REQUEST, SessionForms,
@@ -108,6 +153,7 @@ class SessionApi(remote.Service):
             path='conference/sessions/query',
             http_method='POST',
             name='querySessions')
+    @rate_limited(60, total_requests = 3000)
     def query_sessions(self, request):
         """(Experimental) Query for sessions."""
         return self.session_service.query_sessions(
@@ -14,6 +14,8 @@ from models.speaker import SpeakerForm
 from models.speaker import SpeakerForms
 from models.session import Session
 from models.session import SessionForms
+from services import rate_limited
+from services.etag import request_etag
 from services.speaker import SpeakerService
 
 
@@ -22,6 +24,7 @@ from services.speaker import SpeakerService
 SPEAKERS_BY_CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey = messages.StringField(1, required = True),
+    etag = messages.StringField(2),
 )
 
 SESSIONS_BY_CONF_AND_SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
@@ -47,6 +50,7 @@ class SpeakerApi(remote.Service):
             path = "speaker",
             http_method = "POST",
             name = "createSpeaker")
+    @rate_limited(10)
     def create_speaker(self, request):
         """Create new speaker."""
         return self.speaker_service.create_speaker(request)
@@ -66,7 +70,8 @@ class SpeakerApi(remote.Service):
     def get_conference_speakers(self, request):
         """Given a conference, get the list of all speakers."""
         return self.speaker_service.get_conference_speakers(
-            request.websafeConferenceKey)
+            request.websafeConferenceKey,
+            request_etag(self, request))
 
     @endpoints.method(SESSIONS_BY_CONF_AND_SPEAKER_GET_REQUEST, SessionForms,
             path = "speaker/{websafeSpeakerKey}/conference/{websafeConferenceKey}",
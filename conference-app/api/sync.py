@@ -0,0 +1,41 @@
+import endpoints
+from protorpc import messages
+from protorpc import message_types
+from protorpc import remote
+
+import settings
+from models.sync import ChangesForm
+from services import rate_limited
+
+
+#------ Request objects -------------------------------------------------------
+
+CHANGES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    token = messages.StringField(1),
+)
+
+
+#------ API methods ------------------------------------------------------------
+
+@endpoints.api(name = "sync", version = "v1",
+    allowed_client_ids = settings.ALLOWED_CLIENT_IDS, 
+    audiences = settings.AUDIENCES,
+    scopes = settings.SCOPES)
+class SyncApi(remote.Service):
+    """Sync API v0.1"""
+
+    def __init__(self):
+        from services.sync import SyncService
+        self.sync_service = SyncService()
+
+    @endpoints.method(CHANGES_GET_REQUEST, ChangesForm,
+            path = "changes",
+            http_method = "GET",
+            name = "getChangesSince")
+    @rate_limited(60)
+    def get_changes_since(self, request):
+        """Return conferences, sessions and speakers changed or deleted
+        since the given token, and a new token for the next sync.
+        """
+        return self.sync_service.get_changes_since(request.token)
@@ -5,7 +5,11 @@ from protorpc import remote
 
 import settings
 from models.session import SessionForms
+from models.wishlist import SessionConflictForms
+from models.wishlist import SessionPopularityForms
 from models.wishlist import WishlistForm
+from services import idempotent
+from services import rate_limited
 from services.wishlist import WishlistService
 
 
@@ -14,9 +18,29 @@ from services.wishlist import WishlistService
 # Request for adding a session to or removing a session from the user's wishlist.
 # Attributes:
 #     websafeSessionKey: Session key (URL-safe)
+#     idempotencyKey: Key to detect retries of the request (optional)
 WISHLIST_POST_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    websafeSessionKey = messages.StringField(1, required = True)
+    websafeSessionKey = messages.StringField(1, required = True),
+    idempotencyKey = messages.StringField(2),
+)
+
+
+# Request for getting the sessions in the user's wishlist.
+# Attributes:
+#     hydrate: Include speaker and conference names (optional)
+WISHLIST_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    hydrate = messages.BooleanField(1),
+)
+
+
+# Request for getting the most wished sessions of a conference.
+# Attributes:
+#     websafeConferenceKey: Conference key (URL-safe)
+MOST_WISHED_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey = messages.StringField(1, required = True),
 )
 
 
@@ -36,6 +60,8 @@ class WishlistApi(remote.Service):
         path = "wishlist/{websafeSessionKey}",
         http_method = "POST",
         name = "addSessionToWishlist")
+    @idempotent(WishlistForm)
+    @rate_limited(60)
     def add_session_to_wishlist(self, request):
         """Add a session to the user's wishlist."""
         return self.wishlist_service.add_session_to_wishlist(
@@ -45,17 +71,38 @@ class WishlistApi(remote.Service):
         path = "wishlist/{websafeSessionKey}",
         http_method = "DELETE",
         name = "deleteSessionInWishlist")
+    @rate_limited(60)
     def delete_session_in_wishlist(self, request):
         """Remove a session from the user's wishlist."""
         return self.wishlist_service.delete_session_in_wishlist(
             request.websafeSessionKey)
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @endpoints.method(WISHLIST_GET_REQUEST, SessionForms,
         path = "wishlist",
         http_method = "GET",
         name = "getSessionsInWishlist")
     def get_sessions_in_wishlist(self, request):
-        """Get list of sessions in users's wishlist."""
-        return self.wishlist_service.get_sessions_in_wishlist()
+        """Get list of sessions in users's wishlist (with speaker and
+        conference names if hydrate is set)."""
+        return self.wishlist_service.get_sessions_in_wishlist(
+            bool(request.hydrate))
+
+    @endpoints.method(message_types.VoidMessage, SessionConflictForms,
+        path = "wishlist/conflicts",
+        http_method = "GET",
+        name = "getWishlistConflicts")
+    def get_wishlist_conflicts(self, request):
+        """Get the pairs of sessions in the user's wishlist that overlap."""
+        return self.wishlist_service.get_wishlist_conflicts()
+
+    @endpoints.method(MOST_WISHED_GET_REQUEST, SessionPopularityForms,
+        path = "wishlist/mostWished/{websafeConferenceKey}",
+        http_method = "GET",
+        name = "getMostWishedSessions")
+    def get_most_wished_sessions(self, request):
+        """Get the sessions of a conference that are in most wishlists
+        (organizer only)."""
+        return self.wishlist_service.get_most_wished_sessions(
+            request.websafeConferenceKey)
 
 #-------------------------------------------------------------------------------
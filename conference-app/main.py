@@ -12,45 +12,211 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import importlib
+import json
+import os
+
 import webapp2
-from google.appengine.api import app_identity
-from google.appengine.api import mail
-from api.conference import ConferenceApi
-from api.speaker import SpeakerApi
 
+# Handlers import what they need when they run, so instances started for
+# tasks and cron jobs do not load the API classes (and their messages).
 
-class SendConfirmationEmailHandler(webapp2.RequestHandler):
-    def post(self):
-        """Send email confirming Conference creation."""
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created a following '         # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-        )
+# Modules loaded by the warmup handler: the API, and the services its
+# methods import when first called
+WARMUP_MODULES = ('server', 'services.agenda', 'services.dashboard',
+                  'services.notifications', 'services.registration',
+                  'services.search', 'services.sync')
+
+
+class SendConfirmationEmailsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Send a batch of emails confirming Conference creation."""
+        from services import notifications
+        notifications.send_confirmation_emails()
+        self.response.set_status(204)
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
-        ConferenceApi._cacheAnnouncement()
+        from services import announcement
+        announcement.cache_announcement()
+        self.response.set_status(204)
+
+
+class PurgeTombstonesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete tombstones no longer needed by sync clients."""
+        from services.sync import SyncService
+        SyncService.purge_tombstones()
+        self.response.set_status(204)
+
+
+class PurgeIdempotentResultsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete expired responses of requests with idempotency keys."""
+        from services import idempotency
+        idempotency.purge_results()
+        self.response.set_status(204)
+
+
+class SweepWishlistsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start a job removing deleted sessions from wishlists."""
+        from services import mapper
+        mapper.start_mapper("sweep_wishlists")
+        self.response.set_status(204)
+
+
+class ReconcileCapacityHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start a job correcting the capacity analytics counters."""
+        from services import mapper
+        mapper.start_mapper("reconcile_capacity")
         self.response.set_status(204)
 
 
 class SetFeatureSpeakerHandler(webapp2.RequestHandler):
     def post(self):
         """Set featured speaker announcement in Memcache."""
+        from services.speaker import SpeakerService
         speaker_key = self.request.get("websafeSpeakerKey")
         conference_key = self.request.get("websafeConferenceKey")
-        SpeakerApi._cache_featured_speaker(speaker_key, conference_key)
+        SpeakerService._cache_featured_speaker(speaker_key, conference_key)
         self.response.set_status(204)
 
 
+class RebuildAgendaHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild conference agenda."""
+        from google.appengine.ext import ndb
+        from services.agenda import AgendaService
+        conference_key = ndb.Key(urlsafe=self.request.get("websafeConferenceKey"))
+        AgendaService.build_agenda(conference_key)
+        self.response.set_status(204)
+
+
+class PromoteWaitlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Register users waiting for seats at a conference."""
+        from google.appengine.ext import ndb
+        from services import waitlist
+        conference_key = ndb.Key(urlsafe=self.request.get("websafeConferenceKey"))
+        waitlist.promote_waitlist(conference_key,
+            retries=int(self.request.get("retries") or 0))
+        self.response.set_status(204)
+
+
+class SettleGroupRegistrationHandler(webapp2.RequestHandler):
+    def post(self):
+        """Give back the seats of a group registration left unsettled."""
+        from google.appengine.ext import ndb
+        from services import registration
+        registration.settle_group_registration(
+            ndb.Key(urlsafe=self.request.get("websafeKey")))
+        self.response.set_status(204)
+
+
+class IndexDocumentHandler(webapp2.RequestHandler):
+    def post(self):
+        """Update the search index of a conference or session."""
+        from google.appengine.ext import ndb
+        from services import search
+        search.index_key(ndb.Key(urlsafe=self.request.get("websafeKey")))
+        self.response.set_status(204)
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Load the API and prime caches before the instance gets traffic."""
+        from google.appengine.ext import ndb
+        from services import announcement
+        from services.speaker import SpeakerService
+
+        for module in WARMUP_MODULES:
+            importlib.import_module(module)
+
+        # Announcement and featured speaker (memcache and in-process)
+        confs = announcement.get_nearly_sold_out()
+        SpeakerService().get_featured_speaker()
+
+        # Hot conferences (nearly sold out) and their organizers
+        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in confs]
+        ndb.get_multi(conf_keys + [key.parent() for key in conf_keys])
+        self.response.set_status(204)
+
+
+class IndexAdvisorHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report the indexes needed by the queries run so far."""
+        from models.conference import Conference
+        from models.session import Session
+        from tools import index_advisor
+        current = index_advisor.load_index_yaml(
+            os.path.join(os.path.dirname(__file__), 'index.yaml'))
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write(index_advisor.report(
+            index_advisor.get_recorded_shapes(),
+            [Conference, Session],
+            current))
+
+
+class RunMapperHandler(webapp2.RequestHandler):
+    def post(self):
+        """Process the next batch of a mapper job."""
+        from google.appengine.ext import ndb
+        from services import mapper
+        job_key = ndb.Key(urlsafe=self.request.get('jobKey'))
+        mapper.run_batch(job_key, int(self.request.get('batch')))
+        self.response.set_status(204)
+
+
+class MappersHandler(webapp2.RequestHandler):
+    def get(self):
+        """List available mappers and recent jobs."""
+        from models.mapper import MapperJob
+        from services import mapper
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write('Mappers: %s\n\n' % ', '.join(sorted(mapper.MAPPERS)))
+        for job in MapperJob.query().order(-MapperJob.created).fetch(20):
+            self.response.write(job.summary() + '\n')
+
+    def post(self):
+        """Start a mapper job, or abort one (if jobKey is given)."""
+        from google.appengine.ext import ndb
+        from services import mapper
+        self.response.headers['Content-Type'] = 'text/plain'
+        if self.request.get('jobKey'):
+            job = mapper.abort_mapper(ndb.Key(urlsafe=self.request.get('jobKey')))
+        else:
+            name = self.request.get('name')
+            if name not in mapper.MAPPERS:
+                self.response.set_status(400)
+                self.response.write('Unknown mapper: %s\n' % name)
+                return
+            job = mapper.start_mapper(
+                name,
+                params=json.loads(self.request.get('params') or '{}'),
+                dry_run=self.request.get('dry_run') in ('1', 'true'),
+                batch_size=int(self.request.get('batch_size') or 0) or None,
+                countdown=int(self.request.get('countdown') or 0) or None)
+        self.response.write(job.summary() + '\n')
+
+
 app = webapp2.WSGIApplication([
-    ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_confirmation_emails', SendConfirmationEmailsHandler),
+    ('/crons/purge_tombstones', PurgeTombstonesHandler),
+    ('/crons/purge_idempotent_results', PurgeIdempotentResultsHandler),
+    ('/crons/sweep_wishlists', SweepWishlistsHandler),
+    ('/crons/reconcile_capacity', ReconcileCapacityHandler),
     ('/tasks/set_feature_speaker', SetFeatureSpeakerHandler),
+    ('/tasks/rebuild_agenda', RebuildAgendaHandler),
+    ('/tasks/promote_waitlist', PromoteWaitlistHandler),
+    ('/tasks/settle_group_registration', SettleGroupRegistrationHandler),
+    ('/tasks/index_document', IndexDocumentHandler),
+    ('/tasks/run_mapper', RunMapperHandler),
+    ('/admin/index_advisor', IndexAdvisorHandler),
+    ('/admin/mappers', MappersHandler),
 ], debug=True)
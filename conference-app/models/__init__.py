@@ -1,6 +1,7 @@
 """Basic App Engine data & ProtoRPC models."""
 
 import httplib
+import json
 import endpoints
 import operator
 
@@ -14,6 +15,19 @@ class ConflictException(endpoints.ServiceException):
     """ConflictException -- exception mapped to HTTP 409 response"""
     http_status = httplib.CONFLICT
 
+class TooManyRequestsException(endpoints.ServiceException):
+    """TooManyRequestsException -- exception mapped to HTTP 503 response
+
+    Endpoints turns 429 responses into 404, so rate limited requests get a
+    503, with a JSON message: {"reason": "rateLimited", "retryAfter": seconds}
+    """
+    http_status = httplib.SERVICE_UNAVAILABLE
+
+    def __init__(self, retry_after):
+        super(TooManyRequestsException, self).__init__(json.dumps(
+            {"reason": "rateLimited", "retryAfter": retry_after}))
+        self.retry_after = retry_after
+
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     data = messages.StringField(1, required=True)
@@ -22,6 +36,10 @@ class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
 
+class WebsafeKeysForm(messages.Message):
+    """WebsafeKeysForm -- inbound list of URL-safe keys message"""
+    websafeKeys = messages.StringField(1, repeated=True)
+
 
 #------ Queries ---------------------------------------------------------------
 
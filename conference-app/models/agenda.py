@@ -0,0 +1,61 @@
+"""Conference agenda App Engine data & ProtoRPC models."""
+
+from protorpc import messages
+from protorpc import protojson
+from google.appengine.ext import ndb
+
+from models.session import SessionType
+
+
+#------ Model objects ---------------------------------------------------------
+
+# ID of the agenda entity (there is only one, as a child of the conference)
+AGENDA_ID = "agenda"
+
+class Agenda(ndb.Model):
+    """Agenda -- Denormalized agenda of a conference
+
+    Stores the whole AgendaForm, so that it can be served with a single get.
+    """
+    data = ndb.BlobProperty(compressed = True) # AgendaForm encoded as JSON
+    updated = ndb.DateTimeProperty(auto_now = True, indexed = False)
+
+    def to_form(self):
+        """Convert Agenda to AgendaForm."""
+        return protojson.decode_message(AgendaForm, self.data)
+
+    @staticmethod
+    def to_object(form, conference_key):
+        """Convert AgendaForm to Agenda."""
+        return Agenda(
+            key = ndb.Key(Agenda, AGENDA_ID, parent = conference_key),
+            data = protojson.encode_message(form))
+
+class AgendaSessionForm(messages.Message):
+    """AgendaSessionForm -- Session in agenda outbound form message"""
+    websafeKey = messages.StringField(1)
+    name = messages.StringField(2)
+    typeOfSession = messages.EnumField(SessionType, 3)
+    location = messages.StringField(4)
+    duration = messages.IntegerField(5, variant = messages.Variant.INT32) # in minutes
+    websafeSpeakerKey = messages.StringField(6)
+    speakerName = messages.StringField(7)
+
+class AgendaSlotForm(messages.Message):
+    """AgendaSlotForm -- Sessions starting at the same time"""
+    startTime = messages.StringField(1)
+    sessions = messages.MessageField(AgendaSessionForm, 2, repeated = True)
+
+class AgendaDayForm(messages.Message):
+    """AgendaDayForm -- Sessions on the same date, by start time"""
+    date = messages.StringField(1)
+    slots = messages.MessageField(AgendaSlotForm, 2, repeated = True)
+
+class AgendaForm(messages.Message):
+    """AgendaForm -- Conference agenda outbound form message"""
+    websafeConferenceKey = messages.StringField(1)
+    name = messages.StringField(2)
+    days = messages.MessageField(AgendaDayForm, 3, repeated = True)
+    unscheduled = messages.MessageField(AgendaSessionForm, 4, repeated = True)
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,29 @@
+"""Capacity analytics ProtoRPC models."""
+
+from protorpc import messages
+
+
+class CapacityForm(messages.Message):
+    """CapacityForm -- Seats and registrations of the conferences in a
+    city or month"""
+    value           = messages.StringField(1)
+    conferences     = messages.IntegerField(2)
+    seats           = messages.IntegerField(3)
+    registered      = messages.IntegerField(4)
+    fillRate        = messages.FloatField(5)
+
+class ConferenceFillForm(messages.Message):
+    """ConferenceFillForm -- Conference in the fill rate leaderboard"""
+    websafeKey      = messages.StringField(1)
+    name            = messages.StringField(2)
+    registered      = messages.IntegerField(3)
+    maxAttendees    = messages.IntegerField(4)
+    fillRate        = messages.FloatField(5)
+
+class CapacitySummaryForm(messages.Message):
+    """CapacitySummaryForm -- Capacity utilization per city and month, and
+    the conferences with the highest fill rate"""
+    total           = messages.MessageField(CapacityForm, 1)
+    byCity          = messages.MessageField(CapacityForm, 2, repeated=True)
+    byMonth         = messages.MessageField(CapacityForm, 3, repeated=True)
+    topConferences  = messages.MessageField(ConferenceFillForm, 4, repeated=True)
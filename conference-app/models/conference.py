@@ -4,11 +4,18 @@ from protorpc import messages
 
 from google.appengine.ext import ndb
 
+from models.tombstone import ModifiedProperty
+from models.tombstone import record_deletion
+
 
 class Conference(ndb.Model):
-    """Conference -- Conference object"""
+    """Conference -- Conference object
+
+    Its seats are kept in a separate ConferenceSeats entity, so that
+    registrations and edits of the details do not write the same entity.
+    """
     name            = ndb.StringProperty(required=True)
-    description     = ndb.StringProperty()
+    description     = ndb.StringProperty(indexed=False)
     organizerUserId = ndb.StringProperty()
     topics          = ndb.StringProperty(repeated=True)
     city            = ndb.StringProperty()
@@ -16,7 +23,90 @@ class Conference(ndb.Model):
     month           = ndb.IntegerProperty() # TODO: do we need for indexing like Java?
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
+    modified        = ModifiedProperty()
+    version         = ndb.IntegerProperty(default=0, indexed=False) # of the details, not seats
+
+    def to_form(self, displayName=None, seats=None):
+        """Convert Conference (and its ConferenceSeats) to ConferenceForm."""
+        return _copyConferenceToForm(self, displayName, seats)
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        if not future.get_exception():
+            record_deletion(key)
+
+
+class ConferenceSeats(ndb.Model):
+    """ConferenceSeats -- Seats of a conference
+
+    Root entity (one per conference, see key_for), written by the
+    registration and waitlist transactions instead of the conference, so
+    they do not contend with edits of its details. maxAttendees is copied
+    from the conference, in the same transaction when it changes.
+
+    Conferences created before seats had their own entity still store
+    seatsAvailable and waitlistCount; their seats are created from those
+    when first needed (see for_conference).
+    """
+    maxAttendees    = ndb.IntegerProperty(indexed=False)
     seatsAvailable  = ndb.IntegerProperty()
+    waitlistCount   = ndb.IntegerProperty(default=0, indexed=False)
+    fillRate        = ndb.ComputedProperty(lambda self: fill_rate(
+                          self.maxAttendees, self.seatsAvailable))
+    modified        = ModifiedProperty()
+
+    @staticmethod
+    def key_for(conference_key):
+        """Key of the seats of a conference."""
+        return ndb.Key(ConferenceSeats, conference_key.urlsafe())
+
+    @property
+    def conferenceKey(self):
+        return ndb.Key(urlsafe=self.key.id())
+
+    @classmethod
+    def for_conference(cls, conf):
+        """New (not yet put) seats of a conference: all free, or as stored
+        in the conference if it was created before ConferenceSeats."""
+        seats = cls(key=cls.key_for(conf.key), maxAttendees=conf.maxAttendees or 0,
+                    seatsAvailable=conf.maxAttendees or 0)
+        # properties the Conference model no longer has are loaded as
+        # generic properties of the entity
+        for name in ('seatsAvailable', 'waitlistCount'):
+            prop = conf._properties.get(name)
+            if prop is not None and prop._get_value(conf) is not None:
+                setattr(seats, name, prop._get_value(conf))
+        return seats
+
+    @classmethod
+    @ndb.tasklet
+    def get_for_conferences_async(cls, confs):
+        """Get the seats of conferences (see for_conference if missing).
+
+        Returns:
+            Future of list of ConferenceSeats, in the same order
+        """
+        seats = yield ndb.get_multi_async([cls.key_for(conf.key) for conf in confs])
+        raise ndb.Return([s or cls.for_conference(conf)
+                          for conf, s in zip(confs, seats)])
+
+    @classmethod
+    def get_for_conferences(cls, confs):
+        """Get the seats of conferences (see get_for_conferences_async)."""
+        return cls.get_for_conferences_async(confs).get_result()
+
+    @classmethod
+    def get_for_conference(cls, conf):
+        """Get the seats of a conference (see for_conference if missing)."""
+        return cls.key_for(conf.key).get() or cls.for_conference(conf)
+
+
+def fill_rate(max_attendees, seats_available):
+    """Fraction of the seats of a conference that are taken."""
+    if not max_attendees:
+        return 0.0
+    return float(max_attendees - (seats_available or 0)) / max_attendees
+
 
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
@@ -32,11 +122,25 @@ class ConferenceForm(messages.Message):
     endDate         = messages.StringField(10) #DateTimeField()
     websafeKey      = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    etag            = messages.StringField(13)
+    version         = messages.IntegerField(14, variant=messages.Variant.INT32)
+    waitlistCount   = messages.IntegerField(15, variant=messages.Variant.INT32)
+    notModified     = messages.BooleanField(16) # etag matched, nothing else set
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
 
+class ConferenceResultForm(messages.Message):
+    """ConferenceResultForm -- Conference requested by key (unset if not found)"""
+    websafeKey      = messages.StringField(1)
+    found           = messages.BooleanField(2)
+    conference      = messages.MessageField(ConferenceForm, 3)
+
+class ConferenceResultForms(messages.Message):
+    """ConferenceResultForms -- multiple ConferenceResultForm outbound form message"""
+    items = messages.MessageField(ConferenceResultForm, 1, repeated=True)
+
 class ConferenceQueryForm(messages.Message):
     """ConferenceQueryForm -- Conference query inbound form message"""
     field = messages.StringField(1)
@@ -46,3 +150,35 @@ class ConferenceQueryForm(messages.Message):
 class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+
+class ConferenceFacetForm(messages.Message):
+    """ConferenceFacetForm -- Number of conferences with the given values"""
+    fields          = messages.StringField(1, repeated=True)
+    values          = messages.StringField(2, repeated=True)
+    count           = messages.IntegerField(3)
+
+class ConferenceFacetForms(messages.Message):
+    """ConferenceFacetForms -- multiple ConferenceFacetForm outbound form message"""
+    items = messages.MessageField(ConferenceFacetForm, 1, repeated=True)
+
+
+def _copyConferenceToForm(conf, displayName, seats=None):
+    """Copy relevant fields from Conference (and ConferenceSeats) to
+    ConferenceForm."""
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            # convert Date to date string; just copy others
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    if seats:
+        cf.seatsAvailable = seats.seatsAvailable
+        cf.waitlistCount = seats.waitlistCount
+    if displayName:
+        setattr(cf, 'organizerDisplayName', displayName)
+    cf.check_initialized()
+    return cf
@@ -0,0 +1,18 @@
+"""Sharded counter App Engine data models."""
+
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class CounterShard(ndb.Model):
+    """CounterShard -- One shard of a sharded counter (see services.counter)
+
+    Keyed by counter name and shard index. The group, if any, is used to
+    read all the counters of a group with a single query.
+    """
+    name = ndb.StringProperty(required = True, indexed = False)
+    group = ndb.StringProperty()
+    count = ndb.IntegerProperty(default = 0, indexed = False)
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,27 @@
+"""User dashboard ProtoRPC models."""
+
+from protorpc import messages
+
+from models.conference import ConferenceForm
+from models.profile import ProfileForm
+from models.session import SessionForm
+
+
+#------ Model objects ---------------------------------------------------------
+
+class DashboardForm(messages.Message):
+    """DashboardForm -- User dashboard outbound form message
+
+    Lists are cut to a few items; the `more*` fields tell whether there are
+    more, to be fetched with the corresponding endpoints.
+    """
+    profile = messages.MessageField(ProfileForm, 1)
+    conferencesToAttend = messages.MessageField(ConferenceForm, 2, repeated = True)
+    conferencesCreated = messages.MessageField(ConferenceForm, 3, repeated = True)
+    sessionsInWishlist = messages.MessageField(SessionForm, 4, repeated = True)
+    announcement = messages.StringField(5)
+    moreConferencesToAttend = messages.BooleanField(6)
+    moreConferencesCreated = messages.BooleanField(7)
+    moreSessionsInWishlist = messages.BooleanField(8)
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,18 @@
+"""Idempotent request App Engine data models."""
+
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class IdempotentResult(ndb.Model):
+    """IdempotentResult -- Stored response of a request with an idempotency key
+
+    Keyed by a hash of the method, user and idempotency key (see
+    services.idempotency). Written without a response when the request
+    starts, to reserve the key. Results older than a day are purged by cron.
+    """
+    response = ndb.BlobProperty(compressed = True) # response encoded as JSON
+    created = ndb.DateTimeProperty(auto_now_add = True)
+
+#------------------------------------------------------------------------------
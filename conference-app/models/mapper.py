@@ -0,0 +1,39 @@
+"""Mapper job App Engine data models."""
+
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class MapperJob(ndb.Model):
+    """MapperJob -- State of a batch job iterating over all entities of a kind
+
+    The job is checkpointed after every batch, so it can be resumed from
+    the stored cursor if a task fails.
+    """
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    ABORTED = "ABORTED"
+
+    name = ndb.StringProperty(required = True)
+    params = ndb.JsonProperty()
+    state = ndb.JsonProperty()
+    dryRun = ndb.BooleanProperty(default = False)
+    batchSize = ndb.IntegerProperty(indexed = False)
+    countdown = ndb.IntegerProperty(indexed = False) # seconds between batches
+    status = ndb.StringProperty(default = RUNNING)
+    cursor = ndb.StringProperty(indexed = False)
+    batches = ndb.IntegerProperty(default = 0, indexed = False)
+    processed = ndb.IntegerProperty(default = 0, indexed = False)
+    updated = ndb.IntegerProperty(default = 0, indexed = False)
+    deleted = ndb.IntegerProperty(default = 0, indexed = False)
+    created = ndb.DateTimeProperty(auto_now_add = True)
+    modified = ndb.DateTimeProperty(auto_now = True, indexed = False)
+
+    def summary(self):
+        """Return a one line description of the job."""
+        return "%s %s%s: %s, %d batches, %d processed, %d updated, %d deleted" % (
+            self.key.id(), self.name, " (dry run)" if self.dryRun else "",
+            self.status, self.batches, self.processed, self.updated, self.deleted)
+
+#------------------------------------------------------------------------------
@@ -11,6 +11,10 @@ class Profile(ndb.Model):
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
 
+    def to_form(self):
+        """Convert Profile to ProfileForm."""
+        return _copyProfileToForm(self)
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName = messages.StringField(1)
@@ -22,6 +26,17 @@ class ProfileForm(messages.Message):
     mainEmail = messages.StringField(2)
     teeShirtSize = messages.EnumField('TeeShirtSize', 3)
     conferenceKeysToAttend = messages.StringField(4, repeated=True)
+    etag = messages.StringField(5)
+    notModified = messages.BooleanField(6) # etag matched, nothing else set
+
+class TeeShirtSizeCountForm(messages.Message):
+    """TeeShirtSizeCountForm -- Number of attendees with a t-shirt size"""
+    size = messages.EnumField('TeeShirtSize', 1)
+    count = messages.IntegerField(2)
+
+class TeeShirtSizeCountForms(messages.Message):
+    """TeeShirtSizeCountForms -- multiple TeeShirtSizeCountForm outbound form message"""
+    items = messages.MessageField(TeeShirtSizeCountForm, 1, repeated=True)
 
 class TeeShirtSize(messages.Enum):
     """TeeShirtSize -- t-shirt size enumeration value"""
@@ -40,3 +55,17 @@ class TeeShirtSize(messages.Enum):
     XXL_W = 13
     XXXL_M = 14
     XXXL_W = 15
+
+
+def _copyProfileToForm(prof):
+    """Copy relevant fields from Profile to ProfileForm."""
+    pf = ProfileForm()
+    for field in pf.all_fields():
+        if hasattr(prof, field.name):
+            # convert t-shirt string to Enum; just copy others
+            if field.name == 'teeShirtSize':
+                setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
+            else:
+                setattr(pf, field.name, getattr(prof, field.name))
+    pf.check_initialized()
+    return pf
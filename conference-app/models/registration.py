@@ -0,0 +1,51 @@
+"""Group registration App Engine data & ProtoRPC models."""
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class PendingGroupRegistration(ndb.Model):
+    """PendingGroupRegistration -- Seats taken for a group registration that
+    has not been settled yet
+
+    Child of the conference's ConferenceSeats, written in the transaction
+    that takes the seats, and deleted in the one that gives back the seats
+    not used.
+    """
+    emails = ndb.StringProperty(repeated = True, indexed = False)
+
+class GroupRegistrationMember(ndb.Model):
+    """GroupRegistrationMember -- Person registered by a group registration
+
+    Root entity (one per group registration and email, see key_for),
+    written in the transaction that registers the person's profile, so
+    settling the group can tell people registered by the group from people
+    who registered by themselves in the meantime.
+    """
+    registered = ndb.DateTimeProperty(auto_now_add = True, indexed = False)
+
+    @staticmethod
+    def key_for(pending_key, email):
+        """Key of the member of a group registration with the given email."""
+        return ndb.Key(GroupRegistrationMember,
+                       "%s:%s" % (pending_key.urlsafe(), email))
+
+class GroupRegistrationForm(messages.Message):
+    """GroupRegistrationForm -- Group registration inbound form message"""
+    emails = messages.StringField(1, repeated = True)
+
+class GroupRegistrationResultForm(messages.Message):
+    """GroupRegistrationResultForm -- Group registration outbound form message
+
+    Seats are reserved at once for all the emails not already registered;
+    seats not used (failures, or emails registered in the meantime) are
+    released.
+    """
+    registered = messages.StringField(1, repeated = True)
+    alreadyRegistered = messages.StringField(2, repeated = True)
+    failed = messages.StringField(3, repeated = True)
+    seatsReleased = messages.IntegerField(4, variant = messages.Variant.INT32)
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,51 @@
+"""Full-text search App Engine data & ProtoRPC models."""
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class PostingShard(ndb.Model):
+    """PostingShard -- Part of the posting list of a term
+
+    Keyed by kind, term and shard number. Documents are spread over the
+    shards of a term by a hash of their key, so that indexing documents
+    with a common term does not contend on a single entity.
+    """
+    keys = ndb.StringProperty(repeated = True, indexed = False) # URL-safe keys
+
+class IndexedDocument(ndb.Model):
+    """IndexedDocument -- Terms a document is indexed under
+
+    Keyed by the URL-safe key of the document, so that the postings of
+    terms it no longer contains can be removed when it is reindexed.
+    The version (modified time) of the document they were taken from is
+    kept, so that an index task of an older version does not overwrite
+    them; documents that were deleted are kept with no terms.
+    """
+    terms = ndb.StringProperty(repeated = True, indexed = False)
+    version = ndb.DateTimeProperty(indexed = False)
+
+class SearchKind(messages.Enum):
+    """SearchKind -- Kind of documents to search"""
+    CONFERENCE = 1
+    SESSION = 2
+
+class SearchOperator(messages.Enum):
+    """SearchOperator -- How query terms are combined"""
+    AND = 1
+    OR = 2
+
+class SearchResultForm(messages.Message):
+    """SearchResultForm -- Document matching a search"""
+    websafeKey = messages.StringField(1)
+    kind = messages.EnumField(SearchKind, 2)
+    name = messages.StringField(3)
+
+class SearchResultForms(messages.Message):
+    """SearchResultForms -- Page of search results"""
+    items = messages.MessageField(SearchResultForm, 1, repeated = True)
+    nextPageToken = messages.StringField(2)
+
+#------------------------------------------------------------------------------
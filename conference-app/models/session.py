@@ -6,6 +6,8 @@ from protorpc import messages
 from google.appengine.ext import ndb
 
 from models.speaker import Speaker
+from models.tombstone import ModifiedProperty
+from models.tombstone import record_deletion
 
 
 #------ Query params ----------------------------------------------------------
@@ -33,11 +35,15 @@ class Session(ndb.Model):
     name = ndb.StringProperty(required = True)
     typeOfSession = ndb.StringProperty(default = "NOT_SPECIFIED")
     speakerKey = ndb.KeyProperty(kind = Speaker)
-    highlights = ndb.StringProperty(repeated = True)
+    highlights = ndb.StringProperty(repeated = True, indexed = False)
     date = ndb.DateProperty()
-    location = ndb.StringProperty()
+    location = ndb.StringProperty(indexed = False)
     startTime = ndb.TimeProperty()
-    duration = ndb.IntegerProperty() # in minutes
+    duration = ndb.IntegerProperty(indexed = False) # in minutes
+    modified = ModifiedProperty()
+    # for the schedule conflict queries (see services.schedule)
+    normalizedLocation = ndb.ComputedProperty(
+        lambda self: normalize_location(self.location))
 
     def to_form(self):
         """Convert Session to SessionForm."""
@@ -48,6 +54,16 @@ class Session(ndb.Model):
         """Convert SessionForm/request to Session."""
         return _copy_form_to_session(request)
 
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        if not future.get_exception():
+            record_deletion(key)
+
+
+def normalize_location(location):
+    """Locations are compared ignoring case and surrounding spaces."""
+    return location.strip().lower() if location and location.strip() else None
+
 
 class SessionForm(messages.Message):
     """SessionForm -- Session outbound form message"""
@@ -60,10 +76,25 @@ class SessionForm(messages.Message):
     startTime = messages.StringField(7)
     duration = messages.IntegerField(8, variant = messages.Variant.INT32) # in minutes
     websafeKey = messages.StringField(9)
+    speakerName = messages.StringField(10) # only set when hydrated
+    conferenceName = messages.StringField(11) # only set when hydrated
 
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated = True)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3) # etag matched, no items
+
+
+class SessionResultForm(messages.Message):
+    """SessionResultForm -- Session requested by key (unset if not found)"""
+    websafeKey = messages.StringField(1)
+    found = messages.BooleanField(2)
+    session = messages.MessageField(SessionForm, 3)
+
+class SessionResultForms(messages.Message):
+    """SessionResultForms -- multiple SessionResultForm outbound form message"""
+    items = messages.MessageField(SessionResultForm, 1, repeated = True)
 
 
 #------ Mapping functions -----------------------------------------------------
@@ -4,6 +4,9 @@ from protorpc import messages
 
 from google.appengine.ext import ndb
 
+from models.tombstone import ModifiedProperty
+from models.tombstone import record_deletion
+
 
 #------ Model objects ---------------------------------------------------------
 
@@ -11,6 +14,7 @@ class Speaker(ndb.Model):
     """Speaker -- Speaker object"""
     name = ndb.StringProperty(required = True)
     email = ndb.StringProperty(required = True)
+    modified = ModifiedProperty()
 
     def to_form(self):
         """Convert Speaker to SpeakerForm."""
@@ -21,6 +25,22 @@ class Speaker(ndb.Model):
         """Convert SpeakerForm/request to Speaker."""
         return _copy_form_to_speaker(request)
 
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        if not future.get_exception():
+            record_deletion(key)
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- Last featured speaker and conference
+
+    Single entity (see FEATURED_SPEAKER_ID), used to recompute the featured
+    speaker announcement when it is not in memcache.
+    """
+    speakerKey = ndb.KeyProperty(kind = Speaker, indexed = False)
+    conferenceKey = ndb.KeyProperty(kind = "Conference", indexed = False)
+
+FEATURED_SPEAKER_ID = "featured"
+
 class SpeakerForm(messages.Message):
     """Speaker -- Speaker form message"""
     name = messages.StringField(1)
@@ -30,6 +50,8 @@ class SpeakerForm(messages.Message):
 class SpeakerForms(messages.Message):
     """SpeakerForms -- multiple Speaker outbound form message"""
     items = messages.MessageField(SpeakerForm, 1, repeated = True)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3) # etag matched, no items
 
 
 #------ Mapping functions -----------------------------------------------------
@@ -0,0 +1,27 @@
+"""Delta sync ProtoRPC models."""
+
+from protorpc import messages
+
+from models.conference import ConferenceForm
+from models.session import SessionForm
+from models.speaker import SpeakerForm
+
+
+#------ Model objects ---------------------------------------------------------
+
+class ChangesForm(messages.Message):
+    """ChangesForm -- Entities changed or deleted since a sync token
+
+    If `more` is set, the client should call again with the new token right
+    away. If `resync` is set, the token is too old to list deletions, and
+    the client should drop its data and sync again from an empty token.
+    """
+    conferences = messages.MessageField(ConferenceForm, 1, repeated = True)
+    sessions = messages.MessageField(SessionForm, 2, repeated = True)
+    speakers = messages.MessageField(SpeakerForm, 3, repeated = True)
+    deletedKeys = messages.StringField(4, repeated = True)
+    token = messages.StringField(5)
+    more = messages.BooleanField(6)
+    resync = messages.BooleanField(7)
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,55 @@
+"""Tombstone App Engine data models, and sync support for synced models."""
+
+from datetime import datetime
+
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class Tombstone(ndb.Model):
+    """Tombstone -- Record of a deleted entity
+
+    Keyed by the URL-safe key of the deleted entity, so that clients can
+    sync deletions (see services.sync). Tombstones older than the sync
+    retention period are purged by cron.
+    """
+    kind = ndb.StringProperty(indexed = False)
+    deleted = ndb.DateTimeProperty(auto_now = True)
+
+
+#------ Properties ------------------------------------------------------------
+
+class ModifiedProperty(ndb.DateTimeProperty):
+    """Time an entity was last modified, set on every put (like auto_now),
+    so clients can sync changes (see services.sync).
+
+    Puts that change nothing clients see (e.g. rewriting entities to update
+    their indexes) keep the stored time if the entity has `keep_modified`
+    set; entities stored without one get the current time anyway.
+    """
+
+    def _prepare_for_put(self, entity):
+        if not (getattr(entity, 'keep_modified', False) and self._get_value(entity)):
+            self._store_value(entity, datetime.utcnow())
+
+
+#------ Model hooks -----------------------------------------------------------
+
+def record_deletion(key):
+    """Write a tombstone for a deleted entity.
+
+    Used from the _post_delete_hook of synced models. Inside a transaction,
+    the tombstone is written once the transaction commits, as it belongs
+    to a different entity group.
+
+    Args:
+        key (ndb.Key): Key of the deleted entity
+    """
+    tombstone = Tombstone(id = key.urlsafe(), kind = key.kind())
+    if ndb.in_transaction():
+        ndb.get_context().call_on_commit(tombstone.put)
+    else:
+        tombstone.put()
+
+#------------------------------------------------------------------------------
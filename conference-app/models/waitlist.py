@@ -0,0 +1,35 @@
+"""Conference waitlist App Engine data & ProtoRPC models."""
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+
+#------ Model objects ---------------------------------------------------------
+
+class WaitlistEntry(ndb.Model):
+    """WaitlistEntry -- User waiting for a seat at a sold out conference
+
+    Root entity (one per conference and user, see key_for), so that joining
+    the waitlist does not write to the profile's entity group, and a batch
+    of entries can be promoted in a single cross-group transaction.
+    """
+    conferenceKey = ndb.KeyProperty(kind = "Conference", required = True)
+    userId = ndb.StringProperty(required = True, indexed = False)
+    joined = ndb.DateTimeProperty(auto_now_add = True)
+
+    @staticmethod
+    def key_for(conference_key, user_id):
+        """Key of the entry of a user in the waitlist of a conference."""
+        return ndb.Key(WaitlistEntry, "%s:%s" % (conference_key.urlsafe(), user_id))
+
+class RegistrationForm(messages.Message):
+    """RegistrationForm -- Registration outbound form message
+
+    `data` is true if the user was registered (or unregistered, or removed
+    from the waitlist). If the conference is sold out, the user is put on
+    the waitlist instead, and `waitlistPosition` is set.
+    """
+    data = messages.BooleanField(1)
+    waitlistPosition = messages.IntegerField(2, variant = messages.Variant.INT32)
+
+#------------------------------------------------------------------------------
@@ -4,14 +4,23 @@ from protorpc import messages
 from google.appengine.ext import ndb
 
 from models.session import Session
+from models.session import SessionForm
 
 
 #------ Model objects ---------------------------------------------------------
 
+# ID of the wishlist entity (there is only one, as a child of the profile)
+WISHLIST_ID = "wishlist"
+
 class Wishlist(ndb.Model):
     """Wishlist -- Wishlist object"""
     sessionKeys = ndb.KeyProperty(kind = Session, repeated = True)
 
+    @staticmethod
+    def key_for(profile_key):
+        """Key of the wishlist of a user."""
+        return ndb.Key(Wishlist, WISHLIST_ID, parent = profile_key)
+
     def to_form(self):
         """Convert Wishlist to WishlistForm."""
         return _copy_wishlist_to_form(self)
@@ -25,6 +34,24 @@ class WishlistForm(messages.Message):
     """WishlistForm -- Wishlist message"""
     sessionKeys = messages.StringField(1, repeated = True)
 
+class SessionConflictForm(messages.Message):
+    """SessionConflictForm -- Two sessions at overlapping times"""
+    first = messages.MessageField(SessionForm, 1)
+    second = messages.MessageField(SessionForm, 2)
+
+class SessionConflictForms(messages.Message):
+    """SessionConflictForms -- multiple SessionConflictForm outbound form message"""
+    items = messages.MessageField(SessionConflictForm, 1, repeated = True)
+
+class SessionPopularityForm(messages.Message):
+    """SessionPopularityForm -- Session and number of wishlists it is in"""
+    session = messages.MessageField(SessionForm, 1)
+    wishlistCount = messages.IntegerField(2)
+
+class SessionPopularityForms(messages.Message):
+    """SessionPopularityForms -- multiple SessionPopularityForm outbound form message"""
+    items = messages.MessageField(SessionPopularityForm, 1, repeated = True)
+
 
 #------ Mapping functions -----------------------------------------------------
 
@@ -1,9 +1,16 @@
 import endpoints
 
+# The API modules only load the message classes their methods are declared
+# with: services used by few methods (search, sync, dashboard, group
+# registration, notifications) are imported when first called.
 from api.conference import ConferenceApi
+from api.dashboard import DashboardApi
+from api.search import SearchApi
 from api.speaker import SpeakerApi
 from api.session import SessionApi
+from api.sync import SyncApi
 from api.wishlist import WishlistApi
 
 # Register APIs
-api = endpoints.api_server([ConferenceApi, SpeakerApi, SessionApi, WishlistApi])
+api = endpoints.api_server([ConferenceApi, SpeakerApi, SessionApi, WishlistApi,
+    SyncApi, DashboardApi, SearchApi])
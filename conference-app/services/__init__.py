@@ -1,9 +1,29 @@
+import base64
+import os
+import re
 import endpoints
 from functools import wraps
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 
+from models import ConflictException
+from models import TooManyRequestsException
+from services import idempotency
+from services import ratelimit
 from utils import getUserId
 
+# Memcache key prefix and expiration (seconds) for keys that were not found
+NOT_FOUND_KEY_PREFIX = "NOT_FOUND:"
+NOT_FOUND_SECONDS = 60
+
+# Characters of URL-safe keys (base64 without padding), and first byte of
+# a serialized key (the application id field)
+WEBSAFE_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,1000}$")
+SERIALIZED_KEY_FIRST_BYTE = "j"
+
+# Maximum number of keys that can be requested at once
+MAX_KEYS_PER_REQUEST = 100
+
 
 #------ Base service ----------------------------------------------------------
 
@@ -34,19 +54,7 @@ class BaseService(object):
         Raises:
             endpoints.NotFoundException
         """
-        # Trying to create a Key with an invalid value raises ProtocolBufferDecodeError.
-        # Using from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
-        # does not work, as a different ProtocolBufferDecodeError is raised.
-        # See: https://github.com/googlecloudplatform/datastore-ndb-python/issues/143
-        # Catching all exceptions for now...
-        try:
-            conference = ndb.Key(urlsafe = websafe_conference_key).get()
-        except:
-            conference = None
-        if not conference:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % websafe_conference_key)
-        return conference
+        return self._get_entity(websafe_conference_key, "Conference", "conference")
 
     def get_speaker(self, websafe_speaker_key):
         """Get skeaper, given a key.
@@ -57,19 +65,91 @@ class BaseService(object):
         Raises:
             endpoints.NotFoundException
         """
-        # See comment about exceptions in get_conference method
-        try:
-            speaker = ndb.Key(urlsafe = websafe_speaker_key).get()
-        except:
-            speaker = None
-        if not speaker:
-            raise endpoints.NotFoundException(
-                'No speaker found with key: %s' % websafe_speaker_key)
-        return speaker
+        return self._get_entity(websafe_speaker_key, "Speaker", "speaker")
+
+    def _get_entity(self, websafe_key, kind, name):
+        """Get entity of the given kind, given a key.
+
+        Invalid keys are rejected without reaching the datastore. The
+        entity is looked up in ndb's caches together with the not found
+        marker of its key (both in memcache), so keys that were not found
+        recently are rejected without reaching the datastore either, but
+        the marker never hides a cached entity.
+
+        Raises:
+            endpoints.NotFoundException
+        """
+        key = decode_websafe_key(websafe_key, kind)
+        if key:
+            not_found_key = NOT_FOUND_KEY_PREFIX + websafe_key
+            entity_future = key.get_async(use_datastore = False)
+            marker_future = ndb.get_context().memcache_get(not_found_key)
+            entity = entity_future.get_result()
+            if entity:
+                return entity
+            if not marker_future.get_result():
+                entity = key.get()
+                if entity:
+                    return entity
+                memcache.set(not_found_key, True, time = NOT_FOUND_SECONDS)
+        raise endpoints.NotFoundException(
+            'No %s found with key: %s' % (name, websafe_key))
 
 
 #------ Utility functions -----------------------------------------------------
 
+def decode_websafe_key(websafe_key, kind=None):
+    """Decode URL-safe key.
+
+    Checks that the key looks valid before decoding it, since decoding
+    an invalid key is slow and raises a variety of exceptions.
+
+    Args:
+        websafe_key (string)
+        kind (string): Expected kind (optional)
+
+    Returns:
+        ndb.Key, or None if the key is invalid or of a different kind
+    """
+    if not websafe_key or not WEBSAFE_KEY_PATTERN.match(websafe_key):
+        return None
+    try:
+        padding = "=" * (-len(websafe_key) % 4)
+        serialized = base64.urlsafe_b64decode(str(websafe_key) + padding)
+        if not serialized.startswith(SERIALIZED_KEY_FIRST_BYTE):
+            return None
+        # Trying to create a Key with an invalid value raises ProtocolBufferDecodeError.
+        # Using from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+        # does not work, as a different ProtocolBufferDecodeError is raised.
+        # See: https://github.com/googlecloudplatform/datastore-ndb-python/issues/143
+        # Catching all exceptions for now...
+        key = ndb.Key(urlsafe = websafe_key)
+    except Exception:
+        return None
+    if kind and key.kind() != kind:
+        return None
+    return key
+
+
+def decode_websafe_keys(websafe_keys, kind=None):
+    """Decode a list of URL-safe keys requested at once.
+
+    Args:
+        websafe_keys (list of strings)
+        kind (string): Expected kind (optional)
+
+    Returns:
+        list of ndb.Key, with None for invalid keys
+
+    Raises:
+        endpoints.BadRequestException if too many keys are requested
+    """
+    if len(websafe_keys) > MAX_KEYS_PER_REQUEST:
+        raise endpoints.BadRequestException(
+            "At most %d keys can be requested at once" % MAX_KEYS_PER_REQUEST)
+    return [decode_websafe_key(websafe_key, kind) for websafe_key in websafe_keys]
+
+
 def login_required(func):
     """Decorates a method to ensure that only logged in users can access it.
 
@@ -85,4 +165,86 @@ def login_required(func):
 
     return login_required_method
 
+def rate_limited(requests, seconds=60, total_requests=None):
+    """Decorates a method to limit how often each user can call it.
+
+    Uses token buckets in memcache: one per user (or per IP address for
+    anonymous users) and method, and optionally one per method for all users.
+    Rate limited requests get a 503 response, with the seconds to wait
+    before retrying in the message (see models.TooManyRequestsException).
+
+    Args:
+        requests (int): Requests allowed per user every `seconds`
+        seconds (int): Period in seconds
+        total_requests (int): Requests allowed for all users every `seconds`
+
+    Raises:
+        models.TooManyRequestsException (with the seconds to wait)
+    """
+    def decorator(func):
+        method = "%s.%s" % (func.__module__, func.__name__)
+
+        @wraps(func)
+        def rate_limited_method(*args, **kargs):
+            user = endpoints.get_current_user()
+            user_id = getUserId(user) if user else os.environ.get("REMOTE_ADDR", "")
+            retry_after = ratelimit.acquire(
+                "%s:%s" % (method, user_id), requests, seconds)
+            if not retry_after and total_requests:
+                retry_after = ratelimit.acquire(method, total_requests, seconds)
+            if retry_after:
+                raise TooManyRequestsException(retry_after)
+            return func(*args, **kargs)
+
+        return rate_limited_method
+
+    return decorator
+
+def idempotent(response_type):
+    """Decorates an API method so that retries with the same idempotency key
+    return the response of the first request, instead of running it again.
+
+    The key is taken from the `idempotencyKey` field of the request, or the
+    Idempotency-Key header. Requests without a key run as usual.
+
+    Args:
+        response_type (Message class): Response message of the method
+
+    Raises:
+        models.ConflictException if a request with the same key is running
+    """
+    def decorator(func):
+        method = "%s.%s" % (func.__module__, func.__name__)
+
+        @wraps(func)
+        def idempotent_method(api, request, *args, **kargs):
+            idempotency_key = getattr(request, "idempotencyKey", None) or \
+                api.request_state.headers.get("Idempotency-Key")
+            if not idempotency_key:
+                return func(api, request, *args, **kargs)
+
+            user = endpoints.get_current_user()
+            user_id = user.email() if user else os.environ.get("REMOTE_ADDR", "")
+            key = idempotency.result_key(method, user_id, idempotency_key)
+            try:
+                response = idempotency.lookup(key, response_type)
+                if response is not None:
+                    return response
+                idempotency.lock(key)
+            except idempotency.RequestInProgress:
+                raise ConflictException(
+                    "A request with the same idempotency key is in progress")
+
+            try:
+                response = func(api, request, *args, **kargs)
+            except Exception:
+                idempotency.release(key)
+                raise
+            idempotency.store(key, response)
+            return response
+
+        return idempotent_method
+
+    return decorator
+
 #------------------------------------------------------------------------------
@@ -0,0 +1,136 @@
+import time
+from itertools import groupby
+
+import endpoints
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models.agenda import AGENDA_ID
+from models.agenda import Agenda
+from models.agenda import AgendaDayForm
+from models.agenda import AgendaForm
+from models.agenda import AgendaSessionForm
+from models.agenda import AgendaSlotForm
+from models.session import Session
+from models.session import SessionType
+from services import BaseService
+from services import decode_websafe_key
+
+# Seconds to wait before rebuilding an agenda after a change. Changes to
+# the same conference within this time are handled by a single rebuild.
+AGENDA_REBUILD_DELAY = 5
+
+
+class AgendaService(BaseService):
+    """Agenda Service v0.1
+
+    The agenda of a conference (sessions grouped by date and start time,
+    with speaker names) is stored as a single entity, rebuilt by a task
+    after sessions change, so that reading it takes a single get.
+    """
+
+    def get_agenda(self, websafe_conference_key):
+        """Given a conference, return its agenda.
+
+        Args:
+            websafe_conference_key (string)
+
+        Returns:
+            AgendaForm
+
+        Raises:
+            endpoints.NotFoundException
+        """
+        conference_key = decode_websafe_key(websafe_conference_key, "Conference")
+        if conference_key:
+            agenda = ndb.Key(Agenda, AGENDA_ID, parent = conference_key).get()
+            if agenda:
+                return agenda.to_form()
+
+            # Not built yet (e.g. conference without sessions)
+            form = AgendaService.build_agenda(conference_key)
+            if form:
+                return form
+
+        raise endpoints.NotFoundException(
+            'No conference found with key: %s' % websafe_conference_key)
+
+    @staticmethod
+    def schedule_rebuild(conference_key):
+        """Rebuild the agenda of a conference in a task.
+
+        Tasks are named after the conference and the current time window,
+        so several changes in a short time only trigger one rebuild.
+
+        Args:
+            conference_key (ndb.Key)
+        """
+        websafe_conference_key = conference_key.urlsafe()
+        window = int(time.time() // AGENDA_REBUILD_DELAY)
+        try:
+            taskqueue.add(
+                name = "agenda-%s-%d" % (websafe_conference_key, window),
+                params = {'websafeConferenceKey': websafe_conference_key},
+                url = '/tasks/rebuild_agenda',
+                countdown = AGENDA_REBUILD_DELAY)
+        except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+            pass
+
+    @staticmethod
+    def build_agenda(conference_key):
+        """Build and store the agenda of a conference.
+
+        Args:
+            conference_key (ndb.Key)
+
+        Returns:
+            AgendaForm, or None if the conference does not exist
+        """
+        conference = conference_key.get()
+        if not conference:
+            return None
+
+        # Get sessions and their speakers
+        sessions = Session.query(ancestor = conference_key).fetch()
+        speaker_keys = set(s.speakerKey for s in sessions if s.speakerKey)
+        speaker_names = {speaker.key: speaker.name
+            for speaker in ndb.get_multi(speaker_keys) if speaker}
+
+        # Group scheduled sessions by date and start time
+        scheduled = sorted(
+            [s for s in sessions if s.date and s.startTime],
+            key = lambda s: (s.date, s.startTime, s.name))
+        days = []
+        for date, day_sessions in groupby(scheduled, lambda s: s.date):
+            slots = []
+            for start_time, slot_sessions in groupby(day_sessions, lambda s: s.startTime):
+                slots.append(AgendaSlotForm(
+                    startTime = str(start_time),
+                    sessions = [_agenda_session(s, speaker_names) for s in slot_sessions]))
+            days.append(AgendaDayForm(date = str(date), slots = slots))
+
+        form = AgendaForm(
+            websafeConferenceKey = conference_key.urlsafe(),
+            name = conference.name,
+            days = days,
+            unscheduled = [_agenda_session(s, speaker_names)
+                for s in sorted(sessions, key = lambda s: s.name)
+                if not (s.date and s.startTime)])
+
+        Agenda.to_object(form, conference_key).put()
+        return form
+
+
+def _agenda_session(session, speaker_names):
+    """Copy relevant fields from Session to AgendaSessionForm."""
+    form = AgendaSessionForm(
+        websafeKey = session.key.urlsafe(),
+        name = session.name,
+        location = session.location,
+        duration = session.duration)
+    if session.typeOfSession:
+        form.typeOfSession = getattr(SessionType, session.typeOfSession)
+    if session.speakerKey:
+        form.websafeSpeakerKey = session.speakerKey.urlsafe()
+        form.speakerName = speaker_names.get(session.speakerKey)
+    return form
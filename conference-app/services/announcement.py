@@ -0,0 +1,112 @@
+"""Announcement of nearly sold out conferences.
+
+The set of nearly sold out conferences (dict websafeKey -> name) is kept in
+a single memcache entry, updated incrementally when the seats available of
+a conference (see ConferenceSeats) cross the threshold, and reconciled with the datastore by cron.
+The announcement is formatted from that set when read.
+
+Used by both the conference API and the cron handlers, so it does not
+depend on the API classes.
+"""
+
+from google.appengine.ext import ndb
+
+from models.conference import ConferenceSeats
+from services import cache
+from tools.index_advisor import record_query_shape
+
+MEMCACHE_ANNOUNCEMENTS_KEY = "NEARLY_SOLD_OUT_CONFERENCES"
+ANNOUNCEMENTS_TTL = 60 * 60 # seconds before reconciling with the datastore
+ANNOUNCEMENTS_LOCAL_TTL = 5 # seconds an instance may serve its own copy
+ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
+                    'are nearly sold out: %s')
+NEARLY_SOLD_OUT_SEATS = 5
+
+
+def get_announcement():
+    """Return the current announcement (string, empty if none)."""
+    return format_announcement(get_nearly_sold_out())
+
+
+def get_nearly_sold_out():
+    """Return the nearly sold out conferences (dict websafeKey -> name).
+
+    If missing or stale, only one request recomputes them.
+    """
+    return cache.get_cached(MEMCACHE_ANNOUNCEMENTS_KEY, find_nearly_sold_out,
+        ttl = ANNOUNCEMENTS_TTL, local_ttl = ANNOUNCEMENTS_LOCAL_TTL) or {}
+
+
+def is_nearly_sold_out(seats):
+    """Check if a conference should be in the announcement, given its
+    ConferenceSeats."""
+    return 0 < (seats.seatsAvailable or 0) <= NEARLY_SOLD_OUT_SEATS
+
+
+def format_announcement(confs):
+    """Format announcement from dict of nearly sold out conferences."""
+    if not confs:
+        return ""
+    return ANNOUNCEMENT_TPL % (', '.join(sorted(confs.values())))
+
+
+def find_nearly_sold_out():
+    """Query nearly sold out conferences.
+
+    Returns:
+        dict websafeKey -> name
+    """
+    seat_keys = ConferenceSeats.query(ndb.AND(
+        ConferenceSeats.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+        ConferenceSeats.seatsAvailable > 0)
+    ).fetch(keys_only=True)
+    record_query_shape('ConferenceSeats', inequality='seatsAvailable')
+    confs = ndb.get_multi([ndb.Key(urlsafe=key.id()) for key in seat_keys])
+    return {conf.key.urlsafe(): conf.name for conf in confs if conf}
+
+
+def cache_announcement():
+    """Find nearly sold out conferences & assign them to memcache;
+    used by memcache cron job (to reconcile the incremental updates)
+    and when the memcache entry cannot be updated incrementally.
+
+    Returns:
+        Announcement (string)
+    """
+    # Store even if empty, so that a missing entry means unknown
+    confs = cache.set_cached(MEMCACHE_ANNOUNCEMENTS_KEY,
+        find_nearly_sold_out(), ttl = ANNOUNCEMENTS_TTL)
+    return format_announcement(confs)
+
+
+def update_nearly_sold_out(conf, seats):
+    """Add or remove conference from the nearly sold out conferences
+    in memcache, depending on its available seats.
+
+    Called when the seats available cross the threshold (or when
+    a nearly sold out conference is updated), so the announcement
+    is always current.
+
+    Args:
+        conf (Conference)
+        seats (ConferenceSeats): Seats of the conference
+
+    Returns:
+        Announcement (string)
+    """
+    wsck = conf.key.urlsafe()
+    def update(confs):
+        if is_nearly_sold_out(seats):
+            confs[wsck] = conf.name
+        else:
+            confs.pop(wsck, None)
+        return confs
+
+    confs = cache.update_cached(MEMCACHE_ANNOUNCEMENTS_KEY, update)
+    if confs is None:
+        # Missing or too much contention: rebuild from the datastore. The
+        # query is eventually consistent and may not see this change yet,
+        # so it is applied to the rebuilt set as well.
+        confs = cache.set_cached(MEMCACHE_ANNOUNCEMENTS_KEY,
+            update(find_nearly_sold_out()), ttl = ANNOUNCEMENTS_TTL)
+    return format_announcement(confs)
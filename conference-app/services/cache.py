@@ -0,0 +1,164 @@
+"""Memcache helpers for cached computations.
+
+Values are cached in an envelope with a soft expiration time (after which
+they are stale) and a hard one (after which memcache drops them). When a
+value is stale or missing, only the caller that gets a short lease
+(memcache add) recomputes it; everybody else keeps getting the stale value,
+or waits a little for the new one. This avoids having every request hit
+the datastore at the same time when a popular entry expires or is evicted.
+Writes of recomputed values use compare-and-set, so they never overwrite
+newer values written in the meantime (e.g. by incremental updates).
+
+Values that can be a few seconds old can also be kept in an in-process
+cache (see local_ttl), which saves the memcache round trip.
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+# Seconds a cached value is fresh, and seconds it may still be served
+# (while being recomputed) after that
+DEFAULT_TTL = 60 * 60
+DEFAULT_GRACE = 24 * 60 * 60
+
+# Seconds before a recompute lease expires (if its holder dies)
+LEASE_SECONDS = 10
+
+# How long callers without a lease wait for a missing value
+WAIT_RETRIES = 5
+WAIT_SECONDS = 0.05
+
+CAS_RETRIES = 5
+
+# In-process cache: key -> (value, expires at)
+_local_cache = {}
+
+
+def get_cached(key, compute, ttl=DEFAULT_TTL, grace=DEFAULT_GRACE, default=None,
+               local_ttl=0):
+    """Get a cached value, recomputing it if it is missing or stale.
+
+    Args:
+        key (string): Memcache key
+        compute (function): Computes the value (called without arguments)
+        ttl (int): Seconds the recomputed value is fresh
+        grace (int): Seconds the value may be served stale after that
+        default: Returned if the value is missing and is being recomputed
+            by another caller for too long
+        local_ttl (int): Seconds to keep the value in the in-process cache
+            (0 to always read from memcache)
+
+    Returns:
+        The cached or recomputed value
+    """
+    if local_ttl:
+        entry = _local_cache.get(key)
+        if entry and time.time() < entry[1]:
+            return entry[0]
+
+    value = _get_memcached(key, compute, ttl, grace, default)
+
+    if local_ttl:
+        _local_cache[key] = (value, time.time() + local_ttl)
+    return value
+
+
+def _get_memcached(key, compute, ttl, grace, default):
+    """Get a value from memcache, recomputing it if missing or stale."""
+    client = memcache.Client()
+    entry = client.gets(key)
+    # A value without envelope (e.g. written by an older version of the
+    # app) is a miss, but is overwritten with compare-and-set
+    found = entry is not None
+    if not _is_envelope(entry):
+        entry = None
+    if entry is not None:
+        value, fresh_until, expires_at = entry
+        if time.time() < fresh_until or not _acquire_lease(key):
+            # Fresh, or stale and somebody else is recomputing it
+            return value
+    elif not _acquire_lease(key):
+        # Missing and somebody else is recomputing it
+        for _ in range(WAIT_RETRIES):
+            time.sleep(WAIT_SECONDS)
+            entry = client.get(key)
+            if _is_envelope(entry):
+                return entry[0]
+        return default
+
+    try:
+        value = compute()
+        new_entry = _envelope(value, ttl, grace)
+        if found:
+            stored = client.cas(key, new_entry, time = new_entry[2])
+        else:
+            stored = client.add(key, new_entry, time = new_entry[2])
+        if not stored:
+            # Somebody wrote a newer value while computing; prefer it
+            entry = client.get(key)
+            if _is_envelope(entry):
+                value = entry[0]
+        return value
+    finally:
+        memcache.delete(_lease_key(key))
+
+
+def set_cached(key, value, ttl=DEFAULT_TTL, grace=DEFAULT_GRACE):
+    """Set a cached value (e.g. after recomputing it in a task)."""
+    entry = _envelope(value, ttl, grace)
+    memcache.set(key, entry, time = entry[2])
+    _local_cache.pop(key, None)
+    return value
+
+
+def update_cached(key, update):
+    """Atomically update a cached value, without changing its expiration.
+
+    Args:
+        key (string): Memcache key
+        update (function): Receives the current value and returns the new one
+
+    Returns:
+        The new value, or None if the value is not cached (or the update
+        could not be done because of contention); callers should then
+        recompute the value from scratch.
+    """
+    _local_cache.pop(key, None)
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        entry = client.gets(key)
+        if not _is_envelope(entry):
+            # Missing, or not written by get_cached / set_cached
+            return None
+        value, fresh_until, expires_at = entry
+        value = update(value)
+        if client.cas(key, (value, fresh_until, expires_at), time = expires_at):
+            return value
+    return None
+
+
+def delete_cached(key):
+    """Delete a cached value."""
+    _local_cache.pop(key, None)
+    memcache.delete(key)
+
+
+def _envelope(value, ttl, grace):
+    """Return (value, fresh until, expires at) tuple to store in memcache."""
+    now = int(time.time())
+    return (value, now + ttl, now + ttl + grace)
+
+
+def _is_envelope(entry):
+    """Check if a memcache value is an envelope (see _envelope)."""
+    return isinstance(entry, tuple) and len(entry) == 3
+
+
+def _lease_key(key):
+    return "LEASE:" + key
+
+
+def _acquire_lease(key):
+    """Try to get the lease for recomputing a value."""
+    return memcache.add(_lease_key(key), 1, time = LEASE_SECONDS)
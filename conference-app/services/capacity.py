@@ -0,0 +1,232 @@
+"""Capacity analytics: seats and registrations per city and month, and the
+conferences with the highest fill rate.
+
+The number of conferences, seats and registrations, in total and per city
+and per start month, are kept in sharded counters (see services.counter),
+updated with the changes of every conference creation, update and
+registration. All those counts are served from a single memcache entry,
+updated together with the counters, and rebuilt from them when missing.
+The reconcile_capacity mapper (run weekly by cron) recounts them from the
+conferences, to correct any drift.
+
+The conferences with the highest fill rate are kept in memcache too, and
+updated in place with every change; when that is not possible they are
+queried again (by ConferenceSeats.fillRate).
+"""
+
+import json
+
+from google.appengine.ext import ndb
+
+from models.capacity import CapacityForm
+from models.capacity import CapacitySummaryForm
+from models.capacity import ConferenceFillForm
+from models.conference import ConferenceSeats
+from models.conference import fill_rate
+from services import cache
+from services import counter
+from tools.index_advisor import record_query_shape
+
+CAPACITY_COUNTER_GROUP = "capacity"
+CAPACITY_COUNTER_PREFIX = "capacity:"
+CAPACITY_METRICS = ('conferences', 'seats', 'registered')
+MEMCACHE_CAPACITY_KEY = "CAPACITY_COUNTS"
+MEMCACHE_LEADERBOARD_KEY = "FILL_RATE_LEADERBOARD"
+CAPACITY_TTL = 10 * 60 # seconds before rebuilding from the counters
+LEADERBOARD_TTL = 10 * 60 # seconds before querying again
+LEADERBOARD_SIZE = 10
+
+
+#------ Summary ---------------------------------------------------------------
+
+def get_summary():
+    """Return the capacity summary.
+
+    Returns:
+        CapacitySummaryForm
+    """
+    counts = cache.get_cached(MEMCACHE_CAPACITY_KEY, find_counts,
+        ttl = CAPACITY_TTL) or {}
+    leaderboard = cache.get_cached(MEMCACHE_LEADERBOARD_KEY, find_leaderboard,
+        ttl = LEADERBOARD_TTL) or []
+
+    # dimension -> value -> metric -> count
+    totals = {}
+    for (dimension, value, metric), count in counts.iteritems():
+        totals.setdefault(dimension, {}).setdefault(value, {})[metric] = count
+
+    def forms(dimension):
+        return sorted((_capacity_form(value, metrics) for value, metrics in
+                       totals.get(dimension, {}).iteritems()
+                       if metrics.get('conferences')),
+                      key = lambda form: (-form.fillRate, form.value))
+
+    return CapacitySummaryForm(
+        total = _capacity_form(None, totals.get('all', {}).get('', {})),
+        byCity = forms('city'),
+        byMonth = forms('month'),
+        topConferences = [ConferenceFillForm(
+            websafeKey = wsck, name = name, registered = registered,
+            maxAttendees = max_attendees, fillRate = rate)
+            for rate, wsck, name, registered, max_attendees in leaderboard])
+
+
+def find_counts():
+    """Read the capacity counts from the counters.
+
+    Returns:
+        dict (dimension, value, metric) -> count
+    """
+    return {_parse_counter(name): count for name, count in
+            counter.get_group_counts(CAPACITY_COUNTER_GROUP).iteritems()}
+
+
+def _capacity_form(value, metrics):
+    seats = metrics.get('seats', 0)
+    registered = metrics.get('registered', 0)
+    return CapacityForm(
+        value = value,
+        conferences = metrics.get('conferences', 0),
+        seats = seats,
+        registered = registered,
+        fillRate = float(registered) / seats if seats else 0.0)
+
+
+#------ Updates ---------------------------------------------------------------
+
+def capacity_counts(conf, seats):
+    """Return what a conference adds to the capacity counters.
+
+    Args:
+        conf (Conference)
+        seats (ConferenceSeats): Seats of the conference
+
+    Returns:
+        dict counter name -> count
+    """
+    return _counts(conf.city, conf.month, seats.maxAttendees or 0,
+                   (seats.maxAttendees or 0) - (seats.seatsAvailable or 0))
+
+
+def update_capacity(old_counts, conf, seats):
+    """Update the capacity counters and the leaderboard after a conference
+    changed.
+
+    Args:
+        old_counts (dict): capacity_counts of the conference before the
+            change (empty for a new conference)
+        conf (Conference): Conference after the change
+        seats (ConferenceSeats): Seats of the conference after the change
+    """
+    new_counts = capacity_counts(conf, seats)
+    deltas = {}
+    for name in set(old_counts) | set(new_counts):
+        delta = new_counts.get(name, 0) - old_counts.get(name, 0)
+        if delta:
+            deltas[name] = delta
+    if deltas:
+        counter.increment_multi(deltas, group = CAPACITY_COUNTER_GROUP)
+
+        def update(counts):
+            for name, delta in deltas.iteritems():
+                key = _parse_counter(name)
+                counts[key] = counts.get(key, 0) + delta
+            return counts
+
+        if cache.update_cached(MEMCACHE_CAPACITY_KEY, update) is None:
+            # Missing or contended: rebuild when next read
+            cache.delete_cached(MEMCACHE_CAPACITY_KEY)
+    update_leaderboard(conf, seats)
+
+
+def add_registrations(conf, seats, registered):
+    """Update the capacity counters and the leaderboard after registrations
+    that did not change anything else.
+
+    Args:
+        conf (Conference)
+        seats (ConferenceSeats): Seats of the conference after the
+            registrations
+        registered (int): Users registered (negative if unregistered)
+    """
+    if registered:
+        old_counts = _counts(conf.city, conf.month, seats.maxAttendees or 0,
+            (seats.maxAttendees or 0) - (seats.seatsAvailable or 0) - registered)
+        update_capacity(old_counts, conf, seats)
+
+
+def _counts(city, month, seats, registered):
+    counts = {}
+    for dimension, value in (('all', u''), ('city', city), ('month', month)):
+        if dimension != 'all' and not value:
+            continue
+        for metric, count in zip(CAPACITY_METRICS, (1, seats, registered)):
+            counts[capacity_counter(dimension, unicode(value), metric)] = count
+    return counts
+
+
+def capacity_counter(dimension, value, metric):
+    """Name of a capacity counter."""
+    return CAPACITY_COUNTER_PREFIX + json.dumps([dimension, value, metric])
+
+
+def _parse_counter(name):
+    return tuple(json.loads(name[len(CAPACITY_COUNTER_PREFIX):]))
+
+
+#------ Leaderboard -----------------------------------------------------------
+
+def find_leaderboard():
+    """Query the conferences with the highest fill rate.
+
+    Returns:
+        list of (fill rate, websafe key, name, registered, maxAttendees)
+    """
+    seats = ConferenceSeats.query().order(
+        -ConferenceSeats.fillRate).fetch(LEADERBOARD_SIZE)
+    record_query_shape('ConferenceSeats', orders=['fillRate'])
+    confs = ndb.get_multi([s.conferenceKey for s in seats])
+    return _rank(_leaderboard_entry(conf, s)
+                 for conf, s in zip(confs, seats) if conf)
+
+
+def update_leaderboard(conf, seats):
+    """Update the cached leaderboard with the fill rate of a conference.
+
+    Conferences outside the leaderboard never have a higher fill rate than
+    the last one in it (or the leaderboard would not be full), so it can
+    be updated in place, except when a conference in it falls below the
+    last one: then it is queried again when next read.
+    """
+    entry = _leaderboard_entry(conf, seats)
+    wsck = entry[1]
+    stale = []
+    def update(leaderboard):
+        entries = {e[1]: e for e in leaderboard}
+        full = len(leaderboard) >= LEADERBOARD_SIZE
+        if wsck in entries:
+            if full and entry[0] < entries[wsck][0] and entry[0] < leaderboard[-1][0]:
+                stale.append(True)
+                return leaderboard
+            entries[wsck] = entry
+        elif entry[0] > 0 and (not full or entry[0] > leaderboard[-1][0]):
+            entries[wsck] = entry
+        return _rank(entries.itervalues())
+
+    if cache.update_cached(MEMCACHE_LEADERBOARD_KEY, update) is None or stale:
+        # Missing, contended or not known: query when next read
+        cache.delete_cached(MEMCACHE_LEADERBOARD_KEY)
+
+
+def _leaderboard_entry(conf, seats):
+    registered = (seats.maxAttendees or 0) - (seats.seatsAvailable or 0)
+    return (fill_rate(seats.maxAttendees, seats.seatsAvailable),
+            conf.key.urlsafe(), conf.name, registered, seats.maxAttendees or 0)
+
+
+def _rank(entries):
+    """Sort leaderboard entries, highest fill rate first, and keep the first
+    LEADERBOARD_SIZE with registrations."""
+    ranked = sorted((e for e in entries if e[0] > 0),
+                    key = lambda e: (-e[0], e[1]))
+    return ranked[:LEADERBOARD_SIZE]
@@ -0,0 +1,119 @@
+"""Sharded counters.
+
+A counter is split into NUM_SHARDS entities, and every increment updates
+one of them at random in a small transaction, so a counter can take many
+increments per second (an entity group only takes about one write per
+second). Reading a counter gets all its shards with a single get_multi,
+and totals are cached in memcache, where increments are applied too.
+
+Counters can belong to a group, so that all the counters of a group can be
+read with one query (e.g. the counters of all sessions of a conference).
+"""
+
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models.counter import CounterShard
+from tools.index_advisor import record_query_shape
+
+NUM_SHARDS = 20
+MEMCACHE_PREFIX = "COUNTER:"
+
+# Seconds a total is cached; a total read while an increment commits may
+# miss it until then
+COUNT_CACHE_SECONDS = 5 * 60
+
+
+def increment(name, delta=1, group=None):
+    """Add to a counter.
+
+    Args:
+        name (string): Counter name
+        delta (int): Amount to add (may be negative)
+        group (string): Group of the counter (optional)
+    """
+    increment_multi({name: delta}, group)
+
+
+def increment_multi(deltas, group=None):
+    """Add to several counters, with their shard transactions in parallel.
+
+    Args:
+        deltas (dict): Counter name -> amount to add (may be negative)
+        group (string): Group of the counters (optional)
+    """
+    futures = [_increment_shard_async(name, random.randint(0, NUM_SHARDS - 1),
+                                      delta, group)
+               for name, delta in deltas.iteritems()]
+    ndb.Future.wait_all(futures)
+    for future in futures:
+        future.check_success()
+    # Only updates cached totals (missing ones are read from the shards)
+    memcache.offset_multi(deltas, key_prefix = MEMCACHE_PREFIX)
+
+
+def get_count(name):
+    """Return the value of a counter."""
+    return get_counts([name])[name]
+
+
+def get_counts(names):
+    """Return the values of several counters.
+
+    Returns:
+        dict name -> count
+    """
+    counts = memcache.get_multi(names, key_prefix = MEMCACHE_PREFIX)
+    missing = [name for name in names if name not in counts]
+    if missing:
+        totals = dict.fromkeys(missing, 0)
+        shards = ndb.get_multi([_shard_key(name, index)
+            for name in missing for index in range(NUM_SHARDS)])
+        for shard in shards:
+            if shard:
+                totals[shard.name] += shard.count
+        memcache.add_multi(totals, time = COUNT_CACHE_SECONDS,
+            key_prefix = MEMCACHE_PREFIX)
+        counts.update(totals)
+    return counts
+
+
+def get_group_counts(group):
+    """Return the values of all the counters of a group.
+
+    The query is eventually consistent, so recent increments may be missing.
+
+    Returns:
+        dict name -> count
+    """
+    totals = {}
+    for shard in CounterShard.query(CounterShard.group == group):
+        totals[shard.name] = totals.get(shard.name, 0) + shard.count
+    record_query_shape('CounterShard', equality=['group'])
+    return totals
+
+
+def set_count(name, count, group=None):
+    """Set the value of a counter (e.g. after counting from scratch).
+
+    Not safe against concurrent increments, which may be lost.
+    """
+    ndb.put_multi([CounterShard(key = _shard_key(name, 0),
+        name = name, group = group, count = count)])
+    ndb.delete_multi([_shard_key(name, index) for index in range(1, NUM_SHARDS)])
+    memcache.delete(MEMCACHE_PREFIX + name)
+
+
+@ndb.transactional_tasklet()
+def _increment_shard_async(name, index, delta, group):
+    key = _shard_key(name, index)
+    shard = yield key.get_async()
+    shard = shard or CounterShard(key = key, name = name, group = group)
+    shard.count += delta
+    yield shard.put_async()
+
+
+def _shard_key(name, index):
+    return ndb.Key(CounterShard, "%s:%d" % (name, index))
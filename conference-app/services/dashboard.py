@@ -0,0 +1,114 @@
+"""User dashboard: what the frontend shows after login, in one request.
+
+The profile, the first conferences the user attends and created, the
+first sessions in their wishlist, and the announcement are read
+concurrently with async ndb, sharing one Profile fetch. Each list is cut
+to DASHBOARD_MAX_ITEMS, with a flag telling whether there are more.
+"""
+
+from google.appengine.ext import ndb
+
+from models.conference import Conference
+from models.conference import ConferenceSeats
+from models.dashboard import DashboardForm
+from models.profile import Profile
+from models.profile import TeeShirtSize
+from services import BaseService
+from services import announcement
+from services import login_required
+from services.wishlist import get_wishlist_async
+from utils import getUserId
+
+# Maximum items returned in each list of the dashboard
+DASHBOARD_MAX_ITEMS = 10
+
+
+class DashboardService(BaseService):
+    """Dashboard Service v0.1"""
+
+    @login_required
+    def get_dashboard(self):
+        """Get the current user's dashboard.
+
+        Returns:
+            DashboardForm
+        """
+        user = self.get_user()
+        p_key = ndb.Key(Profile, getUserId(user))
+
+        # Start all the reads before waiting for any of them
+        profile_future = p_key.get_async()
+        attending_future = _get_conferences_to_attend(profile_future)
+        created_future = Conference.query(ancestor = p_key).fetch_async(
+            DASHBOARD_MAX_ITEMS + 1)
+        wishlist_future = _get_sessions_in_wishlist(p_key)
+        announcement_text = announcement.get_announcement()
+
+        # Create profile if it does not exist yet (same as getProfile)
+        profile = profile_future.get_result()
+        if not profile:
+            profile = Profile(
+                key = p_key,
+                displayName = user.nickname(),
+                mainEmail = user.email(),
+                teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED))
+            profile.put()
+
+        attending, more_attending = attending_future.get_result()
+        created = created_future.get_result()
+        created_seats = ConferenceSeats.get_for_conferences(
+            created[:DASHBOARD_MAX_ITEMS])
+        sessions, more_sessions = wishlist_future.get_result()
+
+        return DashboardForm(
+            profile = profile.to_form(),
+            conferencesToAttend = attending,
+            conferencesCreated = [conf.to_form(profile.displayName, seats)
+                for conf, seats in zip(created, created_seats)],
+            sessionsInWishlist = sessions,
+            announcement = announcement_text,
+            moreConferencesToAttend = more_attending,
+            moreConferencesCreated = len(created) > DASHBOARD_MAX_ITEMS,
+            moreSessionsInWishlist = more_sessions)
+
+
+#------ Tasklets --------------------------------------------------------------
+
+@ndb.tasklet
+def _get_conferences_to_attend(profile_future):
+    """Get the first conferences the user is registered for, with their
+    organizers' names.
+
+    Returns:
+        Future of tuple (list of ConferenceForm, whether there are more)
+    """
+    profile = yield profile_future
+    websafe_keys = profile.conferenceKeysToAttend if profile else []
+    conf_keys = [ndb.Key(urlsafe = wsck) for wsck in websafe_keys[:DASHBOARD_MAX_ITEMS]]
+
+    # Conferences and organizers (parents) in a single batch, then seats
+    entities = yield ndb.get_multi_async(
+        conf_keys + [key.parent() for key in conf_keys])
+    confs = [conf for conf in entities[:len(conf_keys)] if conf]
+    names = {prof.key: prof.displayName for prof in entities[len(conf_keys):] if prof}
+    seats = yield ConferenceSeats.get_for_conferences_async(confs)
+
+    forms = [conf.to_form(names.get(conf.key.parent()), s)
+             for conf, s in zip(confs, seats)]
+    raise ndb.Return((forms, len(websafe_keys) > DASHBOARD_MAX_ITEMS))
+
+@ndb.tasklet
+def _get_sessions_in_wishlist(p_key):
+    """Get the first sessions in the user's wishlist.
+
+    Returns:
+        Future of tuple (list of SessionForm, whether there are more)
+    """
+    wishlist = yield get_wishlist_async(p_key)
+    session_keys = wishlist.sessionKeys
+    sessions = yield ndb.get_multi_async(session_keys[:DASHBOARD_MAX_ITEMS])
+
+    forms = [session.to_form() for session in sessions if session]
+    raise ndb.Return((forms, len(session_keys) > DASHBOARD_MAX_ITEMS))
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,88 @@
+"""Entity tags for conditional reads.
+
+Read endpoints return an `etag` with their response, computed from
+generation counters kept in memcache: one per conference, one per
+conference's sessions, and one per profile. Writes bump the counters of
+what they change. A client sends the etag back (as the `etag` parameter
+or an If-None-Match header), and if nothing changed gets a response with
+only the etag and `notModified` set, before the response is built or the
+datastore is read. (Endpoints does not pass 304 responses through, so
+this is a regular 200 response.)
+
+A missing (or evicted) counter starts from the current time in
+milliseconds, so it does not repeat a value that was handed out before.
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+GENERATION_PREFIX = "GENERATION:"
+
+
+def conference_generation(websafe_conference_key):
+    """Name of the generation counter of a conference."""
+    return "conference:" + websafe_conference_key
+
+def sessions_generation(websafe_conference_key):
+    """Name of the generation counter of the sessions of a conference."""
+    return "sessions:" + websafe_conference_key
+
+def profile_generation(user_id):
+    """Name of the generation counter of a profile."""
+    return "profile:" + user_id
+
+
+def get_etag(*names):
+    """Return the current etag for a set of generation counters.
+
+    Args:
+        names (strings): Generation counter names
+
+    Returns:
+        etag (string)
+    """
+    keys = [GENERATION_PREFIX + name for name in names]
+    generations = memcache.get_multi(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        initial = _initial_generation()
+        memcache.add_multi({key: initial for key in missing})
+        generations.update(memcache.get_multi(missing))
+    return ".".join("%x" % generations.get(key, 0) for key in keys)
+
+def bump_generation(*names):
+    """Increment generation counters, so their etags change.
+
+    Args:
+        names (strings): Generation counter names
+    """
+    memcache.offset_multi({GENERATION_PREFIX + name: 1 for name in names},
+        initial_value = _initial_generation())
+
+def check_etag(request_etag, *names):
+    """Compare the etag sent by a client with the current one.
+
+    Args:
+        request_etag (string): etag sent by the client (or None)
+        names (strings): Generation counter names
+
+    Returns:
+        Tuple (current etag to return with the response, True if it is
+        the etag sent by the client)
+    """
+    etag = get_etag(*names)
+    return (etag, bool(request_etag) and request_etag.strip('"') == etag)
+
+def request_etag(api, request):
+    """Return the etag sent with an API request.
+
+    Args:
+        api (remote.Service): API handling the request
+        request (Message): Request, with an `etag` field
+    """
+    return request.etag or api.request_state.headers.get("If-None-Match")
+
+
+def _initial_generation():
+    return int(time.time() * 1000)
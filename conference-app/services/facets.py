@@ -0,0 +1,106 @@
+"""Facet counts of conferences (by city, topic and month).
+
+Every (field, value) of a conference, and every combination of values of
+two fields (e.g. city and month), has a sharded counter (see
+services.counter) of the conferences with it, updated when conferences
+are created or updated. All facet counts are kept in a single memcache
+entry, updated incrementally, and rebuilt from the counters when missing;
+the recount_facets mapper corrects the counters from the conferences.
+"""
+
+import json
+from itertools import combinations
+from itertools import product
+
+from models.conference import ConferenceFacetForm
+from models.conference import ConferenceFacetForms
+from services import cache
+from services import counter
+
+FACET_FIELDS = ('city', 'month', 'topics')
+FACET_COUNTER_GROUP = "facets"
+FACET_COUNTER_PREFIX = "facet:"
+MEMCACHE_FACETS_KEY = "CONFERENCE_FACETS"
+FACETS_TTL = 10 * 60 # seconds before rebuilding from the counters
+FACETS_LOCAL_TTL = 5 # seconds an instance may serve its own copy
+
+
+def get_facets():
+    """Return the facet counts of all conferences.
+
+    Returns:
+        ConferenceFacetForms, by fields then by decreasing count
+    """
+    counts = cache.get_cached(MEMCACHE_FACETS_KEY, find_facets,
+        ttl = FACETS_TTL, local_ttl = FACETS_LOCAL_TTL) or {}
+    facets = sorted(((facet, count) for facet, count in counts.iteritems() if count > 0),
+                    key = lambda item: (len(item[0][0]), item[0][0], -item[1], item[0][1]))
+    return ConferenceFacetForms(items = [
+        ConferenceFacetForm(fields = list(fields), values = list(values), count = count)
+        for (fields, values), count in facets])
+
+
+def find_facets():
+    """Read the facet counts from the counters.
+
+    Returns:
+        dict (fields, values) -> count
+    """
+    return {_parse_counter(name): count for name, count in
+            counter.get_group_counts(FACET_COUNTER_GROUP).iteritems()}
+
+
+def conference_facets(conf):
+    """Return the facets of a conference.
+
+    Returns:
+        set of (fields, values) tuples, e.g. (('city',), ('London',)) or
+        (('city', 'month'), ('London', '6'))
+    """
+    values = {}
+    for field in FACET_FIELDS:
+        value = getattr(conf, field)
+        value = value if isinstance(value, list) else [value]
+        values[field] = sorted(set(unicode(v) for v in value if v))
+    facets = set()
+    for size in (1, 2):
+        for fields in combinations(FACET_FIELDS, size):
+            for combination in product(*[values[field] for field in fields]):
+                facets.add((fields, combination))
+    return facets
+
+
+def update_facets(old_facets, new_facets):
+    """Update the facet counts after a conference is created (with no old
+    facets) or updated.
+
+    Args:
+        old_facets (set): Facets of the conference before (see conference_facets)
+        new_facets (set): Facets of the conference after
+    """
+    deltas = dict.fromkeys(new_facets - old_facets, 1)
+    deltas.update(dict.fromkeys(old_facets - new_facets, -1))
+    if not deltas:
+        return
+    counter.increment_multi(
+        {facet_counter(facet): delta for facet, delta in deltas.iteritems()},
+        group = FACET_COUNTER_GROUP)
+
+    def update(counts):
+        for facet, delta in deltas.iteritems():
+            counts[facet] = counts.get(facet, 0) + delta
+        return counts
+
+    if cache.update_cached(MEMCACHE_FACETS_KEY, update) is None:
+        # Missing or contended: rebuild when next read
+        cache.delete_cached(MEMCACHE_FACETS_KEY)
+
+
+def facet_counter(facet):
+    """Name of the counter of a facet."""
+    return FACET_COUNTER_PREFIX + json.dumps(facet)
+
+
+def _parse_counter(name):
+    fields, values = json.loads(name[len(FACET_COUNTER_PREFIX):])
+    return (tuple(fields), tuple(values))
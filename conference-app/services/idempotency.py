@@ -0,0 +1,122 @@
+"""Stored responses of requests with idempotency keys.
+
+A client retrying a request (e.g. after a timeout) sends the same
+idempotency key, and gets the response of the first request instead of
+running it again. Responses are kept in memcache and, in case they are
+evicted, in the datastore, for RESULT_SECONDS.
+
+Before the first request runs, its key is reserved in a datastore
+transaction (and locked in memcache, to turn away most concurrent retries
+without a datastore read), so retries while it runs fail with a conflict.
+The response replaces the reservation when the request succeeds; failed
+requests delete it, so they can be retried. If a request dies in between
+(e.g. after its changes were saved), its key stays reserved until purged,
+so the operation is never run twice.
+"""
+
+import hashlib
+from datetime import datetime
+from datetime import timedelta
+
+from protorpc import protojson
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models.idempotency import IdempotentResult
+
+MEMCACHE_PREFIX = "IDEMPOTENT:"
+IN_PROGRESS = "IN_PROGRESS"
+
+# Seconds a response is kept, and the lock of a running request
+RESULT_SECONDS = 24 * 60 * 60
+LOCK_SECONDS = 60
+
+# Results deleted at a time when purging
+PURGE_BATCH = 500
+
+
+class RequestInProgress(Exception):
+    """A request with the same idempotency key is running."""
+
+
+def result_key(method, user_id, idempotency_key):
+    """Return the key (string) of a stored response."""
+    return hashlib.sha1("%s:%s:%s" % (method, user_id, idempotency_key)).hexdigest()
+
+
+def lookup(key, response_type):
+    """Return the stored response for a key, or None if there is none.
+
+    Raises:
+        RequestInProgress
+    """
+    encoded = memcache.get(MEMCACHE_PREFIX + key)
+    if encoded == IN_PROGRESS:
+        raise RequestInProgress()
+    if encoded is None:
+        stored = ndb.Key(IdempotentResult, key).get()
+        if not stored or stored.created < _cutoff():
+            return None
+        if stored.response is None:
+            # Reserved by a request that is running (or died)
+            raise RequestInProgress()
+        encoded = stored.response
+        memcache.set(MEMCACHE_PREFIX + key, encoded, time = RESULT_SECONDS)
+    return protojson.decode_message(response_type, encoded)
+
+
+def lock(key):
+    """Mark a request as running, reserving its key.
+
+    Raises:
+        RequestInProgress if it is already running (or has run)
+    """
+    if not memcache.add(MEMCACHE_PREFIX + key, IN_PROGRESS, time = LOCK_SECONDS):
+        raise RequestInProgress()
+    try:
+        _reserve(key)
+    except Exception:
+        memcache.delete(MEMCACHE_PREFIX + key)
+        raise
+
+
+@ndb.transactional()
+def _reserve(key):
+    stored = ndb.Key(IdempotentResult, key).get()
+    if stored and stored.created >= _cutoff():
+        raise RequestInProgress()
+    IdempotentResult(id = key).put()
+
+
+def release(key):
+    """Remove the reservation of a request that failed, so it can be
+    retried."""
+    ndb.Key(IdempotentResult, key).delete()
+    memcache.delete(MEMCACHE_PREFIX + key)
+
+
+def store(key, response):
+    """Store the response of a request, replacing its reservation."""
+    encoded = protojson.encode_message(response)
+    IdempotentResult(id = key, response = encoded).put()
+    memcache.set(MEMCACHE_PREFIX + key, encoded, time = RESULT_SECONDS)
+
+
+def purge_results():
+    """Delete expired responses from the datastore.
+
+    Returns:
+        Number of responses deleted
+    """
+    query = IdempotentResult.query(IdempotentResult.created < _cutoff())
+    purged = 0
+    while True:
+        keys = query.fetch(PURGE_BATCH, keys_only = True)
+        ndb.delete_multi(keys)
+        purged += len(keys)
+        if len(keys) < PURGE_BATCH:
+            return purged
+
+
+def _cutoff():
+    return datetime.utcnow() - timedelta(seconds = RESULT_SECONDS)
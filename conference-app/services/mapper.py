@@ -0,0 +1,466 @@
+"""Mapper framework for batch processing all entities of a kind.
+
+A mapper iterates over the results of a query in batches, applying its
+map() method to every entity, and writing back the returned entities
+with put_multi / delete_multi. Entities that are only rewritten as they
+are (e.g. to update their indexes) are returned by key instead, and are
+re-read and put in their own transactions, so changes committed since the
+batch was read are not lost. Each batch runs in its own task, and the
+job (see models.mapper.MapperJob) is checkpointed with the query cursor
+together with enqueuing the next task, so a failed task resumes from the
+last batch. Since a batch may be retried, map() should be idempotent.
+
+To add a mapper, subclass Mapper and add it to MAPPERS. Jobs can be
+started and monitored at /admin/mappers, or with start_mapper().
+"""
+
+import importlib
+import logging as log
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models.conference import Conference
+from models.conference import ConferenceSeats
+from models.mapper import MapperJob
+from models.profile import Profile
+from models.profile import TeeShirtSize
+from models.session import Session
+from models.wishlist import Wishlist
+from services import cache
+from services import capacity
+from services import counter
+from services import facets
+from services import search
+from services import swag
+from services.wishlist import MEMCACHE_MOST_WISHED_PREFIX
+from services.wishlist import _update_wishlist
+from services.wishlist import wishes_counter
+from services.wishlist import wishes_counter_group
+from tools.index_advisor import record_query_shape
+
+# Queue used for the mapper tasks (see queue.yaml)
+MAPPER_QUEUE = "mapper"
+MAPPER_TASK_URL = "/tasks/run_mapper"
+
+# Registered mappers: name -> dotted path of the Mapper subclass.
+# Classes are imported when a job runs, so mapper modules are not loaded
+# by request handlers that do not need them.
+MAPPERS = {
+    "reindex_conferences": "services.mapper.ReindexConferencesMapper",
+    "reindex_sessions": "services.mapper.ReindexSessionsMapper",
+    "migrate_wishlists": "services.mapper.MigrateWishlistsMapper",
+    "sweep_wishlists": "services.mapper.SweepWishlistsMapper",
+    "recount_wishes": "services.mapper.RecountWishesMapper",
+    "index_conferences": "services.mapper.IndexConferencesMapper",
+    "index_sessions": "services.mapper.IndexSessionsMapper",
+    "recount_facets": "services.mapper.RecountFacetsMapper",
+    "reconcile_capacity": "services.mapper.ReconcileCapacityMapper",
+    "tally_tee_shirts": "services.mapper.TallyTeeShirtsMapper",
+}
+
+
+#------ Mappers ---------------------------------------------------------------
+
+class Mapper(object):
+    """Base mapper.
+
+    Subclasses set KIND (or override query) and implement map().
+    The job parameters are available in self.params, and self.state is
+    a dict saved with every checkpoint, so it can be used to accumulate
+    results across batches.
+    """
+    KIND = None         # model class to iterate over
+    BATCH_SIZE = 100    # entities per batch
+    COUNTDOWN = 0       # seconds between batches (throttling)
+
+    def __init__(self, job):
+        self.job = job
+        self.params = job.params or {}
+        self.state = job.state or {}
+
+    def query(self):
+        """Return the query to iterate over."""
+        return self.KIND.query()
+
+    def map(self, entity):
+        """Process one entity.
+
+        Returns:
+            Tuple (list of entities to put, or keys of entities to rewrite
+            (see rewrite_async), list of keys to delete)
+        """
+        return ([], [])
+
+    def finish(self):
+        """Called after the last batch has been processed."""
+        pass
+
+
+class ReindexConferencesMapper(Mapper):
+    """Rewrite all conferences, e.g. to update their index entries after
+    changing which properties are indexed.
+
+    Conferences are rewritten in transactions, and keep their modified
+    time (so they are not synced again), unless they have none.
+    """
+    KIND = Conference
+
+    def map(self, entity):
+        return ([entity.key], [])
+
+
+class ReindexSessionsMapper(ReindexConferencesMapper):
+    """Rewrite all sessions (see ReindexConferencesMapper)."""
+    KIND = Session
+
+
+class MigrateWishlistsMapper(Mapper):
+    """Move wishlists created with allocated IDs to their fixed key
+    (see Wishlist.key_for), merging them if there are several.
+    """
+    KIND = Wishlist
+
+    def map(self, entity):
+        new_key = Wishlist.key_for(entity.key.parent())
+        if entity.key == new_key:
+            return ([], [])
+        wishlist = new_key.get() or Wishlist(key = new_key)
+        for session_key in entity.sessionKeys:
+            if session_key not in wishlist.sessionKeys:
+                wishlist.sessionKeys.append(session_key)
+        return ([wishlist], [entity.key])
+
+
+class SweepWishlistsMapper(Mapper):
+    """Remove sessions that no longer exist from all wishlists.
+
+    Wishlists are updated in a transaction (as by the API), so sessions
+    added while the mapper runs are not lost.
+    """
+    KIND = Wishlist
+    BATCH_SIZE = 20     # each wishlist reads all its sessions
+
+    def map(self, entity):
+        missing = [key for key, s in
+                   zip(entity.sessionKeys, ndb.get_multi(entity.sessionKeys)) if not s]
+        if missing and not self.job.dryRun:
+            _update_wishlist(entity.key.parent(), remove = missing)
+        return ([], [])
+
+
+class IndexConferencesMapper(Mapper):
+    """Add all conferences to the search index (see services.search),
+    e.g. to index conferences created before search, or after changing
+    how documents are split into terms.
+    """
+    KIND = Conference
+    BATCH_SIZE = 20     # each conference updates a posting per term
+
+    def map(self, entity):
+        if not self.job.dryRun:
+            search.index_entity(entity)
+        return ([], [])
+
+
+class IndexSessionsMapper(IndexConferencesMapper):
+    """Add all sessions to the search index (see IndexConferencesMapper)."""
+    KIND = Session
+
+
+class RecountWishesMapper(Mapper):
+    """Count from scratch the wishlists every session of a conference is in,
+    and reset the wishlist counters (see services.wishlist.count_wishes).
+
+    Params: websafeConferenceKey. Each session is counted with a query on
+    Wishlist.sessionKeys and its counter is set right away, so nothing is
+    accumulated in the job state; counters of sessions that no longer
+    exist are reset when done. Run it when wishlists are not being
+    changed, since changes made while it runs may be lost.
+    """
+    KIND = Session
+    BATCH_SIZE = 20     # each session runs a count query
+
+    def query(self):
+        return Session.query(ancestor = self._conference_key())
+
+    def map(self, entity):
+        count = Wishlist.query(Wishlist.sessionKeys == entity.key).count()
+        record_query_shape('Wishlist', equality=['sessionKeys'])
+        if not self.job.dryRun:
+            counter.set_count(wishes_counter(entity.key), count,
+                group = wishes_counter_group(entity.key.parent()))
+        return ([], [])
+
+    def finish(self):
+        if self.job.dryRun:
+            return
+        conference_key = self._conference_key()
+        group = wishes_counter_group(conference_key)
+        sessions = set(wishes_counter(key) for key in
+                       Session.query(ancestor = conference_key).iter(keys_only = True))
+        for name, count in counter.get_group_counts(group).iteritems():
+            if count and name not in sessions:
+                counter.set_count(name, 0, group = group)
+        cache.delete_cached(MEMCACHE_MOST_WISHED_PREFIX + conference_key.urlsafe())
+
+    def _conference_key(self):
+        return ndb.Key(urlsafe = self.params['websafeConferenceKey'])
+
+
+class RecountFacetsMapper(Mapper):
+    """Count the facets of all conferences from scratch, and reset the
+    facet counters (see services.facets).
+
+    Counts are accumulated in the job state (counter name -> count) and
+    written when done. Run it when conferences are not being changed,
+    since changes made while it runs may be lost.
+    """
+    KIND = Conference
+
+    def map(self, entity):
+        for facet in facets.conference_facets(entity):
+            name = facets.facet_counter(facet)
+            self.state[name] = self.state.get(name, 0) + 1
+        return ([], [])
+
+    def finish(self):
+        if self.job.dryRun:
+            return
+        # Counters of facets no conference has any more are reset too
+        counts = dict.fromkeys(
+            counter.get_group_counts(facets.FACET_COUNTER_GROUP), 0)
+        counts.update(self.state)
+        for name, count in counts.iteritems():
+            counter.set_count(name, count, group = facets.FACET_COUNTER_GROUP)
+        cache.delete_cached(facets.MEMCACHE_FACETS_KEY)
+
+
+class ReconcileCapacityMapper(Mapper):
+    """Count seats and registrations of all conferences from scratch, and
+    correct the capacity counters (see services.capacity) that drifted.
+
+    Counts are accumulated in the job state (counter name -> count) and
+    compared with the counters when done. Changes made while it runs may
+    be counted twice or lost until the next run.
+
+    Conferences created before seats had their own entity get their
+    ConferenceSeats (from the seat counts they still store), so they are
+    in the nearly sold out and fill rate queries.
+    """
+    KIND = Conference
+    BATCH_SIZE = 50     # each conference reads its seats
+
+    def map(self, entity):
+        seats = ConferenceSeats.key_for(entity.key).get()
+        if not seats:
+            seats = ConferenceSeats.for_conference(entity)
+            if not self.job.dryRun:
+                seats = _insert_seats(seats)
+        for name, count in capacity.capacity_counts(entity, seats).iteritems():
+            self.state[name] = self.state.get(name, 0) + count
+        return ([], [])
+
+    def finish(self):
+        current = counter.get_group_counts(capacity.CAPACITY_COUNTER_GROUP)
+        drifted = {name: self.state.get(name, 0)
+                   for name in set(current) | set(self.state)
+                   if current.get(name, 0) != self.state.get(name, 0)}
+        log.info("Capacity counters drifted: %s", drifted)
+        if self.job.dryRun:
+            return
+        for name, count in drifted.iteritems():
+            counter.set_count(name, count, group = capacity.CAPACITY_COUNTER_GROUP)
+        cache.delete_cached(capacity.MEMCACHE_CAPACITY_KEY)
+        cache.delete_cached(capacity.MEMCACHE_LEADERBOARD_KEY)
+
+
+class TallyTeeShirtsMapper(Mapper):
+    """Count the t-shirt sizes of the attendees of a conference from
+    scratch, and reset its t-shirt counters (see services.swag).
+
+    Params: websafeConferenceKey. Counts are accumulated in the job state
+    (size -> count), so only the profiles of one batch are in memory at
+    a time, and written when done.
+    """
+    KIND = Profile
+
+    def query(self):
+        return swag.attendees_query(self.params['websafeConferenceKey'])
+
+    def map(self, entity):
+        size = entity.teeShirtSize or 'NOT_SPECIFIED'
+        self.state[size] = self.state.get(size, 0) + 1
+        return ([], [])
+
+    def finish(self):
+        if self.job.dryRun:
+            return
+        wsck = self.params['websafeConferenceKey']
+        for size in TeeShirtSize:
+            counter.set_count(swag.tee_shirt_counter(wsck, size.name),
+                self.state.get(size.name, 0),
+                group = swag.tee_shirt_counter_group(wsck))
+
+
+#------ Running jobs ----------------------------------------------------------
+
+def get_mapper_class(name):
+    """Return the Mapper subclass registered with the given name.
+
+    Raises:
+        KeyError if there is no mapper with that name
+    """
+    module_name, class_name = MAPPERS[name].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def start_mapper(name, params=None, dry_run=False, batch_size=None, countdown=None):
+    """Start a new mapper job.
+
+    Args:
+        name (string): Name of the mapper (see MAPPERS)
+        params (dict): Parameters for the mapper (must be JSON serializable)
+        dry_run (bool): If True, map entities but do not write anything
+        batch_size (int): Entities per batch (default: mapper's BATCH_SIZE)
+        countdown (int): Seconds between batches (default: mapper's COUNTDOWN)
+
+    Returns:
+        MapperJob
+    """
+    mapper_class = get_mapper_class(name)
+    job = MapperJob(
+        name = name,
+        params = params or {},
+        state = {},
+        dryRun = dry_run,
+        batchSize = batch_size or mapper_class.BATCH_SIZE,
+        countdown = mapper_class.COUNTDOWN if countdown is None else countdown)
+    _checkpoint(job, 0)
+    log.info("Started mapper job: %s", job.summary())
+    return job
+
+
+def run_batch(job_key, batch):
+    """Process one batch of a mapper job, and enqueue the next one.
+
+    Args:
+        job_key (ndb.Key): MapperJob key
+        batch (int): Number of the batch to process. Batches that were
+            already processed (e.g. when a task is retried) are skipped.
+    """
+    job = job_key.get()
+    if not job or job.status != MapperJob.RUNNING or job.batches != batch:
+        log.info("Skipping batch %d of mapper job %s", batch, job_key.id())
+        return
+
+    mapper = get_mapper_class(job.name)(job)
+    cursor = Cursor(urlsafe = job.cursor) if job.cursor else None
+    entities, next_cursor, more = mapper.query().fetch_page(
+        job.batchSize, start_cursor = cursor)
+
+    to_put = []
+    to_delete = []
+    for entity in entities:
+        put, delete = mapper.map(entity)
+        to_put.extend(put)
+        to_delete.extend(delete)
+
+    if not job.dryRun:
+        to_rewrite = [e for e in to_put if isinstance(e, ndb.Key)]
+        to_put = [e for e in to_put if not isinstance(e, ndb.Key)]
+        if to_put:
+            ndb.put_multi(to_put)
+        if to_rewrite:
+            for future in [rewrite_async(key) for key in to_rewrite]:
+                future.get_result()
+        if to_delete:
+            ndb.delete_multi(to_delete)
+        to_put.extend(to_rewrite)
+
+    job.processed += len(entities)
+    job.updated += len(to_put)
+    job.deleted += len(to_delete)
+    job.batches += 1
+    more = more and next_cursor is not None
+    job.cursor = next_cursor.urlsafe() if more else None
+    if not more:
+        if job_key.get().status != MapperJob.RUNNING:
+            log.info("Mapper job %s was stopped, not finishing", job_key.id())
+            return
+        mapper.finish()
+        job.status = MapperJob.DONE
+    job.state = mapper.state
+    if not _checkpoint(job, job.batches if more else None):
+        log.info("Mapper job %s was stopped after batch %d", job_key.id(), batch)
+        return
+
+    if not more:
+        log.info("Finished mapper job: %s", job.summary())
+
+
+@ndb.transactional_tasklet()
+def rewrite_async(key):
+    """Re-read an entity and put it back as it is, in a transaction.
+
+    Computed properties and indexes are updated, and the modified time
+    of synced entities is kept (see models.tombstone.ModifiedProperty).
+
+    Returns:
+        Future of the entity (None if it was deleted)
+    """
+    entity = yield key.get_async()
+    if entity:
+        entity.keep_modified = True
+        yield entity.put_async()
+    raise ndb.Return(entity)
+
+
+@ndb.transactional
+def _insert_seats(seats):
+    """Put new ConferenceSeats, unless a registration put them first.
+
+    Returns:
+        ConferenceSeats as stored
+    """
+    stored = seats.key.get()
+    if stored:
+        return stored
+    seats.put()
+    return seats
+
+
+@ndb.transactional
+def abort_mapper(job_key):
+    """Stop a running mapper job after the current batch."""
+    job = job_key.get()
+    if job and job.status == MapperJob.RUNNING:
+        job.status = MapperJob.ABORTED
+        job.put()
+    return job
+
+
+@ndb.transactional
+def _checkpoint(job, next_batch):
+    """Save the job and enqueue its next batch (if any) atomically.
+
+    Returns:
+        False if the job is no longer running (e.g. it was aborted while
+        the batch ran), or the batch was checkpointed by another run of
+        the same task; nothing is saved or enqueued then
+    """
+    if job.key:
+        saved = job.key.get()
+        if (not saved or saved.status != MapperJob.RUNNING
+                or saved.batches != job.batches - 1):
+            return False
+    job.put()
+    if next_batch is not None:
+        taskqueue.add(
+            url = MAPPER_TASK_URL,
+            params = {'jobKey': job.key.urlsafe(), 'batch': next_batch},
+            queue_name = MAPPER_QUEUE,
+            countdown = job.countdown or 0,
+            transactional = True)
+    return True
@@ -0,0 +1,115 @@
+"""Email notifications.
+
+Conference confirmation emails go through a pull queue: creating
+a conference only adds a small task with the conference key, and a worker
+(run by cron every minute) leases tasks in batches, renders the emails from
+the stored conferences, and sends at most EMAILS_PER_RUN of them.
+"""
+
+import logging as log
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+# Pull queue with pending confirmation emails (see queue.yaml)
+CONFIRMATION_EMAIL_QUEUE = "confirmation-email"
+
+# Maximum number of emails sent per run of the worker
+EMAILS_PER_RUN = 50
+
+# Seconds the worker has to send a batch before tasks are leased again
+LEASE_SECONDS = 60
+
+# Seconds to remember sent emails, to avoid sending duplicates
+SENT_MEMORY_SECONDS = 24 * 60 * 60
+
+CONFIRMATION_EMAIL_TPL = """Hi, you have created the following conference:
+
+Name: %(name)s
+Description: %(description)s
+Topics: %(topics)s
+City: %(city)s
+Dates: %(startDate)s - %(endDate)s
+Max attendees: %(maxAttendees)s
+"""
+
+
+def enqueue_confirmation_email(conference_key):
+    """Add confirmation email for a new conference to the queue.
+
+    Args:
+        conference_key (ndb.Key)
+    """
+    taskqueue.Queue(CONFIRMATION_EMAIL_QUEUE).add(
+        taskqueue.Task(payload = conference_key.urlsafe(), method = 'PULL'))
+
+
+def send_confirmation_emails(max_emails=EMAILS_PER_RUN):
+    """Lease pending confirmation emails and send them.
+
+    Tasks for the same conference are sent only once. Tasks for emails that
+    fail to send are not deleted, so they are retried when the lease expires.
+
+    Args:
+        max_emails (int): Maximum number of tasks to process
+
+    Returns:
+        Number of emails sent
+    """
+    queue = taskqueue.Queue(CONFIRMATION_EMAIL_QUEUE)
+    tasks = queue.lease_tasks(LEASE_SECONDS, max_emails)
+    if not tasks:
+        return 0
+
+    # Group tasks by conference
+    tasks_by_key = {}
+    for task in tasks:
+        tasks_by_key.setdefault(task.payload, []).append(task)
+
+    # Get conferences and organizer profiles
+    conf_keys = [ndb.Key(urlsafe = wsck) for wsck in tasks_by_key]
+    confs = ndb.get_multi(conf_keys)
+    profiles = ndb.get_multi([key.parent() for key in conf_keys])
+
+    sender = 'noreply@%s.appspotmail.com' % app_identity.get_application_id()
+    sent = 0
+    done = []
+    for key, conf, prof in zip(conf_keys, confs, profiles):
+        wsck = key.urlsafe()
+        # Skip deleted conferences, and conferences already confirmed
+        sent_key = 'CONFIRMATION_SENT:' + wsck
+        if conf and not memcache.get(sent_key):
+            try:
+                mail.send_mail(
+                    sender,
+                    prof.mainEmail if prof else conf.organizerUserId,
+                    'You created a new Conference!',
+                    _render_confirmation_email(conf))
+            except Exception:
+                # The tasks are leased again when their lease expires
+                log.exception("Failed to send confirmation email for %s", wsck)
+                continue
+            # Only marked as sent once it was
+            memcache.set(sent_key, 1, time = SENT_MEMORY_SECONDS)
+            sent += 1
+        done.extend(tasks_by_key[wsck])
+
+    if done:
+        queue.delete_tasks(done)
+    return sent
+
+
+def _render_confirmation_email(conf):
+    """Render confirmation email body for a conference."""
+    return CONFIRMATION_EMAIL_TPL % {
+        'name': conf.name,
+        'description': conf.description or '',
+        'topics': ', '.join(conf.topics),
+        'city': conf.city or '',
+        'startDate': conf.startDate or '',
+        'endDate': conf.endDate or '',
+        'maxAttendees': conf.maxAttendees,
+    }
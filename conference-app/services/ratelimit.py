@@ -0,0 +1,84 @@
+"""Token bucket rate limiting, with buckets stored in memcache.
+
+Each bucket holds up to `requests` tokens and is refilled at `requests`
+tokens every `seconds`. To avoid a memcache round trip per request, an
+instance takes a small batch of tokens from the shared bucket at a time,
+and spends them locally for a short while. Unused local tokens expire,
+so an instance can never use more tokens than it took from the bucket.
+
+If memcache is unavailable or too contended, requests are allowed.
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+MEMCACHE_PREFIX = "RATE_LIMIT:"
+CAS_RETRIES = 3
+
+# Tokens taken from the shared bucket at a time: a fraction of the bucket
+# size, so that a few instances can not drain the bucket between them
+LOCAL_BATCH_FRACTION = 10
+LOCAL_BATCH_MAX = 20
+
+# Seconds an instance can keep unused tokens
+LOCAL_TOKENS_SECONDS = 1
+
+# Local tokens: bucket name -> (tokens, expires at)
+_local_tokens = {}
+
+
+def acquire(bucket, requests, seconds):
+    """Take a token from a bucket.
+
+    Args:
+        bucket (string): Bucket name
+        requests (int): Bucket size (requests allowed per period)
+        seconds (int): Period in seconds
+
+    Returns:
+        0 if a token was taken, or the number of seconds to wait before
+        a token is available.
+    """
+    now = time.time()
+    tokens, expires_at = _local_tokens.get(bucket, (0, 0))
+    if tokens > 0 and now < expires_at:
+        _local_tokens[bucket] = (tokens - 1, expires_at)
+        return 0
+
+    batch = min(max(1, requests // LOCAL_BATCH_FRACTION), LOCAL_BATCH_MAX)
+    taken, retry_after = _take_tokens(bucket, batch, requests, seconds, now)
+    if taken:
+        _local_tokens[bucket] = (taken - 1, now + LOCAL_TOKENS_SECONDS)
+        return 0
+    return retry_after
+
+
+def _take_tokens(bucket, batch, requests, seconds, now):
+    """Take up to `batch` tokens from the shared bucket in memcache.
+
+    Returns:
+        Tuple (tokens taken, seconds to wait if none were taken)
+    """
+    rate = float(requests) / seconds
+    key = MEMCACHE_PREFIX + bucket
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        state = client.gets(key)
+        if state is None:
+            # New (or evicted) bucket starts full
+            taken = min(batch, requests)
+            if client.add(key, (requests - taken, now), time = seconds):
+                return (taken, 0)
+            continue
+
+        tokens, updated = state
+        tokens = min(requests, tokens + (now - updated) * rate)
+        taken = min(batch, int(tokens))
+        if taken < 1:
+            return (0, max(1, int((1 - tokens) / rate + 0.999)))
+        if client.cas(key, (tokens - taken, now), time = seconds):
+            return (taken, 0)
+
+    # Too much contention (or memcache unavailable): let the request through
+    return (1, 0)
@@ -0,0 +1,281 @@
+import endpoints
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import ConflictException
+from models.conference import ConferenceSeats
+from models.profile import Profile
+from models.profile import TeeShirtSize
+from models.registration import GroupRegistrationMember
+from models.registration import GroupRegistrationResultForm
+from models.registration import PendingGroupRegistration
+from services import BaseService
+from services import announcement
+from services import capacity
+from services import swag
+from services import login_required
+from services import waitlist
+from services.etag import bump_generation
+from services.etag import conference_generation
+from services.etag import profile_generation
+
+# Maximum people registered in one request
+GROUP_MAX_EMAILS = 500
+
+# Profiles updated in parallel (each in its own transaction)
+GROUP_CHUNK_SIZE = 25
+
+# Seconds before settling a group registration from the profiles, if the
+# request that took the seats did not (well past the request deadline)
+SETTLE_COUNTDOWN = 10 * 60
+
+
+class RegistrationService(BaseService):
+    """Registration Service v0.1"""
+
+    @login_required
+    def register_group(self, websafe_conference_key, emails):
+        """Register a group of people for a conference. Open only to the
+        organizer of the conference.
+
+        Seats for the group (except people already registered) are taken
+        from the conference's ConferenceSeats in a single transaction. Then the profiles are
+        updated, in chunks of parallel transactions, and seats that were
+        not used are given back. If the request fails before that, a task
+        gives them back (see settle_group_registration).
+
+        Args:
+            websafe_conference_key (string)
+            emails (list of strings): Emails (user ids) of the people to
+                register; profiles are created for people without one
+
+        Returns:
+            GroupRegistrationResultForm
+
+        Raises:
+            endpoints.BadRequestException if there are too many emails
+            endpoints.ForbiddenException if the user is not the conference owner
+            models.ConflictException if there are not enough seats available
+        """
+        conference = self.get_conference(websafe_conference_key)
+        if self.get_user_id() != conference.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can register a group.')
+
+        if len(emails) > GROUP_MAX_EMAILS:
+            raise endpoints.BadRequestException(
+                "At most %d people can be registered at once" % GROUP_MAX_EMAILS)
+
+        # Ignore blanks and duplicates, keeping the order
+        unique = []
+        for address in emails:
+            address = (address or "").strip()
+            if address and address not in unique:
+                unique.append(address)
+        emails = unique
+
+        # People already registered do not need seats
+        result = GroupRegistrationResultForm(seatsReleased = 0)
+        profiles = ndb.get_multi([ndb.Key(Profile, email) for email in emails])
+        unregistered = []
+        for email, profile in zip(emails, profiles):
+            if _is_registered(profile, websafe_conference_key):
+                result.alreadyRegistered.append(email)
+            else:
+                unregistered.append(email)
+        emails = unregistered
+        if not emails:
+            return result
+
+        pending_key = _take_seats(conference, emails)
+
+        # Register profiles; stop at the first chunk with failures, as
+        # the next ones would probably fail as well
+        sizes = []
+        for start in range(0, len(emails), GROUP_CHUNK_SIZE):
+            chunk = emails[start:start + GROUP_CHUNK_SIZE]
+            if result.failed:
+                result.failed.extend(chunk)
+                continue
+            futures = [_register_profile(email, websafe_conference_key, pending_key)
+                       for email in chunk]
+            for email, future in zip(chunk, futures):
+                if future.get_exception():
+                    result.failed.append(email)
+                elif future.get_result():
+                    result.registered.append(email)
+                    sizes.append(future.get_result())
+                else:
+                    result.alreadyRegistered.append(email)
+
+        # A failed transaction may still have committed: check if the group
+        # registered them before giving back their seats
+        if result.failed:
+            failed = result.failed
+            result.failed = []
+            for email, profile in _registered_members(pending_key, failed):
+                if profile:
+                    result.registered.append(email)
+                    sizes.append(profile.teeShirtSize or 'NOT_SPECIFIED')
+                else:
+                    result.failed.append(email)
+
+        # Compensate: give back the seats that were not used
+        result.seatsReleased = len(emails) - len(result.registered)
+        seats = _give_back_seats(pending_key, conference, result.seatsReleased)
+        if seats:
+            _count_registrations(conference, seats, result.registered, sizes)
+        _delete_members(pending_key, result.registered)
+        return result
+
+
+def settle_group_registration(pending_key):
+    """Give back the seats of a group registration that its request did not
+    settle (e.g. because it failed), counting as used only the seats of
+    the people the group registered (not of those who registered by
+    themselves in the meantime). Used by the settle task.
+
+    Args:
+        pending_key (ndb.Key): PendingGroupRegistration key
+    """
+    pending = pending_key.get()
+    if not pending:
+        # Settled by the request
+        return
+    conference = _conference_key(pending_key).get()
+    registered = [profile for _, profile in
+                  _registered_members(pending_key, pending.emails) if profile]
+    seats = _give_back_seats(pending_key, conference,
+                             len(pending.emails) - len(registered))
+    if seats:
+        _count_registrations(conference, seats, [p.key.id() for p in registered],
+            [p.teeShirtSize or 'NOT_SPECIFIED' for p in registered])
+    _delete_members(pending_key, [p.key.id() for p in registered])
+
+
+def _is_registered(profile, websafe_conference_key):
+    return bool(profile) and websafe_conference_key in profile.conferenceKeysToAttend
+
+
+def _registered_members(pending_key, emails):
+    """Find which people a group registration registered.
+
+    Returns:
+        List of (email, Profile if registered by the group, else None)
+    """
+    member_keys = [GroupRegistrationMember.key_for(pending_key, email)
+                   for email in emails]
+    profile_keys = [ndb.Key(Profile, email) for email in emails]
+    entities = ndb.get_multi(member_keys + profile_keys)
+    members, profiles = entities[:len(emails)], entities[len(emails):]
+    return [(email, profile if member else None)
+            for email, member, profile in zip(emails, members, profiles)]
+
+
+def _delete_members(pending_key, emails):
+    """Delete the members of a settled group registration."""
+    ndb.delete_multi([GroupRegistrationMember.key_for(pending_key, email)
+                      for email in emails])
+
+
+def _conference_key(pending_key):
+    """Conference of a group registration. Its parent is the conference's
+    ConferenceSeats, or the conference itself if it was pending from
+    before seats had their own entity."""
+    parent = pending_key.parent()
+    if parent.kind() == ConferenceSeats._get_kind():
+        return ndb.Key(urlsafe = parent.id())
+    return parent
+
+
+def _count_registrations(conf, seats, emails, sizes):
+    """Update counters and generations after registering a group."""
+    wsck = conf.key.urlsafe()
+    capacity.add_registrations(conf, seats, len(emails))
+    swag.add_registrations(wsck, sizes)
+    bump_generation(conference_generation(wsck),
+        *[profile_generation(email) for email in emails])
+
+
+#------ Transactions ----------------------------------------------------------
+
+@ndb.transactional()
+def _take_seats(conference, emails):
+    """Take seats for a group from a conference, and record them as
+    pending until the group is settled (see _give_back_seats).
+
+    Returns:
+        PendingGroupRegistration key
+
+    Raises:
+        models.ConflictException if there are not enough seats available
+    """
+    count = len(emails)
+    seats = ConferenceSeats.get_for_conference(conference)
+    if seats.seatsAvailable < count or waitlist.has_waitlist(seats):
+        raise ConflictException(
+            "There are not enough seats available (%d requested)." % count)
+    nearly_sold_out = announcement.is_nearly_sold_out(seats)
+    seats.seatsAvailable -= count
+    seats.put()
+    pending_key = PendingGroupRegistration(
+        parent = seats.key, emails = emails).put()
+    taskqueue.add(
+        params = {'websafeKey': pending_key.urlsafe()},
+        url = '/tasks/settle_group_registration',
+        countdown = SETTLE_COUNTDOWN,
+        transactional = True)
+    if nearly_sold_out != announcement.is_nearly_sold_out(seats):
+        ndb.get_context().call_on_commit(
+            lambda: announcement.update_nearly_sold_out(conference, seats))
+    return pending_key
+
+# Cross-group only for registrations pending from before ConferenceSeats
+@ndb.transactional(xg = True)
+def _give_back_seats(pending_key, conference, count):
+    """Settle a group registration, giving back the seats that were taken
+    for it but not used.
+
+    Returns:
+        Updated ConferenceSeats, or None if the group was already settled
+    """
+    if not pending_key.get():
+        return None
+    pending_key.delete()
+    seats = ConferenceSeats.get_for_conference(conference)
+    if not count:
+        return seats
+    nearly_sold_out = announcement.is_nearly_sold_out(seats)
+    seats.seatsAvailable += count
+    seats.put()
+    if waitlist.has_waitlist(seats):
+        waitlist.schedule_promotion(conference.key)
+    if nearly_sold_out != announcement.is_nearly_sold_out(seats):
+        ndb.get_context().call_on_commit(
+            lambda: announcement.update_nearly_sold_out(conference, seats))
+    return seats
+
+@ndb.transactional_tasklet(xg = True)
+def _register_profile(email, websafe_conference_key, pending_key):
+    """Add a conference to a profile (created if it does not exist), and
+    record it as a member of the group registration.
+
+    Returns:
+        Future of the user's t-shirt size if registered, None if already
+        registered
+    """
+    p_key = ndb.Key(Profile, email)
+    profile = yield p_key.get_async()
+    if not profile:
+        profile = Profile(
+            key = p_key,
+            displayName = email.split("@")[0],
+            mainEmail = email,
+            teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED))
+    if websafe_conference_key in profile.conferenceKeysToAttend:
+        raise ndb.Return(None)
+    profile.conferenceKeysToAttend.append(websafe_conference_key)
+    member = GroupRegistrationMember(
+        key = GroupRegistrationMember.key_for(pending_key, email))
+    yield ndb.put_multi_async([profile, member])
+    raise ndb.Return(profile.teeShirtSize or 'NOT_SPECIFIED')
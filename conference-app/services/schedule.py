@@ -0,0 +1,166 @@
+"""Schedule conflict detection with interval indexes.
+
+An IntervalIndex holds the scheduled sessions (with date, start time and
+duration) sorted by start, with the longest duration among them, so the
+sessions overlapping a time range are found with a binary search for the
+sessions starting between (range start - longest duration) and range end:
+O(log n + k), where k is the number of sessions in that window.
+
+The index of each conference is cached in memcache, built from the
+sessions of the conference when missing, and updated in place when a
+session is created. The cached index may briefly miss a session (e.g. if
+it was rebuilt while the session was being stored), so the check done
+when storing a session uses an index of the sessions that could conflict
+with it, queried in the same transaction (see query_schedule and
+services.session._put_session).
+"""
+
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+from datetime import timedelta
+
+from models.session import Session
+from models.session import normalize_location
+from services import cache
+from tools.index_advisor import record_query_shape
+
+MEMCACHE_SCHEDULE_PREFIX = "SCHEDULE:"
+SCHEDULE_TTL = 60 * 60 # seconds before rebuilding from the datastore
+
+
+class IntervalIndex(object):
+    """Sessions sorted by start time, for overlap queries.
+
+    Entries are tuples (start, end, websafe session key, websafe speaker
+    key, location), with start and end as datetimes.
+    """
+
+    def __init__(self, sessions=()):
+        self.entries = sorted(filter(None, (session_interval(s) for s in sessions)))
+        self.starts = [entry[0] for entry in self.entries]
+        self.longest = max([end - start for start, end, _, _, _ in self.entries]
+                           or [timedelta(0)])
+
+    def add(self, session):
+        """Add a session (ignored if not scheduled, or already in)."""
+        entry = session_interval(session)
+        if not entry or entry in self.entries:
+            return
+        index = bisect_right(self.entries, entry)
+        self.entries.insert(index, entry)
+        self.starts.insert(index, entry[0])
+        self.longest = max(self.longest, entry[1] - entry[0])
+
+    def overlapping(self, start, end):
+        """Return the entries of the sessions overlapping [start, end)."""
+        low = bisect_right(self.starts, start - self.longest)
+        high = bisect_left(self.starts, end)
+        return [entry for entry in self.entries[low:high] if entry[1] > start]
+
+
+def session_interval(session):
+    """Return the IntervalIndex entry of a session, or None if the session
+    is not scheduled (no date, start time or duration)."""
+    if not (session.date and session.startTime and session.duration):
+        return None
+    start = datetime.combine(session.date, session.startTime)
+    return (start,
+            start + timedelta(minutes = session.duration),
+            session.key.urlsafe() if session.key else None,
+            session.speakerKey.urlsafe() if session.speakerKey else None,
+            normalize_location(session.location))
+
+
+#------ Conference schedules --------------------------------------------------
+
+def get_schedule(conference_key):
+    """Return the IntervalIndex of the sessions of a conference."""
+    schedule = cache.get_cached(
+        MEMCACHE_SCHEDULE_PREFIX + conference_key.urlsafe(),
+        lambda: build_schedule(conference_key),
+        ttl = SCHEDULE_TTL)
+    if schedule is None:
+        # Being rebuilt by another request for too long
+        schedule = build_schedule(conference_key)
+    return schedule
+
+
+def build_schedule(conference_key):
+    """Build the IntervalIndex of a conference from the datastore."""
+    return IntervalIndex(Session.query(ancestor = conference_key).fetch())
+
+
+def query_schedule(conference_key, session):
+    """Build an IntervalIndex of the sessions of a conference that could
+    conflict with a session: those with the same speaker or location,
+    from the day before it starts to the day it ends (sessions are assumed
+    to last less than a day).
+
+    Uses ancestor queries, so it can be called in a transaction.
+    Sessions stored before Session.normalizedLocation existed are only
+    found by location once rewritten (see the reindex_sessions mapper).
+    """
+    entry = session_interval(session)
+    if not entry:
+        return IntervalIndex()
+    start, end, _, speaker, location = entry
+    queries = []
+    if speaker:
+        queries.append(Session.query(
+            Session.speakerKey == session.speakerKey, ancestor = conference_key))
+        record_query_shape('Session', ancestor = True,
+            equality = ['speakerKey'], inequality = 'date')
+    if location:
+        queries.append(Session.query(
+            Session.normalizedLocation == location, ancestor = conference_key))
+        record_query_shape('Session', ancestor = True,
+            equality = ['normalizedLocation'], inequality = 'date')
+    futures = [query.filter(Session.date >= start.date() - timedelta(days = 1),
+                            Session.date <= end.date()).fetch_async()
+               for query in queries]
+    return IntervalIndex([s for future in futures for s in future.get_result()])
+
+
+def add_to_schedule(session):
+    """Add a new session to the cached IntervalIndex of its conference."""
+    key = MEMCACHE_SCHEDULE_PREFIX + session.key.parent().urlsafe()
+    def update(schedule):
+        schedule.add(session)
+        return schedule
+
+    if cache.update_cached(key, update) is None:
+        # Missing or contended: rebuild when next read
+        cache.delete_cached(key)
+
+
+def find_conflicts(conference_key, session, schedule=None):
+    """Find scheduled sessions of a conference with the same speaker or
+    location as a session, at an overlapping time.
+
+    Args:
+        conference_key (ndb.Key)
+        session (Session)
+        schedule (IntervalIndex): Sessions of the conference (default:
+            the cached schedule, see get_schedule)
+
+    Returns:
+        List of (websafe session key, reason) tuples, reason being
+        "speaker" or "location"
+    """
+    entry = session_interval(session)
+    if not entry or not (entry[3] or entry[4]):
+        return []
+    start, end, wssk, speaker, location = entry
+    if schedule is None:
+        schedule = get_schedule(conference_key)
+    conflicts = []
+    for _, _, other_wssk, other_speaker, other_location in \
+            schedule.overlapping(start, end):
+        if other_wssk == wssk:
+            continue
+        if speaker and other_speaker == speaker:
+            conflicts.append((other_wssk, "speaker"))
+        elif location and other_location == location:
+            conflicts.append((other_wssk, "location"))
+    return conflicts
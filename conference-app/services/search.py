@@ -0,0 +1,354 @@
+"""Full-text search over conferences and sessions with an inverted index.
+
+Documents (conferences: name, description and topics; sessions: name and
+highlights) are split into terms, and every term has a posting list of the
+keys of the documents containing it, per kind. Posting lists are stored in
+PostingShard entities, with documents spread over POSTING_SHARDS shards by
+a hash of their key. The terms each document was indexed under are kept
+too, so that reindexing a document only adds and removes what changed.
+
+Documents are indexed by a task after every write (schedule_indexing), so
+writes do not wait for the index, and searches may miss changes made in
+the last few seconds. Search results are checked against the documents
+when read, so deleted documents and stale postings are never returned.
+
+Tasks indexing the same document may run concurrently, and in any order.
+The terms of a document are replaced in a transaction, only if they come
+from a version (modified time) of the document at least as recent as the
+one indexed. Each posting shard is then updated in a transaction that
+reads the document's current terms, so whatever the order, the postings
+end up matching the terms of the latest version.
+
+The index storage is pluggable: DatastoreIndexStore is used by the app,
+MemoryIndexStore keeps everything in dicts (e.g. for tests).
+"""
+
+import re
+import zlib
+from bisect import bisect_right
+from datetime import datetime
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models.search import IndexedDocument
+from models.search import PostingShard
+from models.search import SearchKind
+from models.search import SearchOperator
+from models.search import SearchResultForm
+from models.search import SearchResultForms
+from services import BaseService
+
+POSTING_SHARDS = 8
+
+# Results per page of a search
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Terms of a query (more are ignored)
+MAX_QUERY_TERMS = 10
+
+# Words that are not indexed
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from in is it of on or that the this to
+    with
+""".split())
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Version of deleted documents, newer than any other
+DELETED_VERSION = datetime.max
+
+
+class SearchService(BaseService):
+    """Search Service v0.1"""
+
+    def search(self, query, kind=None, operator=None, page_token=None, page_size=None):
+        """Search conferences and sessions by keywords.
+
+        Args:
+            query (string): Keywords
+            kind (SearchKind): Kind of documents to search (default: all)
+            operator (SearchOperator): AND (default) to match documents
+                with all the keywords, OR to match documents with any
+            page_token (string): Token returned with the previous page
+            page_size (int): Results per page
+
+        Returns:
+            SearchResultForms
+        """
+        kinds = [kind.name.title()] if kind else ["Conference", "Session"]
+        page_size = min(page_size or SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+        entities, next_page_token = search(query, kinds,
+            match_all = operator != SearchOperator.OR,
+            page_token = page_token, page_size = page_size)
+        return SearchResultForms(
+            items = [SearchResultForm(
+                websafeKey = entity.key.urlsafe(),
+                kind = getattr(SearchKind, entity.key.kind().upper()),
+                name = entity.name) for entity in entities],
+            nextPageToken = next_page_token)
+
+
+#------ Terms -----------------------------------------------------------------
+
+def tokenize(text):
+    """Split text into terms (lowercase words of 2 or more characters,
+    except stop words).
+
+    Returns:
+        list of terms, in order of first appearance, without duplicates
+    """
+    terms = []
+    seen = set()
+    for word in _WORD_RE.findall((text or u"").lower()):
+        if len(word) > 1 and word not in STOP_WORDS and word not in seen:
+            seen.add(word)
+            terms.append(word)
+    return terms
+
+
+def document_terms(entity):
+    """Return the terms a conference or session is indexed under."""
+    if entity.key.kind() == "Conference":
+        texts = [entity.name, entity.description] + list(entity.topics or [])
+    else:
+        texts = [entity.name] + list(entity.highlights or [])
+    return tokenize(u" ".join(text for text in texts if text))
+
+
+#------ Index storage ---------------------------------------------------------
+
+class DatastoreIndexStore(object):
+    """Index stored in PostingShard and IndexedDocument entities."""
+
+    def get_document_terms(self, doc):
+        document = IndexedDocument.get_by_id(doc)
+        return document.terms if document else []
+
+    def replace_document_terms(self, doc, terms, version=None):
+        return _replace_document_terms(doc, terms, version)
+
+    def update_postings(self, kind, doc, add=(), remove=()):
+        # Shards are synced with the document's current terms, so adding
+        # and removing are done the same way
+        shard = _shard_of(doc)
+        for term in list(add) + list(remove):
+            _sync_posting_shard(_posting_id(kind, term, shard), doc, term)
+
+    def get_postings(self, kind, terms):
+        keys = [ndb.Key(PostingShard, _posting_id(kind, term, shard))
+                for term in terms for shard in range(POSTING_SHARDS)]
+        postings = {term: set() for term in terms}
+        for key, posting in zip(keys, ndb.get_multi(keys)):
+            if posting:
+                postings[key.id().split(" ")[1]].update(posting.keys)
+        return postings
+
+
+class MemoryIndexStore(object):
+    """Index stored in dicts, in the current process."""
+
+    def __init__(self):
+        self.documents = {}   # doc -> (terms, version)
+        self.postings = {}    # (kind, term) -> set of docs
+
+    def get_document_terms(self, doc):
+        return self.documents.get(doc, ([], None))[0]
+
+    def replace_document_terms(self, doc, terms, version=None):
+        old_terms, old_version = self.documents.get(doc, ([], None))
+        if _is_newer(old_version, version):
+            return None
+        self.documents[doc] = (list(terms), version)
+        return old_terms
+
+    def update_postings(self, kind, doc, add=(), remove=()):
+        for term in add:
+            self.postings.setdefault((kind, term), set()).add(doc)
+        for term in remove:
+            self.postings.get((kind, term), set()).discard(doc)
+
+    def get_postings(self, kind, terms):
+        return {term: set(self.postings.get((kind, term), ())) for term in terms}
+
+
+@ndb.transactional()
+def _replace_document_terms(doc, terms, version):
+    """Replace the terms a document is indexed under, unless a newer
+    version of it was indexed.
+
+    Returns:
+        The terms it was indexed under, or None if not replaced
+    """
+    document = IndexedDocument.get_by_id(doc) or IndexedDocument(id = doc)
+    if _is_newer(document.version, version):
+        return None
+    old_terms = list(document.terms)
+    document.terms = terms
+    document.version = version
+    document.put()
+    return old_terms
+
+@ndb.transactional(xg = True)
+def _sync_posting_shard(posting_id, doc, term):
+    """Add a document to a posting shard of a term, or remove it, depending
+    on whether it is currently indexed under the term."""
+    document = IndexedDocument.get_by_id(doc)
+    add = bool(document) and term in document.terms
+    posting = PostingShard.get_by_id(posting_id)
+    if add:
+        posting = posting or PostingShard(id = posting_id)
+        if doc not in posting.keys:
+            posting.keys.append(doc)
+            posting.put()
+    elif posting and doc in posting.keys:
+        posting.keys.remove(doc)
+        if posting.keys:
+            posting.put()
+        else:
+            posting.key.delete()
+
+
+def _posting_id(kind, term, shard):
+    # Terms are words, so they contain no spaces
+    return "%s %s %d" % (kind, term, shard)
+
+
+def _shard_of(doc):
+    return zlib.crc32(doc) % POSTING_SHARDS
+
+
+def _is_newer(indexed_version, version):
+    """Check if the indexed version of a document is newer than a version
+    (versions are None for documents never modified since `modified`
+    existed, older than any other)."""
+    return indexed_version is not None and (version is None or indexed_version > version)
+
+
+#------ Indexing --------------------------------------------------------------
+
+class SearchIndex(object):
+    """Inverted index of conferences and sessions."""
+
+    def __init__(self, store=None):
+        self.store = store or DatastoreIndexStore()
+
+    def index_document(self, kind, doc, terms, version=None):
+        """Index a document under the given terms (none to remove it),
+        unless a newer version of it was indexed.
+
+        Args:
+            kind (string): "Conference" or "Session"
+            doc (string): URL-safe key of the document
+            terms (list of string)
+            version (datetime): Modified time of the document the terms
+                are from (DELETED_VERSION if it was deleted)
+
+        Returns:
+            False if a newer version was indexed, True otherwise
+        """
+        new_terms = set(terms)
+        old_terms = self.store.replace_document_terms(doc, sorted(new_terms), version)
+        if old_terms is None:
+            return False
+        old_terms = set(old_terms)
+        self.store.update_postings(kind, doc,
+            add = new_terms - old_terms, remove = old_terms - new_terms)
+        return True
+
+    def search(self, kinds, terms, match_all=True):
+        """Find the documents containing all (or any) of the terms.
+
+        Args:
+            kinds (list of string): Kinds of documents to search
+            terms (list of string)
+            match_all (bool): True for documents containing all the terms,
+                False for documents containing any of them
+
+        Returns:
+            Sorted list of URL-safe keys
+        """
+        docs = set()
+        for kind in kinds:
+            postings = self.store.get_postings(kind, terms)
+            if match_all:
+                # Intersect starting from the shortest posting list
+                lists = sorted(postings.values(), key = len)
+                matches = set(lists[0]) if lists else set()
+                for posting in lists[1:]:
+                    matches.intersection_update(posting)
+                    if not matches:
+                        break
+            else:
+                matches = set().union(*postings.values())
+            docs.update(matches)
+        return sorted(docs)
+
+
+def index_entity(entity):
+    """Index a conference or session with the default index."""
+    SearchIndex().index_document(entity.key.kind(), entity.key.urlsafe(),
+                                 document_terms(entity), entity.modified)
+
+
+def index_key(key):
+    """Index the conference or session with the given key (or remove it
+    from the index if it does not exist). Used by the indexing task."""
+    entity = key.get()
+    if entity:
+        index_entity(entity)
+    else:
+        SearchIndex().index_document(key.kind(), key.urlsafe(), [],
+                                     DELETED_VERSION)
+
+
+def schedule_indexing(key):
+    """Index a conference or session in a task, once the current
+    transaction (if any) commits.
+
+    Args:
+        key (ndb.Key)
+    """
+    taskqueue.add(
+        params = {'websafeKey': key.urlsafe()},
+        url = '/tasks/index_document',
+        transactional = ndb.in_transaction())
+
+
+#------ Searching -------------------------------------------------------------
+
+def search(query, kinds, match_all=True, page_token=None,
+           page_size=SEARCH_PAGE_SIZE, index=None):
+    """Search conferences and sessions by keywords.
+
+    Args:
+        query (string): Keywords
+        kinds (list of string): Kinds of documents to search
+        match_all (bool): Whether documents must contain all the keywords
+        page_token (string): Token returned with the previous page, if any
+        page_size (int): Results per page
+        index (SearchIndex): Index to search (default: datastore index)
+
+    Returns:
+        Tuple (list of entities, next page token or None)
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return ([], None)
+    docs = (index or SearchIndex()).search(kinds, terms, match_all)
+
+    # Results are sorted by key, and the token is the last key of a page,
+    # so pages stay consistent when documents are indexed in between
+    start = bisect_right(docs, page_token) if page_token else 0
+    page = docs[start:start + page_size]
+    next_page_token = page[-1] if start + page_size < len(docs) else None
+
+    # Check the documents still match (postings may be stale)
+    entities = []
+    for entity in ndb.get_multi([ndb.Key(urlsafe = doc) for doc in page]):
+        if entity:
+            doc_terms = set(document_terms(entity))
+            if (all if match_all else any)(term in doc_terms for term in terms):
+                entities.append(entity)
+    return (entities, next_page_token)
@@ -6,17 +6,30 @@ from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
+from models import ConflictException
 from models.conference import Conference
 from models.session import Session
 from models.session import SessionForm
 from models.session import SessionForms
+from models.session import SessionResultForm
+from models.session import SessionResultForms
 from services import BaseService
+from services import decode_websafe_keys
+from services.agenda import AgendaService
 from services import login_required
+from services.etag import bump_generation
+from services.etag import check_etag
+from services.etag import sessions_generation
+from services.schedule import add_to_schedule
+from services.schedule import find_conflicts
+from services.schedule import query_schedule
+from services.search import schedule_indexing
 
 from models import QUERY_OPERATORS
 from models import OPERATOR_LOOKUP
 from models import QueryForms
 from models.session import QUERY_FIELDS
+from tools.index_advisor import record_query_shape
 
 
 class SessionService(BaseService):
@@ -35,6 +48,8 @@ class SessionService(BaseService):
 
         Raises:
             endpoints.ForbiddenException if the user is not the conference owner
+            models.ConflictException if the speaker or the location is
+                already booked at an overlapping time
         """
         # Get Conference object
         conference = self.get_conference(websafe_conference_key)
@@ -53,7 +68,18 @@ class SessionService(BaseService):
         # Create and store new session object
         session = Session.to_object(request)
         session.key = s_key # set the key since this is a new object
-        session.put()
+
+        # Check that the speaker and the location are free: first against
+        # the cached schedule (cheap, but may miss a session being created
+        # at the same time), then in the transaction that stores the session
+        _check_conflicts(find_conflicts(p_key, session))
+        _put_session(p_key, session)
+        add_to_schedule(session)
+        schedule_indexing(s_key)
+        bump_generation(sessions_generation(websafe_conference_key))
+
+        # Rebuild conference agenda - delegate to a task
+        AgendaService.schedule_rebuild(conference.key)
 
         # Check for featured speakers - delegate to a task
         if session.speakerKey:
@@ -66,15 +92,22 @@ class SessionService(BaseService):
         # Return form back
         return session.to_form()
 
-    def get_conference_sessions(self, websafe_conference_key):
+    def get_conference_sessions(self, websafe_conference_key, request_etag=None):
         """Given a conference, return all sessions.
 
         Args:
             websafe_conference_key (string)
+            request_etag (string): etag of the sessions the client has
 
         Returns:
-            SessionForms
+            SessionForms (only with the etag and notModified if the
+            sessions have not changed)
         """
+        etag, not_modified = check_etag(request_etag,
+            sessions_generation(websafe_conference_key))
+        if not_modified:
+            return SessionForms(etag = etag, notModified = True)
+
         # Get Conference object
         conference = self.get_conference(websafe_conference_key)
 
@@ -82,9 +115,40 @@ class SessionService(BaseService):
         sessions = Session.query(ancestor = conference.key)
 
         return SessionForms(
-            items = [s.to_form() for s in sessions]
+            items = [s.to_form() for s in sessions],
+            etag = etag
         )
 
+    def get_sessions_by_keys(self, websafe_session_keys):
+        """Given a list of session keys, return the sessions (with speaker
+        and conference names), in the same order.
+
+        Args:
+            websafe_session_keys (list of strings)
+
+        Returns:
+            SessionResultForms, with sessions that do not exist marked as
+            not found
+
+        Raises:
+            endpoints.BadRequestException if too many keys are requested
+        """
+        session_keys = decode_websafe_keys(websafe_session_keys, "Session")
+
+        # Get sessions, then their speakers and conferences, in batches
+        unique_keys = list(set(key for key in session_keys if key))
+        sessions = [s for s in ndb.get_multi(unique_keys) if s]
+        forms = dict(zip([s.key for s in sessions],
+                         hydrate_session_forms(sessions)))
+
+        # One result per requested key
+        items = []
+        for websafe_key, key in zip(websafe_session_keys, session_keys):
+            form = forms.get(key)
+            items.append(SessionResultForm(
+                websafeKey = websafe_key, found = form is not None, session = form))
+        return SessionResultForms(items = items)
+
     def get_conference_sessions_by_type(self, websafe_conference_key, type_of_session):
         """Given a conference, return all sessions of a specified type
         (e.g. lecture, keynote, workshop).
@@ -203,6 +267,7 @@ class SessionService(BaseService):
 
         # A single field with inequality filters is not a problem either
         # Include filters for the first field with inequalities filters
+        field = None
         if (len(inequality_fields) > 0):
             # Remove field and corresponding filters so they are not considered later
             field = inequality_fields.pop()
@@ -212,6 +277,12 @@ class SessionService(BaseService):
                 formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
                 q = q.filter(formatted_query)
         
+        # Record query shape for the index advisor
+        record_query_shape(q.kind,
+            equality=[filtr["field"] for filtr in equality_filters],
+            inequality=field,
+            ancestor=q.ancestor is not None)
+
         # Fetch results from NDB
         results = q.fetch()
 
@@ -296,3 +367,53 @@ class SessionService(BaseService):
                 equality_filters.append(filtr)
 
         return (equality_filters, inequality_filters, inequality_fields)
+
+
+#------ Utility functions -----------------------------------------------------
+
+@ndb.transactional()
+def _put_session(conference_key, session):
+    """Store a new session if the speaker and the location are free.
+
+    The sessions of the conference with the same speaker or location
+    around its date are read with ancestor queries in the transaction, so
+    sessions created at the same time in the same conference can not both
+    take the same speaker or location.
+
+    Raises:
+        models.ConflictException if the speaker or the location is
+            already booked at an overlapping time
+    """
+    _check_conflicts(find_conflicts(conference_key, session,
+                                    schedule = query_schedule(conference_key, session)))
+    session.put()
+
+
+def _check_conflicts(conflicts):
+    if conflicts:
+        raise ConflictException(
+            'The %s is already booked at that time (session %s).'
+            % (conflicts[0][1], conflicts[0][0]))
+
+
+def hydrate_session_forms(sessions):
+    """Convert sessions to forms with their speaker and conference names,
+    reading all the speakers and conferences in a single batch.
+
+    Args:
+        sessions (list of Session)
+
+    Returns:
+        list of SessionForm
+    """
+    keys = set(s.speakerKey for s in sessions if s.speakerKey)
+    keys.update(s.key.parent() for s in sessions)
+    names = {entity.key: entity.name for entity in ndb.get_multi(list(keys)) if entity}
+
+    forms = []
+    for session in sessions:
+        form = session.to_form()
+        form.speakerName = names.get(session.speakerKey)
+        form.conferenceName = names.get(session.key.parent())
+        forms.append(form)
+    return forms
@@ -1,5 +1,4 @@
 import endpoints
-from google.appengine.api import memcache
 from google.appengine.ext import ndb
 
 from models import ConflictException
@@ -7,13 +6,19 @@ from models import StringMessage
 from models.profile import Profile
 from models.session import Session
 from models.session import SessionForms
+from models.speaker import FEATURED_SPEAKER_ID
+from models.speaker import FeaturedSpeaker
 from models.speaker import Speaker
 from models.speaker import SpeakerForm
 from models.speaker import SpeakerForms
 from services import BaseService
+from services import cache
+from services.etag import check_etag
+from services.etag import sessions_generation
 from services import login_required
 
 MEMCACHE_FEATURED_SPEAKER_KEY = "MEMCACHE_FEATURED_SPEAKER_KEY"
+FEATURED_SPEAKER_LOCAL_TTL = 30 # seconds an instance may serve its own copy
 
 
 class SpeakerService(BaseService):
@@ -67,15 +72,23 @@ class SpeakerService(BaseService):
             items = [s.to_form() for s in speakers]
         )
 
-    def get_conference_speakers(self, websafe_conference_key):
+    def get_conference_speakers(self, websafe_conference_key, request_etag=None):
         """Given a conference, get the list of all speakers.
 
         Args:
             websafe_conference_key (string)
+            request_etag (string): etag of the speakers the client has
 
         Returns:
-            SpeakerForms
+            SpeakerForms (only with the etag and notModified if the
+            speakers have not changed)
         """
+        # Speakers are found through the sessions, and are never updated
+        etag, not_modified = check_etag(request_etag,
+            sessions_generation(websafe_conference_key))
+        if not_modified:
+            return SpeakerForms(etag = etag, notModified = True)
+
         # Get Conference object
         conference = self.get_conference(websafe_conference_key)
 
@@ -89,7 +102,8 @@ class SpeakerService(BaseService):
         speakers = ndb.get_multi(speaker_keys)
 
         return SpeakerForms(
-            items = [s.to_form() for s in speakers]
+            items = [s.to_form() for s in speakers],
+            etag = etag
         )
 
     def get_sessions_by_conference_speaker(self, websafe_speaker_key, websafe_conference_key):
@@ -120,17 +134,24 @@ class SpeakerService(BaseService):
     def get_featured_speaker(self):
         """Return featured speaker announcement from memcache.
 
+        If the announcement is missing or stale, only one request
+        recomputes it (see services.cache).
+
         Returns:
             Announcement message (string)
         """
-        return StringMessage(data = memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY) or "")
+        announcement = cache.get_cached(MEMCACHE_FEATURED_SPEAKER_KEY,
+            SpeakerService._compute_featured_speaker,
+            local_ttl = FEATURED_SPEAKER_LOCAL_TTL)
+        return StringMessage(data = announcement or "")
 
     @staticmethod
     def _cache_featured_speaker(websafe_speaker_key, websafe_conference_key):
         """Create featured speaker announcement & assign to memcache.
 
         Only adds an announcement if the speaker has more than one session
-        by the speaker at the conference.
+        by the speaker at the conference. Otherwise, the previous featured
+        speaker is kept.
 
         Args:
             websafe_speaker_key (string)
@@ -139,26 +160,60 @@ class SpeakerService(BaseService):
         Returns:
             Announcement message (string)
         """
-        # Get speaker
-        speaker = ndb.Key(urlsafe = websafe_speaker_key).get()
+        speaker_key = ndb.Key(urlsafe = websafe_speaker_key)
+        conference_key = ndb.Key(urlsafe = websafe_conference_key)
+        announcement = SpeakerService._format_featured_speaker(
+            speaker_key, conference_key)
+
+        if announcement:
+            # Remember the featured speaker, to recompute the announcement
+            FeaturedSpeaker(
+                id = FEATURED_SPEAKER_ID,
+                speakerKey = speaker_key,
+                conferenceKey = conference_key).put()
+            cache.set_cached(MEMCACHE_FEATURED_SPEAKER_KEY, announcement)
+            return announcement
+
+        return "Not a featured speaker..."
+
+    @staticmethod
+    def _compute_featured_speaker():
+        """Recompute the announcement for the last featured speaker.
+
+        Returns:
+            Announcement message (string)
+        """
+        featured = FeaturedSpeaker.get_by_id(FEATURED_SPEAKER_ID)
+        if not featured:
+            return ""
+        return SpeakerService._format_featured_speaker(
+            featured.speakerKey, featured.conferenceKey)
 
-        # Get conferenc e
-        conference = ndb.Key(urlsafe = websafe_conference_key).get()
+    @staticmethod
+    def _format_featured_speaker(speaker_key, conference_key):
+        """Format featured speaker announcement.
+
+        Args:
+            speaker_key (ndb.Key)
+            conference_key (ndb.Key)
+
+        Returns:
+            Announcement message (string), or empty string if the speaker
+            does not have more than one session at the conference
+        """
+        # Get speaker
+        speaker = speaker_key.get()
 
         # Get speaker sessions
-        q = Session.query(ancestor = conference.key)
-        sessions = q.filter(Session.speakerKey == speaker.key).fetch()
+        q = Session.query(ancestor = conference_key)
+        sessions = q.filter(Session.speakerKey == speaker_key).fetch()
 
         # Only feature if the speaker has more than on session
-        if len(sessions) > 1:
-            announcement = "Featured speaker: " + speaker.name
-            announcement += "\nSessions:"
-            for s in  sessions:
-                announcement += "\n- " + s.name
-            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, announcement)
-        else:
-            # TODO: For a real app, do not replace the previous speaker with this
-            announcement = "Not a featured speaker..."
-            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, announcement)
+        if not speaker or len(sessions) <= 1:
+            return ""
 
+        announcement = "Featured speaker: " + speaker.name
+        announcement += "\nSessions:"
+        for s in  sessions:
+            announcement += "\n- " + s.name
         return announcement
@@ -0,0 +1,77 @@
+"""T-shirt sizes of the attendees of each conference.
+
+Every conference has a sharded counter (see services.counter) per t-shirt
+size, updated when users register or unregister, and when attendees
+change their size. The tally_tee_shirts mapper counts the sizes of a
+conference from scratch, walking its attendees' profiles in batches, to
+start or correct the counters.
+"""
+
+from collections import Counter
+
+from models.profile import Profile
+from models.profile import TeeShirtSize
+from models.profile import TeeShirtSizeCountForm
+from models.profile import TeeShirtSizeCountForms
+from services import counter
+from tools.index_advisor import record_query_shape
+
+TEE_SHIRT_COUNTER_PREFIX = "teeShirt:"
+
+
+def get_tee_shirt_sizes(websafe_conference_key):
+    """Return the t-shirt sizes of the attendees of a conference.
+
+    Returns:
+        TeeShirtSizeCountForms, with the sizes that have attendees
+    """
+    names = {size: tee_shirt_counter(websafe_conference_key, size.name)
+             for size in TeeShirtSize}
+    counts = counter.get_counts(names.values())
+    return TeeShirtSizeCountForms(items = [
+        TeeShirtSizeCountForm(size = size, count = counts[names[size]])
+        for size in sorted(names, key = lambda size: size.number)
+        if counts[names[size]] > 0])
+
+
+def add_registrations(websafe_conference_key, sizes, delta=1):
+    """Count the t-shirts of users registered for a conference.
+
+    Args:
+        websafe_conference_key (string)
+        sizes (list of string): T-shirt sizes of the users
+        delta (int): 1 if registered, -1 if unregistered
+    """
+    if sizes:
+        counter.increment_multi(
+            {tee_shirt_counter(websafe_conference_key, size): delta * count
+             for size, count in Counter(sizes).iteritems()},
+            group = tee_shirt_counter_group(websafe_conference_key))
+
+
+def change_size(profile, old_size):
+    """Move a user's t-shirt from the old size to the current one in all
+    the conferences the user attends."""
+    if profile.teeShirtSize == old_size:
+        return
+    for wsck in profile.conferenceKeysToAttend:
+        counter.increment_multi({
+            tee_shirt_counter(wsck, old_size): -1,
+            tee_shirt_counter(wsck, profile.teeShirtSize): 1,
+        }, group = tee_shirt_counter_group(wsck))
+
+
+def attendees_query(websafe_conference_key):
+    """Query the profiles of the attendees of a conference."""
+    record_query_shape('Profile', equality=['conferenceKeysToAttend'])
+    return Profile.query(Profile.conferenceKeysToAttend == websafe_conference_key)
+
+
+def tee_shirt_counter(websafe_conference_key, size):
+    """Name of the counter of a t-shirt size for a conference."""
+    return "%s%s:%s" % (TEE_SHIRT_COUNTER_PREFIX, websafe_conference_key, size)
+
+
+def tee_shirt_counter_group(websafe_conference_key):
+    """Group of the t-shirt counters of a conference."""
+    return TEE_SHIRT_COUNTER_PREFIX + websafe_conference_key
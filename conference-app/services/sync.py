@@ -0,0 +1,243 @@
+"""Delta sync of conferences, sessions and speakers.
+
+Synced entities have an auto-updated `modified` timestamp, and deletions
+leave a Tombstone. A sync token encodes the time up to which a client has
+seen all changes, so each sync only returns entities modified (or deleted)
+since then. A conference is returned when either it or its seats (see
+ConferenceSeats) changed.
+
+Timestamps are set by the instance writing the entity, and global queries
+are eventually consistent, so a new token never goes beyond the current
+time minus SYNC_SAFETY_SECONDS. Entities changed within that window are
+sent again on the next sync, which clients handle by key.
+
+A full sync (from an empty token) lists every kind by key instead, since
+entities stored before `modified` existed are not in its index. Its token
+holds the time it started, the kind being listed and a query cursor; once
+all kinds are listed, the next sync is a delta sync from the time it
+started, so changes made during the full sync are sent again.
+"""
+
+import base64
+from datetime import datetime
+from datetime import timedelta
+
+import endpoints
+from google.appengine.api import datastore_errors
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models.conference import Conference
+from models.conference import ConferenceSeats
+from models.session import Session
+from models.speaker import Speaker
+from models.sync import ChangesForm
+from models.tombstone import Tombstone
+from services import BaseService
+
+# Seconds a change may take to become visible to queries
+SYNC_SAFETY_SECONDS = 5
+
+# Maximum entities of each kind returned by a single sync
+SYNC_MAX_CHANGES = 100
+
+# Days tombstones are kept (older tokens require a full resync)
+TOMBSTONE_RETENTION_DAYS = 30
+
+# Tombstones deleted at a time when purging
+TOMBSTONE_PURGE_BATCH = 500
+
+EPOCH = datetime(1970, 1, 1)
+
+# Kinds listed by a full sync, in order
+FULL_SYNC_MODELS = (Conference, Session, Speaker)
+
+
+class SyncService(BaseService):
+    """Sync Service v0.1"""
+
+    def get_changes_since(self, token):
+        """Return the entities changed or deleted since a sync token.
+
+        Args:
+            token (string): Token returned by the previous sync, or empty
+                to get all entities
+
+        Returns:
+            ChangesForm
+
+        Raises:
+            endpoints.BadRequestException if the token is invalid
+        """
+        full_sync = decode_full_sync_token(token) if token else (datetime.utcnow(), 0, None)
+        if full_sync:
+            return self._get_all(*full_sync)
+
+        since = decode_token(token)
+        now = datetime.utcnow()
+        if since < now - timedelta(days = TOMBSTONE_RETENTION_DAYS):
+            return ChangesForm(resync = True, token = "")
+
+        # Run the queries in parallel
+        futures = [model.query(model.modified >= since)
+                        .order(model.modified)
+                        .fetch_async(SYNC_MAX_CHANGES + 1)
+                   for model in (Conference, Session, Speaker, ConferenceSeats)]
+        futures.append(Tombstone.query(Tombstone.deleted >= since)
+                        .order(Tombstone.deleted)
+                        .fetch_async(SYNC_MAX_CHANGES + 1))
+        conferences, sessions, speakers, seats, tombstones = [
+            f.get_result() for f in futures]
+
+        # If a kind has more changes than fit in a response, the next sync
+        # starts from the last change returned for that kind
+        until = now - timedelta(seconds = SYNC_SAFETY_SECONDS)
+        more = False
+        for results, prop in ((conferences, 'modified'), (sessions, 'modified'),
+                              (speakers, 'modified'), (seats, 'modified'),
+                              (tombstones, 'deleted')):
+            if len(results) > SYNC_MAX_CHANGES:
+                del results[SYNC_MAX_CHANGES:]
+                until = min(until, getattr(results[-1], prop))
+                more = True
+
+        # Conferences whose seats changed
+        changed = set(conf.key for conf in conferences)
+        conferences.extend(conf for conf in ndb.get_multi(
+            [s.conferenceKey for s in seats if s.conferenceKey not in changed]) if conf)
+
+        return _changes_form(conferences, sessions, speakers,
+            deletedKeys = [tombstone.key.id() for tombstone in tombstones],
+            token = encode_token(max(since, until)),
+            more = more)
+
+    def _get_all(self, started, kind, cursor):
+        """Return a page of a full sync: the next entities of a kind, by key.
+
+        Args:
+            started (datetime): Time the full sync started
+            kind (int): Index of the kind being listed in FULL_SYNC_MODELS
+            cursor (Cursor): Query cursor in that kind, or None
+
+        Returns:
+            ChangesForm
+        """
+        model = FULL_SYNC_MODELS[kind]
+        entities, next_cursor, more = model.query().order(model.key).fetch_page(
+            SYNC_MAX_CHANGES, start_cursor = cursor)
+        done = False
+        if more and next_cursor:
+            token = encode_full_sync_token(started, kind, next_cursor)
+        elif kind + 1 < len(FULL_SYNC_MODELS):
+            token = encode_full_sync_token(started, kind + 1, None)
+        else:
+            # Listing is eventually consistent too
+            token = encode_token(started - timedelta(seconds = SYNC_SAFETY_SECONDS))
+            done = True
+        return _changes_form(
+            *[entities if m is model else [] for m in FULL_SYNC_MODELS],
+            token = token,
+            more = not done)
+
+    @staticmethod
+    def purge_tombstones():
+        """Delete tombstones older than the retention period.
+
+        Returns:
+            Number of tombstones deleted
+        """
+        cutoff = datetime.utcnow() - timedelta(days = TOMBSTONE_RETENTION_DAYS)
+        query = Tombstone.query(Tombstone.deleted < cutoff)
+        purged = 0
+        while True:
+            keys = query.fetch(TOMBSTONE_PURGE_BATCH, keys_only = True)
+            ndb.delete_multi(keys)
+            purged += len(keys)
+            if len(keys) < TOMBSTONE_PURGE_BATCH:
+                return purged
+
+
+#------ Utility functions -----------------------------------------------------
+
+def _changes_form(conferences, sessions, speakers, **kwargs):
+    """Return a ChangesForm of the given entities (with the seats and
+    organizer names of the conferences) and other fields."""
+    seats = ConferenceSeats.get_for_conferences(conferences)
+    organizers = ndb.get_multi(set(conf.key.parent() for conf in conferences))
+    names = {p.key: p.displayName for p in organizers if p}
+    return ChangesForm(
+        conferences = [conf.to_form(names.get(conf.key.parent()), s)
+            for conf, s in zip(conferences, seats)],
+        sessions = [session.to_form() for session in sessions],
+        speakers = [speaker.to_form() for speaker in speakers],
+        **kwargs)
+
+def _microseconds(timestamp):
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def _encode(payload):
+    return base64.urlsafe_b64encode(payload).rstrip("=")
+
+def _decode(token):
+    """Return the payload of a token, split on spaces.
+
+    Raises:
+        endpoints.BadRequestException if the token is invalid
+    """
+    try:
+        padding = "=" * (-len(token) % 4)
+        return base64.urlsafe_b64decode(str(token) + padding).split(" ")
+    except TypeError:
+        raise endpoints.BadRequestException("Invalid sync token: %s" % token)
+
+def encode_token(timestamp):
+    """Encode a sync token (opaque to clients) from a UTC datetime."""
+    return _encode(str(_microseconds(timestamp)))
+
+def decode_token(token):
+    """Decode a sync token into a UTC datetime.
+
+    Raises:
+        endpoints.BadRequestException if the token is invalid
+    """
+    try:
+        microseconds, = _decode(token)
+        return EPOCH + timedelta(microseconds = int(microseconds))
+    except (ValueError, OverflowError):
+        raise endpoints.BadRequestException("Invalid sync token: %s" % token)
+
+def encode_full_sync_token(started, kind, cursor):
+    """Encode the token of the next page of a full sync.
+
+    Args:
+        started (datetime): Time the full sync started (UTC)
+        kind (int): Index of the kind to list in FULL_SYNC_MODELS
+        cursor (Cursor): Query cursor in that kind, or None to start it
+    """
+    return _encode("%d %d %s" % (_microseconds(started), kind,
+                                 cursor.urlsafe() if cursor else ""))
+
+def decode_full_sync_token(token):
+    """Decode the token of a page of a full sync.
+
+    Returns:
+        Tuple (time it started, index of the kind, Cursor or None), or
+        None for the token of a delta sync
+
+    Raises:
+        endpoints.BadRequestException if the token is invalid
+    """
+    parts = _decode(token)
+    if len(parts) == 1:
+        return None
+    try:
+        microseconds, kind, cursor = parts
+        if not 0 <= int(kind) < len(FULL_SYNC_MODELS):
+            raise ValueError(kind)
+        return (EPOCH + timedelta(microseconds = int(microseconds)), int(kind),
+                Cursor(urlsafe = cursor) if cursor else None)
+    except (ValueError, OverflowError, datastore_errors.BadValueError):
+        raise endpoints.BadRequestException("Invalid sync token: %s" % token)
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,190 @@
+"""Waitlists of sold out conferences.
+
+Users registering for a sold out conference (or for one with users already
+waiting) join its waitlist, in order of arrival. When seats are freed, by
+unregistrations or a larger capacity, a task promotes waiting users in
+order, a batch per transaction, until there are no free seats or nobody
+waiting.
+
+The registration transactions keep ConferenceSeats.waitlistCount current,
+so they can tell if there is a waitlist without a query. The query for the
+waiting users is eventually consistent, so when it finds nobody while the
+count says otherwise, the task runs again a little later.
+"""
+
+import logging as log
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import ConflictException
+from models.conference import ConferenceSeats
+from models.profile import Profile
+from models.waitlist import WaitlistEntry
+from services import announcement
+from services import capacity
+from services import swag
+from services.etag import bump_generation
+from services.etag import conference_generation
+from services.etag import profile_generation
+from tools.index_advisor import record_query_shape
+
+# Users promoted per transaction: each one writes a profile and deletes an
+# entry, and cross-group transactions are limited to 25 entity groups
+WAITLIST_PROMOTE_BATCH = 10
+
+# Seconds before looking again for waiting users the waitlist query did not
+# see yet, and how many times (in a row, without promoting anybody)
+WAITLIST_RETRY_COUNTDOWN = 5
+WAITLIST_MAX_RETRIES = 10
+
+
+def has_waitlist(seats):
+    """Check if users are waiting for seats at a conference, given its
+    ConferenceSeats."""
+    return (seats.waitlistCount or 0) > 0
+
+
+def join_waitlist(seats, user_id):
+    """Put a user on the waitlist of a conference.
+
+    Must be called in the registration transaction, which writes the
+    ConferenceSeats afterwards.
+
+    Returns:
+        Position in the waitlist (int)
+
+    Raises:
+        ConflictException if the user is already on the waitlist
+    """
+    conference_key = seats.conferenceKey
+    entry_key = WaitlistEntry.key_for(conference_key, user_id)
+    if entry_key.get():
+        raise ConflictException(
+            "You are already on the waitlist for this conference")
+    WaitlistEntry(key = entry_key, conferenceKey = conference_key, userId = user_id).put()
+    seats.waitlistCount = (seats.waitlistCount or 0) + 1
+    return seats.waitlistCount
+
+
+def leave_waitlist(seats, user_id):
+    """Remove a user from the waitlist of a conference.
+
+    Must be called in the registration transaction, which writes the
+    ConferenceSeats afterwards.
+
+    Returns:
+        True if the user was on the waitlist
+    """
+    entry_key = WaitlistEntry.key_for(seats.conferenceKey, user_id)
+    if not entry_key.get():
+        return False
+    entry_key.delete()
+    seats.waitlistCount = max(0, (seats.waitlistCount or 0) - 1)
+    return True
+
+
+def schedule_promotion(conference_key, countdown = 0, retries = 0):
+    """Promote waiting users in a task, once the current transaction
+    (if any) commits.
+
+    Args:
+        conference_key (ndb.Key)
+        countdown (int): Seconds before running the task
+        retries (int): Times in a row the task found nobody waiting
+    """
+    taskqueue.add(
+        params = {'websafeConferenceKey': conference_key.urlsafe(),
+                  'retries': retries},
+        url = '/tasks/promote_waitlist',
+        countdown = countdown,
+        transactional = ndb.in_transaction())
+
+
+def promote_waitlist(conference_key, retries = 0):
+    """Register waiting users, in order, while there are free seats.
+
+    Used by the waitlist task. Each batch is promoted in its own
+    transaction; if there are more, another task is scheduled. If the
+    query finds nobody while the conference still counts users waiting
+    for free seats, their entries may not be visible to it yet, so the
+    task is scheduled again after WAITLIST_RETRY_COUNTDOWN seconds (up to
+    WAITLIST_MAX_RETRIES times).
+
+    Args:
+        conference_key (ndb.Key)
+        retries (int): Times in a row the task found nobody waiting
+
+    Returns:
+        Number of users promoted
+    """
+    entry_keys = WaitlistEntry.query(
+        WaitlistEntry.conferenceKey == conference_key
+    ).order(WaitlistEntry.joined).fetch(WAITLIST_PROMOTE_BATCH, keys_only = True)
+    record_query_shape('WaitlistEntry',
+        equality=['conferenceKey'], orders=['joined'])
+    conf = conference_key.get()
+    if not conf:
+        return 0
+    if not entry_keys:
+        seats = ConferenceSeats.get_for_conference(conf)
+        if has_waitlist(seats) and seats.seatsAvailable > 0:
+            if retries < WAITLIST_MAX_RETRIES:
+                schedule_promotion(conference_key,
+                    countdown = WAITLIST_RETRY_COUNTDOWN, retries = retries + 1)
+            else:
+                log.warning("No waitlist entries found for conference %s, "
+                            "which counts %d users waiting",
+                            conference_key.urlsafe(), seats.waitlistCount)
+        return 0
+    promoted, seats = _promote_batch(conf, entry_keys)
+    if promoted:
+        capacity.add_registrations(conf, seats, len(promoted))
+        swag.add_registrations(conference_key.urlsafe(),
+                               [p.teeShirtSize for p in promoted])
+    return len(promoted)
+
+
+@ndb.transactional(xg = True)
+def _promote_batch(conf, entry_keys):
+    """Register the users of a batch of waitlist entries, in order.
+
+    Only the seats of the conference are read and written in the
+    transaction, not the conference itself.
+
+    Returns:
+        Tuple (profiles of the users promoted, updated ConferenceSeats)
+    """
+    conference_key = conf.key
+    seats = ConferenceSeats.get_for_conference(conf)
+    nearly_sold_out = announcement.is_nearly_sold_out(seats)
+
+    # Entries may have been removed since the (non transactional) query
+    entries = [e for e in ndb.get_multi(entry_keys) if e]
+    entries = entries[:max(0, seats.seatsAvailable or 0)]
+    if not entries:
+        return ([], seats)
+    profiles = ndb.get_multi([ndb.Key(Profile, e.userId) for e in entries])
+
+    wsck = conference_key.urlsafe()
+    promoted = []
+    for profile in profiles:
+        if profile and wsck not in profile.conferenceKeysToAttend:
+            profile.conferenceKeysToAttend.append(wsck)
+            promoted.append(profile)
+    seats.seatsAvailable -= len(promoted)
+    seats.waitlistCount = max(0, (seats.waitlistCount or 0) - len(entries))
+    ndb.put_multi(promoted + [seats])
+    ndb.delete_multi([e.key for e in entries])
+
+    # More to promote: continue in another task
+    if seats.seatsAvailable > 0 and has_waitlist(seats):
+        schedule_promotion(conference_key)
+
+    ndb.get_context().call_on_commit(lambda: bump_generation(
+        conference_generation(wsck),
+        *[profile_generation(p.key.id()) for p in promoted]))
+    if nearly_sold_out != announcement.is_nearly_sold_out(seats):
+        ndb.get_context().call_on_commit(
+            lambda: announcement.update_nearly_sold_out(conf, seats))
+    return (promoted, seats)
@@ -1,98 +1,313 @@
+import endpoints
 from google.appengine.ext import ndb
 
+import settings
 from models import ConflictException
 from models.profile import Profile
 from models.session import SessionForms
+from models.wishlist import SessionConflictForm
+from models.wishlist import SessionConflictForms
+from models.wishlist import SessionPopularityForm
+from models.wishlist import SessionPopularityForms
 from models.wishlist import Wishlist
 from models.wishlist import WishlistForm
 from services import BaseService
+from services import cache
+from services import counter
+from services import decode_websafe_key
 from services import login_required
+from services.schedule import IntervalIndex
+from services.session import hydrate_session_forms
+
+# Sessions in the "most wished" ranking of a conference
+MOST_WISHED_SIZE = 10
+MEMCACHE_MOST_WISHED_PREFIX = "MOST_WISHED:"
+MOST_WISHED_TTL = 60 * 60 # seconds before recomputing from the counters
 
 
 class WishlistService(BaseService):
-    """Wishlist Service v0.1"""
+    """Wishlist Service v0.1
+
+    The wishlist of a user is a single entity with a fixed key under the
+    user's profile, so it is read with a get, and only written (created
+    if needed) when sessions are added or removed.
+
+    The number of wishlists each session is in is kept in a sharded
+    counter, and the most wished sessions of each conference in memcache.
+    """
 
     @login_required
     def add_session_to_wishlist(self, websafe_session_key):
-        """Add a session to the user's wishlist.
+        """Add a session to the user's wishlist (if not already in it).
 
         Args:
             websafe_session_key (string)
 
         Returns:
             WishlistForm with the updated wishlist
-        """
-        # Get user wishlist
-        wishlist = self._get_user_wish_list()
-
-        # Check that session is not already in the list
-        session_key = ndb.Key(urlsafe = websafe_session_key)
-        if session_key in wishlist.sessionKeys:
-            raise ConflictException("Session already in wishlist")
-
-        # Add session to list
-        wishlist.sessionKeys.append(session_key)
-        wishlist.put()
 
-        # Return list of session keys
+        Raises:
+            endpoints.NotFoundException if the session key is invalid
+            models.ConflictException if the wishlist is full
+        """
+        session_key = self._get_session_key(websafe_session_key)
+        wishlist, added, _ = _update_wishlist(self._get_profile_key(), add = session_key)
+        if added:
+            count_wishes(added, 1)
         return wishlist.to_form()
 
     @login_required
     def delete_session_in_wishlist(self, websafe_session_key):
-        """Remove a session from the user's wishlist.
+        """Remove a session from the user's wishlist (if in it).
 
         Args:
             websafe_session_key (string)
 
         Returns:
             WishlistForm with the updated wishlist
-        """
-        # Get user wishlist
-        wishlist = self._get_user_wish_list()
-
-        # Check that session is not already in the list
-        session_key = ndb.Key(urlsafe = websafe_session_key)
-        if session_key not in wishlist.sessionKeys:
-            raise ConflictException("Session not in wishlist")
 
-        # Delete session from list
-        wishlist.sessionKeys.remove(session_key)
-        wishlist.put()
-
-        # Return list of session keys
+        Raises:
+            endpoints.NotFoundException if the session key is invalid
+        """
+        session_key = self._get_session_key(websafe_session_key)
+        wishlist, _, removed = _update_wishlist(self._get_profile_key(), remove = [session_key])
+        for s_key in removed:
+            count_wishes(s_key, -1)
         return wishlist.to_form()
 
     @login_required
-    def get_sessions_in_wishlist(self):
+    def get_sessions_in_wishlist(self, hydrate=False):
         """Get list of sessions in users's wishlist.
 
+        Sessions that no longer exist are removed from the wishlist.
+
+        Args:
+            hydrate (bool): If True, include speaker and conference names
+
         Returns:
             SessionForms with all the sessions in the wishlist
         """
         # Get user wishlist
-        wishlist = self._get_user_wish_list()
+        p_key = self._get_profile_key()
+        wishlist = get_wishlist_async(p_key).get_result()
 
         # Get sessions in wishlist
         sessions = ndb.get_multi(wishlist.sessionKeys)
 
+        # Drop deleted sessions from the stored wishlist (their counters
+        # are not needed any more)
+        missing = [key for key, s in zip(wishlist.sessionKeys, sessions) if not s]
+        if missing:
+            _update_wishlist(p_key, remove = missing)
+        sessions = [s for s in sessions if s]
+
         # Return list of session
+        if hydrate:
+            return SessionForms(items = hydrate_session_forms(sessions))
         return SessionForms(
             items = [s.to_form() for s in sessions]
         )
 
-    def _get_user_wish_list(self):
-        """Get user wishlist (creates a new empty list if it does not exist)."""
+    @login_required
+    def get_wishlist_conflicts(self):
+        """Get the pairs of sessions in the user's wishlist that take place
+        at overlapping times (in any conference).
+
+        Returns:
+            SessionConflictForms, by start time of the first session
+        """
+        wishlist = get_wishlist_async(self._get_profile_key()).get_result()
+        sessions = {s.key.urlsafe(): s
+                    for s in ndb.get_multi(wishlist.sessionKeys) if s}
+
+        # Find the sessions overlapping each one, and report each pair once
+        schedule = IntervalIndex(sessions.values())
+        conflicts = []
+        for start, end, wssk, _, _ in schedule.entries:
+            for _, _, other_wssk, _, _ in schedule.overlapping(start, end):
+                if other_wssk > wssk:
+                    conflicts.append(SessionConflictForm(
+                        first = sessions[wssk].to_form(),
+                        second = sessions[other_wssk].to_form()))
+        return SessionConflictForms(items = conflicts)
+
+    @login_required
+    def get_most_wished_sessions(self, websafe_conference_key):
+        """Get the sessions of a conference that are in most wishlists.
+        Open only to the organizer of the conference.
+
+        Args:
+            websafe_conference_key (string)
+
+        Returns:
+            SessionPopularityForms, most wished first (at most MOST_WISHED_SIZE)
+
+        Raises:
+            endpoints.NotFoundException if the conference does not exist
+            endpoints.ForbiddenException if the user is not the conference owner
+        """
+        conference = self.get_conference(websafe_conference_key)
+        if self.get_user_id() != conference.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the most wished sessions.')
+
+        ranking = get_most_wished(conference.key)
+        sessions = ndb.get_multi([ndb.Key(urlsafe = wssk) for wssk, _ in ranking])
+        return SessionPopularityForms(items = [
+            SessionPopularityForm(session = s.to_form(), wishlistCount = count)
+            for s, (_, count) in zip(sessions, ranking) if s])
+
+    def _get_profile_key(self):
+        """Get key of the user's profile (parent of the wishlist)."""
+        return ndb.Key(Profile, self.get_user_id())
+
+    def _get_session_key(self, websafe_session_key):
+        """Decode session key.
+
+        Raises:
+            endpoints.NotFoundException
+        """
+        session_key = decode_websafe_key(websafe_session_key, "Session")
+        if not session_key:
+            raise endpoints.NotFoundException(
+                'No session found with key: %s' % websafe_session_key)
+        return session_key
+
+
+#------ Wishlist access -------------------------------------------------------
+
+@ndb.tasklet
+def get_wishlist_async(p_key):
+    """Get a user's wishlist, without creating it.
+
+    Wishlists created before they had a fixed key are found with an
+    ancestor query, until moved by the migrate_wishlists mapper (see
+    settings.WISHLIST_LEGACY_LOOKUP).
+
+    Args:
+        p_key (ndb.Key): Profile key
+
+    Returns:
+        Future of Wishlist (new and unsaved if the user has none)
+    """
+    wishlist = yield Wishlist.key_for(p_key).get_async()
+    if not wishlist and settings.WISHLIST_LEGACY_LOOKUP:
+        wishlist = yield Wishlist.query(ancestor = p_key).get_async()
+    raise ndb.Return(wishlist or Wishlist(key = Wishlist.key_for(p_key)))
+
+@ndb.transactional()
+def _update_wishlist(p_key, add=None, remove=()):
+    """Add a session to, or remove sessions from, a user's wishlist.
+
+    Writes nothing if the wishlist does not change. A wishlist without a
+    fixed key is moved to it.
+
+    Returns:
+        Tuple (Wishlist, session key added or None, set of session keys removed)
+    """
+    wishlist = get_wishlist_async(p_key).get_result()
+    session_keys = set(wishlist.sessionKeys)
+    changed = wishlist.key != Wishlist.key_for(p_key)
+
+    added = None
+    if add and add not in session_keys:
+        if len(session_keys) >= settings.WISHLIST_MAX_SESSIONS:
+            raise ConflictException(
+                "Wishlist is full (at most %d sessions)" % settings.WISHLIST_MAX_SESSIONS)
+        wishlist.sessionKeys.append(add)
+        added = add
+        changed = True
+    removed = session_keys.intersection(remove)
+    if removed:
+        wishlist.sessionKeys = [key for key in wishlist.sessionKeys if key not in removed]
+        changed = True
+
+    if changed:
+        if wishlist.key != Wishlist.key_for(p_key):
+            wishlist.key.delete()
+            wishlist = Wishlist(key = Wishlist.key_for(p_key),
+                                sessionKeys = wishlist.sessionKeys)
+        wishlist.put()
+    return (wishlist, added, removed)
+
+
+#------ Popularity ------------------------------------------------------------
+
+def wishes_counter(session_key):
+    """Name of the counter of wishlists a session is in."""
+    return "wishlist:" + session_key.urlsafe()
+
+def wishes_counter_group(conference_key):
+    """Group of the wishlist counters of the sessions of a conference."""
+    return "wishlist:" + conference_key.urlsafe()
+
+def count_wishes(session_key, delta):
+    """Update the wishlist counter of a session, and the most wished
+    sessions of its conference.
+
+    Called after the wishlist is saved, so a failure here leaves the
+    counter short (see the recount_wishes mapper).
+
+    Args:
+        session_key (ndb.Key)
+        delta (int): 1 if added to a wishlist, -1 if removed
+    """
+    conference_key = session_key.parent()
+    name = wishes_counter(session_key)
+    counter.increment(name, delta, group = wishes_counter_group(conference_key))
+    update_most_wished(conference_key, session_key.urlsafe(),
+                       counter.get_count(name), delta)
+
+def get_most_wished(conference_key):
+    """Return the most wished sessions of a conference.
+
+    Returns:
+        List of (websafe session key, count), most wished first
+    """
+    return cache.get_cached(
+        MEMCACHE_MOST_WISHED_PREFIX + conference_key.urlsafe(),
+        lambda: find_most_wished(conference_key),
+        ttl = MOST_WISHED_TTL, default = [])
+
+def find_most_wished(conference_key):
+    """Compute the most wished sessions of a conference from the counters.
+
+    Returns:
+        List of (websafe session key, count), most wished first
+    """
+    prefix = len("wishlist:")
+    counts = counter.get_group_counts(wishes_counter_group(conference_key))
+    return _rank((name[prefix:], count) for name, count in counts.iteritems())
+
+def update_most_wished(conference_key, wssk, count, delta):
+    """Update the cached most wished sessions of a conference with the new
+    count of one session.
 
-        # Get list
-        user_id = self.get_user_id()
-        p_key = ndb.Key(Profile, user_id)
-        wishlist = Wishlist.query(ancestor = p_key).get()
+    Sessions outside the ranking are never wished more than the last one
+    in it (or the ranking would be shorter than MOST_WISHED_SIZE), so
+    the ranking can be updated in place, except when a session in it
+    falls below the last one: then it is recomputed when next read.
+    """
+    key = MEMCACHE_MOST_WISHED_PREFIX + conference_key.urlsafe()
+    stale = []
+    def update(ranking):
+        counts = dict(ranking)
+        if delta < 0 and wssk in counts and len(ranking) >= MOST_WISHED_SIZE \
+                and count < ranking[-1][1]:
+            stale.append(True)
+            return ranking
+        if wssk in counts or (count > 0 and (len(ranking) < MOST_WISHED_SIZE
+                                             or count > ranking[-1][1])):
+            counts[wssk] = count
+        return _rank(counts.iteritems())
 
-        # Init list if it does not exist
-        if not wishlist:
-            wl_id = Wishlist.allocate_ids(size = 1, parent = p_key)[0]
-            wl_key = ndb.Key(Wishlist, wl_id, parent = p_key)
-            wishlist = Wishlist(key = wl_key)
-            wishlist.put()
+    if cache.update_cached(key, update) is None or stale:
+        # Missing, contended or not known: recompute when next read
+        cache.delete_cached(key)
 
-        return wishlist
+def _rank(counts):
+    """Sort (websafe session key, count) pairs, most wished first, and keep
+    the first MOST_WISHED_SIZE with a count."""
+    ranking = sorted(((wssk, count) for wssk, count in counts if count > 0),
+                     key = lambda item: (-item[1], item[0]))
+    return ranking[:MOST_WISHED_SIZE]
@@ -23,3 +23,10 @@ ANDROID_AUDIENCE = WEB_CLIENT_ID
 ALLOWED_CLIENT_IDS = [WEB_CLIENT_ID, endpoints.API_EXPLORER_CLIENT_ID, ANDROID_CLIENT_ID, IOS_CLIENT_ID]
 AUDIENCES = [ANDROID_AUDIENCE]
 SCOPES = [endpoints.EMAIL_SCOPE]
+
+# Maximum number of sessions in a user's wishlist
+WISHLIST_MAX_SESSIONS = 100
+
+# Look up wishlists created before they had a fixed key (ancestor query on
+# every miss). Set to False once the migrate_wishlists mapper is done.
+WISHLIST_LEGACY_LOOKUP = True
@@ -76,6 +76,39 @@ app.constant('HTTP_ERRORS', {
 });
 
 
+/**
+ * @ngdoc service
+ * @name conditionalGet
+ *
+ * @description
+ * Calls a read method of the API with the etag of the last response received
+ * for the same parameters, and reuses that response if the server answers
+ * that it has not been modified (a response with only the etag and
+ * notModified set).
+ *
+ */
+app.factory('conditionalGet', function () {
+    var responses = {};
+
+    return function (api, method, params, callback) {
+        var cacheKey = api + '.' + method + ':' + angular.toJson(params);
+        var cached = responses[cacheKey];
+        var request = angular.extend({}, params);
+        if (cached) {
+            request.etag = cached.result.etag;
+        }
+        gapi.client[api][method](request).execute(function (resp) {
+            if (!resp.error && resp.result && resp.result.notModified && cached) {
+                resp = cached;
+            } else if (!resp.error && resp.result && resp.result.etag) {
+                responses[cacheKey] = resp;
+            }
+            callback(resp);
+        });
+    };
+});
+
+
 /**
  * @ngdoc service
  * @name oauth2Provider
@@ -130,3 +163,46 @@ app.factory('oauth2Provider', function ($modal) {
 
     return oauth2Provider;
 });
+
+
+/**
+ * @ngdoc service
+ * @name dashboardProvider
+ *
+ * @description
+ * Service that holds the dashboard of the signed in user (profile, conferences to attend and created,
+ * sessions in the wishlist and announcement), retrieved with a single dashboard.getDashboard call.
+ *
+ */
+app.factory('dashboardProvider', function ($rootScope, $log) {
+    var dashboardProvider = {
+        dashboard: null,
+        loading: false
+    };
+
+    /**
+     * Invokes the dashboard.getDashboard API.
+     */
+    dashboardProvider.load = function () {
+        dashboardProvider.loading = true;
+        gapi.client.dashboard.getDashboard().execute(function (resp) {
+            $rootScope.$apply(function () {
+                dashboardProvider.loading = false;
+                if (resp.error) {
+                    $log.error('Failed to get the dashboard : ' + (resp.error.message || ''));
+                } else {
+                    dashboardProvider.dashboard = resp.result;
+                }
+            });
+        });
+    };
+
+    /**
+     * Forgets the dashboard (e.g. when the user logs out).
+     */
+    dashboardProvider.clear = function () {
+        dashboardProvider.dashboard = null;
+    };
+
+    return dashboardProvider;
+});
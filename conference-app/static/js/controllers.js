@@ -25,7 +25,7 @@ conferenceApp.controllers = angular.module('conferenceControllers', ['ui.bootstr
  * A controller used for the My Profile page.
  */
 conferenceApp.controllers.controller('MyProfileCtrl',
-    function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+    function ($scope, $log, oauth2Provider, conditionalGet, HTTP_ERRORS) {
         $scope.submitted = false;
         $scope.loading = false;
 
@@ -63,8 +63,8 @@ conferenceApp.controllers.controller('MyProfileCtrl',
             var retrieveProfileCallback = function () {
                 $scope.profile = {};
                 $scope.loading = true;
-                gapi.client.conference.getProfile().
-                    execute(function (resp) {
+                conditionalGet('conference', 'getProfile', {},
+                    function (resp) {
                         $scope.$apply(function () {
                             $scope.loading = false;
                             if (resp.error) {
@@ -306,6 +306,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     $scope.tabAllSelected = function () {
         $scope.selectedTab = 'ALL';
         $scope.queryConferences();
+        $scope.getFacets();
     };
 
     /**
@@ -397,6 +398,58 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         $scope.filters = [];
     };
 
+    /**
+     * Holds the number of conferences per city, topic and start month.
+     * @type {Array}
+     */
+    $scope.facets = [];
+
+    /**
+     * Filterable fields by facet field name.
+     */
+    var facetFields = {city: 'CITY', topics: 'TOPIC', month: 'MONTH'};
+
+    /**
+     * Invokes the conference.getConferenceFacets API, and keeps the facets of single fields.
+     */
+    $scope.getFacets = function () {
+        gapi.client.conference.getConferenceFacets().
+            execute(function (resp) {
+                $scope.$apply(function () {
+                    if (resp.error) {
+                        $log.error('Failed to get conference facets : ' + (resp.error.message || ''));
+                    } else {
+                        $scope.facets = [];
+                        angular.forEach(resp.items, function (facet) {
+                            if (facet.fields.length == 1) {
+                                $scope.facets.push({
+                                    field: facetFields[facet.fields[0]],
+                                    value: facet.values[0],
+                                    count: facet.count
+                                });
+                            }
+                        });
+                    }
+                });
+            });
+    };
+
+    /**
+     * Adds an equality filter for the value of a facet, and queries the conferences.
+     */
+    $scope.addFacetFilter = function (facet) {
+        for (var i = 0; i < $scope.filtereableFields.length; i++) {
+            if ($scope.filtereableFields[i].enumValue == facet.field) {
+                $scope.filters.push({
+                    field: $scope.filtereableFields[i],
+                    operator: $scope.operators[0],
+                    value: facet.value
+                });
+            }
+        }
+        $scope.queryConferences();
+    };
+
     /**
      * Removes the filter specified by the index from $scope.filters.
      *
@@ -547,7 +600,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
-conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, conditionalGet, HTTP_ERRORS) {
     $scope.conference = {};
 
     $scope.isUserAttending = false;
@@ -559,9 +612,9 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
      */
     $scope.init = function () {
         $scope.loading = true;
-        gapi.client.conference.getConference({
+        conditionalGet('conference', 'getConference', {
             websafeConferenceKey: $routeParams.websafeConferenceKey
-        }).execute(function (resp) {
+        }, function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
                 if (resp.error) {
@@ -581,7 +634,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
 
         $scope.loading = true;
         // If the user is attending the conference, updates the status message and available function.
-        gapi.client.conference.getProfile().execute(function (resp) {
+        conditionalGet('conference', 'getProfile', {}, function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
                 if (resp.error) {
@@ -624,12 +677,17 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
-                    if (resp.result) {
+                    if (resp.result.data) {
                         // Register succeeded.
                         $scope.messages = 'Registered for the conference';
                         $scope.alertStatus = 'success';
                         $scope.isUserAttending = true;
                         $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
+                    } else if (resp.result.waitlistPosition) {
+                        // Sold out: on the waitlist.
+                        $scope.messages = 'The conference is sold out. You are number '
+                            + resp.result.waitlistPosition + ' on the waitlist';
+                        $scope.alertStatus = 'info';
                     } else {
                         $scope.messages = 'Failed to register for the conference';
                         $scope.alertStatus = 'warning';
@@ -660,7 +718,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
-                    if (resp.result) {
+                    if (resp.result.data) {
                         // Unregister succeeded.
                         $scope.messages = 'Unregistered from the conference';
                         $scope.alertStatus = 'success';
@@ -668,9 +726,6 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         $scope.isUserAttending = false;
                         $log.info($scope.messages);
                     } else {
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to unregister from the conference : ' + $routeParams.websafeKey +
-                            ' : ' + errorMessage;
                         $scope.messages = 'Failed to unregister from the conference';
                         $scope.alertStatus = 'warning';
                         $log.error($scope.messages);
@@ -691,7 +746,21 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
  * such as user authentications.
  *
  */
-conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider) {
+conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider, dashboardProvider) {
+
+    /**
+     * The dashboard of the signed in user, shown in the home page.
+     */
+    $scope.dashboardProvider = dashboardProvider;
+
+    /**
+     * Reloads the dashboard when the home page is shown, so changes made in other pages are in it.
+     */
+    $scope.$on('$routeChangeSuccess', function () {
+        if (oauth2Provider.signedIn && $location.path() === '/') {
+            dashboardProvider.load();
+        }
+    });
 
     /**
      * Returns if the viewLocation is the currently viewed page.
@@ -723,6 +792,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
                         oauth2Provider.signedIn = true;
                         $scope.alertStatus = 'success';
                         $scope.rootMessages = 'Logged in with ' + resp.email;
+                        dashboardProvider.load();
                     }
                 });
             });
@@ -742,6 +812,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
                     $scope.$apply(function () {
                         oauth2Provider.signedIn = true;
                     });
+                    dashboardProvider.load();
                 }
             },
             'clientid': oauth2Provider.CLIENT_ID,
@@ -755,6 +826,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
      */
     $scope.signOut = function () {
         oauth2Provider.signOut();
+        dashboardProvider.clear();
         $scope.alertStatus = 'success';
         $scope.rootMessages = 'Logged out';
     };
@@ -778,7 +850,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
  *
  */
 conferenceApp.controllers.controller('OAuth2LoginModalCtrl',
-    function ($scope, $modalInstance, $rootScope, oauth2Provider) {
+    function ($scope, $modalInstance, $rootScope, oauth2Provider, dashboardProvider) {
         $scope.singInViaModal = function () {
             oauth2Provider.signIn(function () {
                 gapi.client.oauth2.userinfo.get().execute(function (resp) {
@@ -787,6 +859,7 @@ conferenceApp.controllers.controller('OAuth2LoginModalCtrl',
                         $scope.$root.alertStatus = 'success';
                         $scope.$root.rootMessages = 'Logged in with ' + resp.email;
                     });
+                    dashboardProvider.load();
 
                     $modalInstance.close();
                 });
@@ -0,0 +1,52 @@
+"""Tests of the conference app.
+
+Run from the conference-app directory, with the path to the App Engine SDK:
+
+    APPENGINE_SDK=PATH_TO_APPENGINE_SDK python -m unittest discover -s tests -t .
+
+Tests that use the datastore, memcache or the task queue run against the
+SDK's local service stubs (see AppEngineTestCase).
+"""
+
+import os
+import unittest
+
+import tools
+
+if os.environ.get('APPENGINE_SDK'):
+    tools.setup_sdk(os.environ['APPENGINE_SDK'])
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AppEngineTestCase(unittest.TestCase):
+    """Test case with local datastore, memcache and task queue stubs.
+
+    The datastore is strongly consistent, and the queues are the ones in
+    queue.yaml.
+    """
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability = 1))
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path = APP_DIR)
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def take_tasks(self, url, queue_name='default'):
+        """Remove the tasks for a URL from a queue, and return them."""
+        tasks = self.taskqueue.get_filtered_tasks(url = url, queue_names = [queue_name])
+        for task in tasks:
+            self.taskqueue.DeleteTask(queue_name, task.name)
+        return tasks
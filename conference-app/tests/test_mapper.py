@@ -0,0 +1,147 @@
+"""End to end tests of mapper jobs (services.mapper) against the local
+datastore stub: jobs are started, and their batch tasks run until none
+are left."""
+
+from google.appengine.api import datastore
+from google.appengine.ext import ndb
+
+from models.conference import Conference
+from models.conference import ConferenceSeats
+from models.mapper import MapperJob
+from models.profile import Profile
+from services import mapper
+from tests import AppEngineTestCase
+
+
+class MapperTest(AppEngineTestCase):
+
+    def setUp(self):
+        super(MapperTest, self).setUp()
+        self.organizer = ndb.Key(Profile, "organizer@example.com")
+
+    def run_mapper_tasks(self):
+        """Run the batch tasks of mapper jobs (and the ones they enqueue)
+        until there are none left.
+
+        Returns:
+            Number of tasks run
+        """
+        runs = 0
+        while True:
+            tasks = self.take_tasks(mapper.MAPPER_TASK_URL, mapper.MAPPER_QUEUE)
+            if not tasks:
+                return runs
+            for task in tasks:
+                params = task.extract_params()
+                mapper.run_batch(ndb.Key(urlsafe = params['jobKey']),
+                                 int(params['batch']))
+                runs += 1
+
+    def put_conference(self, name, seats=10):
+        return Conference(parent = self.organizer, name = name,
+                          maxAttendees = seats).put()
+
+    def put_legacy_conference(self, name, seats=10, available=None):
+        """Store a conference as written before `modified` and
+        ConferenceSeats existed."""
+        entity = datastore.Entity('Conference', parent = self.organizer.to_old_key())
+        entity.update({'name': name, 'maxAttendees': seats,
+                       'seatsAvailable': seats if available is None else available,
+                       'waitlistCount': 0})
+        return ndb.Key.from_old_key(datastore.Put(entity))
+
+    def test_reindex_conferences(self):
+        keys = [self.put_conference("Conference %d" % i) for i in range(4)]
+        legacy_key = self.put_legacy_conference("Legacy")
+        modified = {key: key.get().modified for key in keys}
+
+        job = mapper.start_mapper("reindex_conferences", batch_size = 2)
+        self.assertEqual(self.run_mapper_tasks(), 3)
+
+        job = job.key.get()
+        self.assertEqual(job.status, MapperJob.DONE)
+        self.assertEqual((job.processed, job.updated, job.batches), (5, 5, 3))
+        ndb.get_context().clear_cache()
+        # Modified times are kept, and set where missing
+        for key in keys:
+            self.assertEqual(key.get().modified, modified[key])
+        self.assertTrue(legacy_key.get().modified)
+        # Now in the modified index
+        self.assertEqual(Conference.query().order(Conference.modified).count(), 5)
+
+    def test_reindex_keeps_concurrent_changes(self):
+        key = self.put_conference("Conference")
+
+        # An update commits after the batch was read
+        original_map = mapper.ReindexConferencesMapper.map
+        def map_and_update(self, entity):
+            conf = entity.key.get(use_cache = False)
+            conf.version += 1
+            conf.put()
+            return original_map(self, entity)
+        mapper.ReindexConferencesMapper.map = map_and_update
+        self.addCleanup(setattr, mapper.ReindexConferencesMapper, 'map', original_map)
+
+        mapper.start_mapper("reindex_conferences")
+        self.run_mapper_tasks()
+
+        ndb.get_context().clear_cache()
+        self.assertEqual(key.get().version, 1)
+
+    def test_dry_run_writes_nothing(self):
+        legacy_key = self.put_legacy_conference("Legacy")
+
+        job = mapper.start_mapper("reindex_conferences", dry_run = True)
+        self.run_mapper_tasks()
+
+        self.assertEqual(job.key.get().status, MapperJob.DONE)
+        ndb.get_context().clear_cache()
+        self.assertIsNone(legacy_key.get().modified)
+
+    def test_abort(self):
+        for i in range(4):
+            self.put_conference("Conference %d" % i)
+
+        job = mapper.start_mapper("reindex_conferences", batch_size = 2)
+        tasks = self.take_tasks(mapper.MAPPER_TASK_URL, mapper.MAPPER_QUEUE)
+        params = tasks[0].extract_params()
+        mapper.run_batch(job.key, int(params['batch']))
+        mapper.abort_mapper(job.key)
+        self.run_mapper_tasks()
+
+        job = job.key.get()
+        self.assertEqual(job.status, MapperJob.ABORTED)
+        self.assertEqual(job.processed, 2)
+
+    def test_retried_batch_is_skipped(self):
+        self.put_conference("Conference")
+
+        job = mapper.start_mapper("reindex_conferences")
+        self.run_mapper_tasks()
+        mapper.run_batch(job.key, 0)
+
+        self.assertEqual(job.key.get().processed, 1)
+
+    def test_reconcile_capacity_creates_seats(self):
+        key = self.put_legacy_conference("Legacy", seats = 10, available = 6)
+        self.assertIsNone(ConferenceSeats.key_for(key).get())
+
+        mapper.start_mapper("reconcile_capacity")
+        self.run_mapper_tasks()
+
+        ndb.get_context().clear_cache()
+        seats = ConferenceSeats.query().order(-ConferenceSeats.fillRate).fetch()
+        self.assertEqual([s.conferenceKey for s in seats], [key])
+        self.assertEqual((seats[0].maxAttendees, seats[0].seatsAvailable), (10, 6))
+        self.assertEqual(seats[0].fillRate, 0.4)
+
+    def test_reconcile_capacity_keeps_existing_seats(self):
+        key = self.put_conference("Conference", seats = 10)
+        ConferenceSeats(key = ConferenceSeats.key_for(key), maxAttendees = 10,
+                        seatsAvailable = 3).put()
+
+        mapper.start_mapper("reconcile_capacity")
+        self.run_mapper_tasks()
+
+        ndb.get_context().clear_cache()
+        self.assertEqual(ConferenceSeats.key_for(key).get().seatsAvailable, 3)
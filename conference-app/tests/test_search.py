@@ -0,0 +1,129 @@
+"""Tests of full-text search (services.search), with the index kept in
+memory (MemoryIndexStore) and the documents in the local datastore stub."""
+
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.ext import ndb
+
+from models.conference import Conference
+from models.profile import Profile
+from services import search
+from services.search import MemoryIndexStore
+from services.search import SearchIndex
+from tests import AppEngineTestCase
+
+
+class TokenizeTest(AppEngineTestCase):
+
+    def test_lowercase_words_in_order_without_duplicates(self):
+        self.assertEqual(search.tokenize(u"Python, python and APP Engine!"),
+                         [u"python", u"app", u"engine"])
+
+    def test_skips_stop_words_and_single_characters(self):
+        self.assertEqual(search.tokenize(u"The state of a B-tree"),
+                         [u"state", u"tree"])
+
+    def test_empty(self):
+        self.assertEqual(search.tokenize(None), [])
+        self.assertEqual(search.tokenize(u"a an the"), [])
+
+
+class SearchTest(AppEngineTestCase):
+
+    def setUp(self):
+        super(SearchTest, self).setUp()
+        self.organizer = ndb.Key(Profile, "organizer@example.com")
+        self.index = SearchIndex(MemoryIndexStore())
+
+    def put_conference(self, name, description=None):
+        conf = Conference(parent = self.organizer, name = name,
+                          description = description)
+        conf.put()
+        self.index.index_document("Conference", conf.key.urlsafe(),
+                                  search.document_terms(conf), conf.modified)
+        return conf.key
+
+    def search(self, query, match_all=True, page_token=None, page_size=20):
+        return search.search(query, ["Conference"], match_all = match_all,
+            page_token = page_token, page_size = page_size, index = self.index)
+
+    def test_and_intersects_terms(self):
+        python = self.put_conference("Python Days", "Web and data")
+        self.put_conference("Python Cloud", "Serverless")
+        self.put_conference("Web Summit")
+
+        entities, _ = self.search("python web")
+        self.assertEqual([e.key for e in entities], [python])
+
+    def test_or_unites_terms(self):
+        keys = [self.put_conference("Python Days"),
+                self.put_conference("Web Summit")]
+        self.put_conference("Data Conference")
+
+        entities, _ = self.search("python web", match_all = False)
+        self.assertEqual(sorted(e.key for e in entities), sorted(keys))
+
+    def test_no_match(self):
+        self.put_conference("Python Days")
+
+        self.assertEqual(self.search("ruby"), ([], None))
+        self.assertEqual(self.search("the"), ([], None))
+
+    def test_paging(self):
+        keys = [self.put_conference("Python %d" % i) for i in range(5)]
+
+        found = []
+        token = None
+        pages = 0
+        while True:
+            entities, token = self.search("python", page_token = token, page_size = 2)
+            found.extend(e.key for e in entities)
+            pages += 1
+            if not token:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(found), sorted(keys))
+        self.assertEqual(found, sorted(found, key = lambda key: key.urlsafe()))
+
+    def test_stale_postings_are_not_returned(self):
+        key = self.put_conference("Python Days")
+        conf = key.get()
+        conf.name = "Ruby Days"
+        conf.put()
+
+        self.assertEqual(self.search("python"), ([], None))
+
+    def test_older_version_does_not_overwrite_newer(self):
+        doc = "doc"
+        now = datetime(2026, 1, 1)
+        self.assertTrue(self.index.index_document(
+            "Conference", doc, [u"ruby"], now))
+        # A task for the previous version runs last
+        self.assertFalse(self.index.index_document(
+            "Conference", doc, [u"python"], now - timedelta(seconds = 1)))
+
+        self.assertEqual(self.index.store.get_document_terms(doc), [u"ruby"])
+        self.assertEqual(self.index.search(["Conference"], [u"ruby"]), [doc])
+        self.assertEqual(self.index.search(["Conference"], [u"python"]), [])
+
+    def test_deleted_document_stays_deleted(self):
+        doc = "doc"
+        self.index.index_document("Conference", doc, [], search.DELETED_VERSION)
+        self.assertFalse(self.index.index_document(
+            "Conference", doc, [u"python"], datetime(2026, 1, 1)))
+        self.assertEqual(self.index.search(["Conference"], [u"python"]), [])
+
+    def test_datastore_index_keeps_latest_version(self):
+        index = SearchIndex()
+        doc = "doc"
+        now = datetime(2026, 1, 1)
+        index.index_document("Conference", doc, [u"ruby"], now)
+        index.index_document("Conference", doc, [u"python"], now - timedelta(seconds = 1))
+
+        self.assertEqual(index.store.get_document_terms(doc), [u"ruby"])
+        self.assertEqual(index.search(["Conference"], [u"ruby"]), [doc])
+        self.assertEqual(index.search(["Conference"], [u"python"]), [])
+
+        index.index_document("Conference", doc, [], search.DELETED_VERSION)
+        self.assertEqual(index.search(["Conference"], [u"ruby"]), [])
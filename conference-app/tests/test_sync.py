@@ -0,0 +1,87 @@
+"""Tests of delta sync (services.sync) against the local datastore stub."""
+
+import endpoints
+from google.appengine.api import datastore
+from google.appengine.ext import ndb
+
+from models.conference import Conference
+from models.profile import Profile
+from models.session import Session
+from models.speaker import Speaker
+from services import sync
+from services.sync import SyncService
+from tests import AppEngineTestCase
+
+
+class SyncTest(AppEngineTestCase):
+
+    def setUp(self):
+        super(SyncTest, self).setUp()
+        self.organizer = ndb.Key(Profile, "organizer@example.com")
+        self.service = SyncService()
+
+    def put_legacy_conference(self, name):
+        """Store a conference as written before `modified` existed."""
+        entity = datastore.Entity('Conference', parent = self.organizer.to_old_key())
+        entity.update({'name': name, 'maxAttendees': 10})
+        return ndb.Key.from_old_key(datastore.Put(entity))
+
+    def full_sync(self):
+        """Sync from an empty token until there is no more.
+
+        Returns:
+            Tuple (dict of kind -> URL-safe keys of the entities returned,
+            token of the last page, pages)
+        """
+        keys = {'conferences': [], 'sessions': [], 'speakers': []}
+        token = ""
+        pages = 0
+        while True:
+            changes = self.service.get_changes_since(token)
+            for kind in keys:
+                keys[kind].extend(form.websafeKey for form in getattr(changes, kind))
+            token = changes.token
+            pages += 1
+            if not changes.more:
+                return (keys, token, pages)
+
+    def test_full_sync_includes_entities_without_modified(self):
+        legacy_key = self.put_legacy_conference("Legacy")
+        conf_key = Conference(parent = self.organizer, name = "New").put()
+        session_key = Session(parent = conf_key, name = "Keynote").put()
+        speaker_key = Speaker(name = "Ada", email = "ada@example.com").put()
+
+        keys, token, pages = self.full_sync()
+
+        self.assertEqual(sorted(keys['conferences']),
+                         sorted([legacy_key.urlsafe(), conf_key.urlsafe()]))
+        self.assertEqual(keys['sessions'], [session_key.urlsafe()])
+        self.assertEqual(keys['speakers'], [speaker_key.urlsafe()])
+        self.assertEqual(pages, len(sync.FULL_SYNC_MODELS))
+        # The last token is a delta sync token
+        self.assertIsNone(sync.decode_full_sync_token(token))
+
+    def test_full_sync_pages_through_a_kind(self):
+        conf_keys = [Conference(parent = self.organizer, name = "Conference %d" % i).put()
+                     for i in range(sync.SYNC_MAX_CHANGES + 1)]
+
+        keys, _, pages = self.full_sync()
+
+        self.assertEqual(sorted(keys['conferences']),
+                         sorted(key.urlsafe() for key in conf_keys))
+        self.assertEqual(pages, len(sync.FULL_SYNC_MODELS) + 1)
+
+    def test_changes_made_during_full_sync_are_sent_again(self):
+        _, token, _ = self.full_sync()
+        conf_key = Conference(parent = self.organizer, name = "New").put()
+
+        changes = self.service.get_changes_since(token)
+
+        self.assertEqual([form.websafeKey for form in changes.conferences],
+                         [conf_key.urlsafe()])
+
+    def test_invalid_token(self):
+        for token in ("not a token", sync.encode_full_sync_token(
+                sync.EPOCH, len(sync.FULL_SYNC_MODELS), None)):
+            self.assertRaises(endpoints.BadRequestException,
+                              self.service.get_changes_since, token)
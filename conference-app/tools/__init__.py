@@ -0,0 +1,18 @@
+"""Development and maintenance tools for the conference app."""
+
+import os
+import sys
+
+
+def setup_sdk(sdk_path):
+    """Make the App Engine SDK libraries importable from a command line tool.
+
+    Args:
+        sdk_path (string): Path to the App Engine SDK
+            (the directory containing dev_appserver.py)
+    """
+    sdk_path = os.path.abspath(os.path.expanduser(sdk_path))
+    if sdk_path not in sys.path:
+        sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
@@ -0,0 +1,79 @@
+"""Measure import times of the app modules.
+
+Every module is imported in a fresh Python process, so the time includes
+everything the module imports, as on a cold instance. From the
+conference-app directory:
+
+    python -m tools.import_times --sdk PATH_TO_APPENGINE_SDK [-n RUNS] [MODULE ...]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules loaded by the handlers in app.yaml, roughly from lowest to highest
+# level. main is what task and cron instances load, server what API
+# instances load.
+MODULES = [
+    'webapp2',
+    'protorpc.remote',
+    'endpoints',
+    'models',
+    'models.conference',
+    'models.session',
+    'services',
+    'services.announcement',
+    'services.notifications',
+    'services.mapper',
+    'services.speaker',
+    'api.conference',
+    'api.dashboard',
+    'api.search',
+    'api.session',
+    'api.speaker',
+    'api.sync',
+    'api.wishlist',
+    'main',
+    'server',
+]
+
+# Script run in a fresh process; prints the import time in seconds
+_TIMER = """
+import sys
+import time
+sys.path.insert(0, %(app_dir)r)
+import tools
+tools.setup_sdk(%(sdk)r)
+start = time.time()
+import %(module)s
+sys.stdout.write('%%f' %% (time.time() - start))
+"""
+
+
+def import_time(module, sdk):
+    """Return the seconds it takes to import a module in a fresh process."""
+    script = _TIMER % {'app_dir': APP_DIR, 'sdk': sdk, 'module': module}
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=APP_DIR)
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sdk', required=True,
+        help='path to the App Engine SDK')
+    parser.add_argument('-n', '--runs', type=int, default=3,
+        help='runs per module (the fastest one is reported)')
+    parser.add_argument('modules', nargs='*', default=MODULES,
+        help='modules to measure (default: all app modules)')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        best = min(import_time(module, args.sdk) for _ in range(args.runs))
+        print('%-28s %8.1f ms' % (module, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""Index advisor.
+
+Records the shapes of the queries that the app actually runs, and computes
+a small set of composite indexes that serves all of them. Instead of one
+composite index per combination of equality filters, the datastore can
+serve a query by merging several indexes (zigzag merge join), as long as
+each index has one of the equality properties followed by the same sort
+order. Fewer composite indexes means fewer index writes on every put.
+
+The shapes recorded by a running app, and the corresponding report, are
+available at /admin/index_advisor. From the conference-app directory, a
+report for the query shapes known statically can be printed with:
+
+    python -m tools.index_advisor --sdk PATH_TO_APPENGINE_SDK
+"""
+
+import argparse
+import os
+from collections import namedtuple
+from itertools import combinations
+
+# Memcache key for the query shapes recorded by the app
+MEMCACHE_QUERY_SHAPES_KEY = "INDEX_ADVISOR_QUERY_SHAPES"
+
+# Assumed number of values of repeated properties (e.g. conference topics)
+# when estimating index writes
+REPEATED_VALUES = 2
+
+
+#------ Query shapes and indexes ----------------------------------------------
+
+# Everything about a query that determines the indexes it needs.
+# Attributes:
+#     kind: Entity kind
+#     ancestor: True if the query has an ancestor filter
+#     equality: Sorted tuple of properties with equality filters
+#     inequality: Property with inequality filters (or None)
+#     orders: Tuple of sort order properties
+#     projection: Sorted tuple of projected properties
+QueryShape = namedtuple('QueryShape',
+    ['kind', 'ancestor', 'equality', 'inequality', 'orders', 'projection'])
+
+# Composite index.
+# Attributes:
+#     kind: Entity kind
+#     ancestor: True if the index includes ancestors
+#     properties: Tuple of properties (all ascending)
+Index = namedtuple('Index', ['kind', 'ancestor', 'properties'])
+
+
+def query_shape(kind, equality=(), inequality=None, orders=(),
+                projection=(), ancestor=False):
+    """Return a normalized QueryShape."""
+    return QueryShape(
+        kind,
+        bool(ancestor),
+        tuple(sorted(set(equality))),
+        inequality,
+        tuple(orders),
+        tuple(sorted(set(projection))))
+
+
+def _suffix(shape):
+    """Properties that must follow the equality properties in an index."""
+    suffix = []
+    if shape.inequality:
+        suffix.append(shape.inequality)
+    for prop in shape.orders + shape.projection:
+        if prop not in suffix and prop not in shape.equality:
+            suffix.append(prop)
+    return tuple(suffix)
+
+
+def _needs_composite(shape, suffix):
+    """Check if a query can not be served by the built-in indexes."""
+    if not suffix:
+        # Only equality filters: merge join over single property indexes
+        return False
+    if len(suffix) == 1 and not shape.equality and not shape.ancestor:
+        # Filters and sort orders on a single property
+        return False
+    return True
+
+
+def exact_indexes(shape):
+    """Return the composite index the dev server would generate for a query.
+
+    Returns:
+        List with one Index, or empty if the built-in indexes are enough.
+    """
+    suffix = _suffix(shape)
+    if not _needs_composite(shape, suffix):
+        return []
+    return [Index(shape.kind, shape.ancestor, shape.equality + suffix)]
+
+
+def zigzag_indexes(shape):
+    """Return composite indexes that serve a query using merge joins.
+
+    Each equality property gets its own index, followed by the inequality
+    and sort order properties. The datastore merges these indexes, so
+    a query with any combination of equality filters only needs one index
+    per property, instead of one index per combination.
+
+    Returns:
+        List of Index (empty if the built-in indexes are enough).
+    """
+    suffix = _suffix(shape)
+    if not _needs_composite(shape, suffix):
+        return []
+    if not shape.equality:
+        return [Index(shape.kind, shape.ancestor, suffix)]
+    return [Index(shape.kind, shape.ancestor, (prop,) + suffix)
+            for prop in shape.equality]
+
+
+def minimal_index_set(shapes):
+    """Return the sorted list of composite indexes serving all query shapes."""
+    indexes = set()
+    for shape in shapes:
+        indexes.update(zigzag_indexes(shape))
+    return sorted(indexes)
+
+
+def exact_index_set(shapes):
+    """Return the sorted list of one composite index per query shape."""
+    indexes = set()
+    for shape in shapes:
+        indexes.update(exact_indexes(shape))
+    return sorted(indexes)
+
+
+#------ Recording -------------------------------------------------------------
+
+# Shapes already recorded by this instance (avoids hitting memcache
+# every time the same query is run)
+_recorded_shapes = set()
+
+
+def record_query_shape(kind, equality=(), inequality=None, orders=(),
+                       projection=(), ancestor=False):
+    """Record the shape of a query run by the app.
+
+    Cheap enough to call on every query: memcache is only updated the first
+    time an instance sees a given shape.
+    """
+    shape = query_shape(kind, equality, inequality, orders, projection, ancestor)
+    if shape in _recorded_shapes:
+        return
+    _recorded_shapes.add(shape)
+
+    from google.appengine.api import memcache
+    client = memcache.Client()
+    for _ in range(3):
+        shapes = client.gets(MEMCACHE_QUERY_SHAPES_KEY)
+        if shapes is None:
+            if client.add(MEMCACHE_QUERY_SHAPES_KEY, set([shape])):
+                return
+            continue
+        if shape in shapes:
+            return
+        shapes.add(shape)
+        if client.cas(MEMCACHE_QUERY_SHAPES_KEY, shapes):
+            return
+
+
+def get_recorded_shapes():
+    """Return the set of query shapes recorded by all instances."""
+    from google.appengine.api import memcache
+    return memcache.get(MEMCACHE_QUERY_SHAPES_KEY) or set()
+
+
+#------ Known query shapes ----------------------------------------------------
+
+# Conference properties that ConferenceApi._getQuery can filter on
+_CONFERENCE_FILTER_FIELDS = ('city', 'maxAttendees', 'month', 'topics')
+
+# Query shapes issued by the app, as found in the auto-generated index.yaml.
+# Used to print a report from the command line.
+KNOWN_SHAPES = [
+    # ConferenceApi._getQuery: equality filters, sorted by name
+    query_shape('Conference', equality=equality, orders=('name',))
+    for equality in [
+        ('city',), ('maxAttendees',), ('month',), ('topics',),
+        ('city', 'maxAttendees'), ('city', 'month'), ('city', 'topics'),
+        ('maxAttendees', 'month'), ('maxAttendees', 'topics'),
+        ('month', 'topics'),
+        ('city', 'maxAttendees', 'month'), ('city', 'month', 'topics'),
+        ('maxAttendees', 'month', 'topics'),
+        ('city', 'maxAttendees', 'month', 'topics'),
+    ]
+] + [
+    # ConferenceApi._getQuery: equality filters and an inequality filter,
+    # sorted by the inequality property then name
+    query_shape('Conference', equality=equality, inequality=inequality,
+                orders=(inequality, 'name'))
+    for inequality in _CONFERENCE_FILTER_FIELDS
+    for size in range(len(_CONFERENCE_FILTER_FIELDS))
+    for equality in combinations(
+        [f for f in _CONFERENCE_FILTER_FIELDS if f != inequality], size)
+] + [
+    # services.announcement.find_nearly_sold_out
+    query_shape('ConferenceSeats', inequality='seatsAvailable'),
+    # SessionService._generic_query
+    query_shape('Session', equality=('typeOfSession',), inequality='startTime'),
+    query_shape('Session', equality=('startTime',), inequality='typeOfSession'),
+    # services.schedule.query_schedule
+    query_shape('Session', equality=('speakerKey',), inequality='date', ancestor=True),
+    query_shape('Session', equality=('normalizedLocation',), inequality='date', ancestor=True),
+    # services.waitlist.promote_waitlist
+    query_shape('WaitlistEntry', equality=('conferenceKey',), orders=('joined',)),
+    # services.capacity.find_leaderboard
+    query_shape('ConferenceSeats', orders=('fillRate',)),
+    # services.swag.attendees_query
+    query_shape('Profile', equality=('conferenceKeysToAttend',)),
+    # services.mapper.RecountWishesMapper
+    query_shape('Wishlist', equality=('sessionKeys',)),
+    # services.counter.get_group_counts
+    query_shape('CounterShard', equality=('group',)),
+]
+
+
+#------ Reports ---------------------------------------------------------------
+
+def index_write_cost(model_class, indexes, repeated_values=REPEATED_VALUES):
+    """Estimate the index writes needed to put a new entity.
+
+    Every indexed property value is written to two built-in indexes
+    (ascending and descending), and every composite index gets one entry
+    per combination of values of its properties. Writing the entity
+    itself takes two more writes.
+
+    Args:
+        model_class: ndb.Model subclass
+        indexes: Composite indexes (only those for the model's kind count)
+        repeated_values: Assumed number of values of repeated properties
+
+    Returns:
+        Tuple (built-in index writes, composite index writes, total writes)
+    """
+    values = {}
+    for prop in model_class._properties.values():
+        if prop._indexed:
+            values[prop._name] = repeated_values if prop._repeated else 1
+
+    builtin = 2 * sum(values.values())
+    composite = 0
+    for index in indexes:
+        if index.kind != model_class._get_kind():
+            continue
+        entries = 1
+        for name in index.properties:
+            entries *= values.get(name, 0)
+        composite += entries
+
+    return (builtin, composite, 2 + builtin + composite)
+
+
+def load_index_yaml(path):
+    """Read the composite indexes defined in an index.yaml file."""
+    import yaml
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    indexes = []
+    for index in config.get('indexes') or []:
+        indexes.append(Index(
+            index['kind'],
+            index.get('ancestor') in (True, 'yes'),
+            tuple(p['name'] for p in index.get('properties', []))))
+    return sorted(indexes)
+
+
+def format_index_yaml(indexes):
+    """Format composite indexes as index.yaml entries."""
+    lines = []
+    for index in indexes:
+        lines.append('- kind: %s' % index.kind)
+        if index.ancestor:
+            lines.append('  ancestor: yes')
+        lines.append('  properties:')
+        for name in index.properties:
+            lines.append('  - name: %s' % name)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def report(shapes, model_classes, current_indexes=None):
+    """Return a text report comparing index sets for the given query shapes.
+
+    Args:
+        shapes: Iterable of QueryShape
+        model_classes: ndb.Model subclasses to estimate write costs for
+        current_indexes: Indexes currently defined (e.g. from index.yaml)
+
+    Returns:
+        Report (string)
+    """
+    shapes = sorted(set(shapes))
+    candidates = [('One index per query shape', exact_index_set(shapes)),
+                  ('Zigzag merge joins', minimal_index_set(shapes))]
+    if current_indexes is not None:
+        candidates.insert(0, ('Current index.yaml', current_indexes))
+
+    lines = ['Query shapes: %d' % len(shapes)]
+    for shape in shapes:
+        lines.append('  %s' % (shape,))
+    lines.append('')
+
+    for title, indexes in candidates:
+        lines.append('%s: %d composite indexes' % (title, len(indexes)))
+        for model_class in model_classes:
+            builtin, composite, total = index_write_cost(model_class, indexes)
+            lines.append('  %s put: ~%d writes (%d built-in, %d composite)' % (
+                model_class._get_kind(), total, builtin, composite))
+        lines.append('')
+
+    lines.append('Recommended index.yaml entries:')
+    lines.append('')
+    lines.append(format_index_yaml(minimal_index_set(shapes)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sdk', required=True,
+        help='path to the App Engine SDK')
+    parser.add_argument('--index-yaml',
+        default=os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'index.yaml'),
+        help='index.yaml to compare with')
+    args = parser.parse_args()
+
+    import tools
+    tools.setup_sdk(args.sdk)
+    from models.conference import Conference
+    from models.session import Session
+
+    print(report(KNOWN_SHAPES, [Conference, Session],
+                 load_index_yaml(args.index_yaml)))
+
+
+if __name__ == '__main__':
+    main()